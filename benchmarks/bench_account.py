@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+"""
+Throughput, API latency, CPU and memory of create and expire runs over a synthetic large account
+
+Each mode runs in a process of its own against a local EC2 stand-in, answering real botocore clients, so the
+figures of one mode do not leak into the next. Worker CPU and memory are of the worker processes. With the thread
+executor they are counted in the boss. Runs of the same seed describe the same inventory. E.G. 100k volumes and 1M
+snapshots:
+
+    bench_account.py --volumes 100000 --snapshots 1000000
+
+Usage:
+    bench_account.py [options] [--mode MODE]...
+
+Options:
+    --volumes=VOLUMES       Volumes in the account [default: 10000]
+    --snapshots=SNAPSHOTS   Snapshots in the account [default: 50000]
+    --days=DAYS             Snapshots are up to this many days old [default: 90]
+    --expire=DAYS           Expire mode deletes snapshots older than this many days [default: 60]
+    --workers=WORKERS       Number of process/workers [default: 50]
+    --executor=BACKEND      process | thread [default: process]
+    --batch=SIZE            Items per job [default: 10]
+    --latency=SECONDS       Stand-in latency per API call [default: 0.02]
+    --jitter=SECONDS        Stand-in latency added at most per API call [default: 0.02]
+    --throttle=RATE         Fraction of API calls throttled by the stand-in [default: 0.001]
+    --rate=CALLS            Initial client side rate limit per action. 0 is unlimited [default: 0]
+    --seed=SEED             Seed of the inventory, jitter and throttling [default: 1]
+    --mode=MODE             create | expire. Defaults to both
+"""
+import boto3
+import multiprocessing
+import os
+import resource
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from docopt import docopt
+from ebssnapshot import metrics, ratelimit, snapshot
+from stubs import Inventory, StandIn
+
+# API actions reported by mode. The first is the one each item is processed with.
+ACTIONS = {
+    'create': ('CreateSnapshot', 'DescribeVolumes'),
+    'expire': ('DeleteSnapshot', 'DescribeSnapshots'),
+}
+
+
+def run(mode, opts):
+    """
+    Run one mode in the calling process
+
+    :return: Run summary, metrics, wall clock seconds, parent and worker CPU seconds, parent and largest worker
+             peak RSS in MB
+    :rtype: dict
+    """
+    inventory = Inventory(volumes=int(opts['--volumes']), snapshots=int(opts['--snapshots']),
+                          days=int(opts['--days']), seed=int(opts['--seed']))
+    standin = StandIn(latency=float(opts['--latency']), jitter=float(opts['--jitter']),
+                      throttle=float(opts['--throttle']), inventory=inventory, seed=int(opts['--seed']))
+    sess = boto3.session.Session(aws_access_key_id='stub', aws_secret_access_key='stub', region_name='no-region-1')
+    standin.attach(sess)
+
+    registry = metrics.Metrics()
+    ebs = snapshot.EBSSnapshot(region='no-region-1', workers=int(opts['--workers']), executor=opts['--executor'],
+                               batch=int(opts['--batch']), metrics=registry)
+    ebs.session(sess)
+    rate = float(opts['--rate'])
+    if not rate:
+        ebs.ratelimiter(ratelimit.RateLimiter(region='no-region-1', rate=1e6, max_rate=1e6))
+    else:
+        ebs.ratelimiter(ratelimit.RateLimiter(region='no-region-1', rate=rate))
+
+    start_wall = time.time()
+    if mode == 'create':
+        summary = ebs.create_snapshot_boss()
+    else:
+        summary = ebs.expire_snapshot_boss(gt=-int(opts['--expire']))
+    wall = time.time() - start_wall
+
+    times = os.times()
+    return {
+        'summary': summary,
+        'metrics': registry,
+        'wall': wall,
+        'parent_cpu': times[0] + times[1],
+        'worker_cpu': times[2] + times[3],
+        'parent_rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0,
+        'worker_rss': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024.0,
+    }
+
+
+def isolated(mode, opts):
+    """
+    Run one mode in a process of its own so CPU and peak RSS are measured per mode
+    """
+    results = multiprocessing.Queue()
+    proc = multiprocessing.Process(target=lambda: results.put(run(mode, opts)))
+    proc.start()
+    result = results.get()
+    proc.join()
+    return result
+
+
+def report(mode, result):
+    summary = result['summary']
+    registry = result['metrics']
+    items = summary.get('success', 0) + summary.get('skipped', 0)
+    print('{:<8} {:>9} {:>7} {:>9.2f} {:>9.1f} {:>11.2f} {:>11.2f} {:>10.1f} {:>10.1f}'.format(
+        mode, items, summary.get('error', 0), result['wall'], items / result['wall'] if result['wall'] else 0,
+        result['parent_cpu'], result['worker_cpu'], result['parent_rss'], result['worker_rss']))
+
+    for action in ACTIONS[mode]:
+        p50 = registry.quantile('api_latency_seconds', 0.5, action=action)
+        p99 = registry.quantile('api_latency_seconds', 0.99, action=action)
+        print('    {:<20} {:>9} calls {:>6} throttled  p50 {:>8} ms  p99 {:>8} ms'.format(
+            action, int(registry.value('api_calls_total', action=action)),
+            int(registry.value('api_throttles_total', action=action)),
+            '-' if p50 is None else '{:.1f}'.format(p50 * 1000), '-' if p99 is None else '{:.1f}'.format(p99 * 1000)))
+
+
+if __name__ == '__main__':
+    opts = docopt(__doc__)
+    modes = opts['--mode'] or sorted(ACTIONS)
+
+    print('{:<8} {:>9} {:>7} {:>9} {:>9} {:>11} {:>11} {:>10} {:>10}'.format(
+        'mode', 'items', 'errors', 'wall (s)', 'items/s', 'boss cpu(s)', 'wrkr cpu(s)', 'boss MB', 'wrkr MB'))
+    for mode in modes:
+        report(mode, isolated(mode, opts))
@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+"""
+Parent (boss) CPU time while dispatching create_snapshot jobs to workers
+
+Usage:
+    bench_boss.py [--jobs JOBS] [--workers WORKERS] [--latency SECONDS] [--batch SIZE]
+
+Options:
+    --jobs=JOBS             Number of volumes to snapshot [default: 10000]
+    --workers=WORKERS       Number of process/workers [default: 4]
+    --latency=SECONDS       Stubbed CreateSnapshot latency [default: 0.002]
+    --batch=SIZE            Volumes per job [default: 1]
+"""
+import collections
+import os
+import signal
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from docopt import docopt
+from ebssnapshot import executor, snapshot
+from multiprocessing import JoinableQueue
+from Queue import Empty
+from stubs import StubEC2, StubSession
+
+
+def collect(resultqueue, procs):
+    """
+    Gather the results returned by each worker, as the boss did before workers were supervised
+    """
+    results = collections.Counter()
+    pending = len(procs)
+    while pending:
+        try:
+            _, worker_results, _ = resultqueue.get(block=True, timeout=snapshot.LIVENESS_INTERVAL)
+            results.update(worker_results or {})
+            pending -= 1
+        except Empty:
+            if not any(p.is_alive() for p in procs):
+                break
+
+    return results
+
+
+def legacy_boss(ebs, worker, iterable, tracker=None, shaper=None):
+    """
+    The busy-spin producer loop the dispatcher replaced
+    """
+    backend = executor.ProcessExecutor()
+    ebs.ratelimiter()
+    backend.prepare(ebs)
+    ebs.context()
+    jobqueue = JoinableQueue(ebs.workers)
+    resultqueue = backend.result_queue()
+    procs = []
+    for i in range(1, ebs.workers + 1):
+        procs.append(backend.start(worker, i, jobqueue, resultqueue, ebs))
+
+    signal.signal(signal.SIGINT, snapshot.terminate)
+    signal.signal(signal.SIGTERM, snapshot.terminate)
+
+    for job in iterable:
+        while True:
+            running = any(p.is_alive() for p in procs)
+            if not running:
+                sys.exit(-1)
+
+            if jobqueue.empty():
+                jobqueue.put(job, block=True, timeout=60)
+                break
+
+    jobqueue.join()
+    for _ in procs:
+        jobqueue.put(None)
+
+    summary = collect(resultqueue, procs)
+    summary['dispatched'] = 0
+    return dict(summary)
+
+
+def run(bossfunc, jobs, workers, latency, batch):
+    """
+    :return: Parent CPU seconds and wall clock seconds
+    :rtype: tuple
+    """
+    ebs = snapshot.EBSSnapshot(region='no-region-1', workers=workers, batch=batch)
+    ebs.session(StubSession(StubEC2(volumes=jobs, latency=latency)))
+
+    original = snapshot.boss
+    snapshot.boss = bossfunc
+    try:
+        start_cpu = sum(os.times()[:2])
+        start_wall = time.time()
+        ebs.create_snapshot_boss()
+        return sum(os.times()[:2]) - start_cpu, time.time() - start_wall
+    finally:
+        snapshot.boss = original
+
+
+if __name__ == '__main__':
+    opts = docopt(__doc__)
+    jobs = int(opts['--jobs'])
+    workers = int(opts['--workers'])
+    latency = float(opts['--latency'])
+    batch = int(opts['--batch'])
+
+    print('{:<12} {:>16} {:>10}'.format('boss', 'cpu/10k jobs (s)', 'wall (s)'))
+    for name, bossfunc in [('legacy', legacy_boss), ('dispatcher', snapshot.boss)]:
+        cpu, wall = run(bossfunc, jobs, workers, latency, batch)
+        print('{:<12} {:>16.3f} {:>10.2f}'.format(name, cpu * 10000 / jobs, wall))
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+"""
+Worker start up cost: time for a forked worker to build its EC2 client and page volumes
+
+Usage:
+    bench_clients.py [--workers WORKERS]
+
+Options:
+    --workers=WORKERS       Number of workers started [default: 8]
+"""
+import boto3
+import multiprocessing
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from docopt import docopt
+from ebssnapshot import clients
+from stubs import StandIn
+
+
+def legacy_worker(sess, results):
+    """
+    Per worker client and caller identity the client pool replaced
+    """
+    start = time.time()
+    sess.client('sts').get_caller_identity()
+    ec2 = sess.client('ec2', region_name='no-region-1')
+    list(ec2.get_paginator('describe_volumes').paginate())
+    results.put(time.time() - start)
+
+
+def pool_worker(pool, results):
+    start = time.time()
+    pool.identity()
+    ec2 = pool.client('ec2', 'no-region-1')
+    list(ec2.get_paginator('describe_volumes').paginate())
+    results.put(time.time() - start)
+
+
+def run(worker, arg, workers):
+    """
+    :return: Mean milliseconds per worker
+    :rtype: float
+    """
+    results = multiprocessing.Queue()
+    procs = [multiprocessing.Process(target=worker, args=[arg, results]) for _ in range(workers)]
+    for proc in procs:
+        proc.start()
+    durations = [results.get() for _ in procs]
+    for proc in procs:
+        proc.join()
+    return sum(durations) * 1000 / len(durations)
+
+
+def session():
+    sess = boto3.session.Session(aws_access_key_id='stub', aws_secret_access_key='stub', region_name='no-region-1')
+    StandIn(volumes=10).attach(sess)
+    return sess
+
+
+if __name__ == '__main__':
+    opts = docopt(__doc__)
+    workers = int(opts['--workers'])
+
+    legacy = run(legacy_worker, session(), workers)
+    pool = clients.ClientPool(session()).warm('no-region-1')
+    pool.identity()
+    warm = run(pool_worker, pool, workers)
+
+    print('{:<12} {:>8} {:>14}'.format('clients', 'workers', 'ms/worker'))
+    print('{:<12} {:>8} {:>14.1f}'.format('legacy', workers, legacy))
+    print('{:<12} {:>8} {:>14.1f}'.format('pool', workers, warm))
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+"""
+Memory and wall clock time of the worker backends against a local EC2 stand-in
+
+Usage:
+    bench_executor.py [--jobs JOBS] [--workers WORKERS] [--latency SECONDS] [--executor BACKEND]...
+
+Options:
+    --jobs=JOBS             Number of volumes to snapshot [default: 2000]
+    --workers=WORKERS       Number of process/workers [default: 50]
+    --latency=SECONDS       Stand-in latency per API call [default: 0.05]
+    --executor=BACKEND      Backend(s) to run. Defaults to all
+"""
+import boto3
+import multiprocessing
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from docopt import docopt
+from ebssnapshot import executor, ratelimit, snapshot
+from stubs import StandIn
+
+
+def memory(pid):
+    """
+    Proportional set size (falls back to resident set size) in kB. Linux only.
+    """
+    for path, field in [('/proc/{}/smaps_rollup', 'Pss:'), ('/proc/{}/status', 'VmRSS:')]:
+        try:
+            with open(path.format(pid)) as stream:
+                for line in stream:
+                    if line.startswith(field):
+                        return int(line.split()[1])
+        except IOError:
+            continue
+    return 0
+
+
+class Sampler(threading.Thread):
+    """
+    Peak memory of the boss and its worker processes
+    """
+    def __init__(self, interval=0.1):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.interval = interval
+        self.peak = 0
+        self.running = True
+
+    def run(self):
+        while self.running:
+            pids = [os.getpid()] + [p.pid for p in multiprocessing.active_children()]
+            self.peak = max(self.peak, sum(memory(pid) for pid in pids))
+            time.sleep(self.interval)
+
+
+def run(backend, jobs, workers, latency):
+    """
+    :return: Peak memory in MB and wall clock seconds
+    :rtype: tuple
+    """
+    sess = boto3.session.Session(aws_access_key_id='stub', aws_secret_access_key='stub', region_name='no-region-1')
+    StandIn(volumes=jobs, latency=latency).attach(sess)
+
+    ebs = snapshot.EBSSnapshot(region='no-region-1', workers=workers, executor=backend)
+    ebs.session(sess)
+    # Measure the backends, not the rate limiter
+    ebs.ratelimiter(ratelimit.RateLimiter(region='no-region-1', rate=1e6, max_rate=1e6))
+
+    sampler = Sampler()
+    sampler.start()
+    start = time.time()
+    ebs.create_snapshot_boss()
+    wall = time.time() - start
+    sampler.running = False
+    sampler.join()
+    return sampler.peak / 1024.0, wall
+
+
+if __name__ == '__main__':
+    opts = docopt(__doc__)
+    jobs = int(opts['--jobs'])
+    workers = int(opts['--workers'])
+    latency = float(opts['--latency'])
+    backends = opts['--executor'] or sorted(executor.EXECUTORS)
+
+    print('{:<10} {:>8} {:>14} {:>10} {:>10}'.format('executor', 'workers', 'peak mem (MB)', 'wall (s)', 'jobs/s'))
+    for backend in backends:
+        mem, wall = run(backend, jobs, workers, latency)
+        print('{:<10} {:>8} {:>14.1f} {:>10.2f} {:>10.1f}'.format(backend, workers, mem, wall, jobs / wall))
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+"""
+Cost of logging EBSSnapshot records, per 100k records
+
+Usage:
+    bench_logging.py [--events EVENTS]
+
+Options:
+    --events=EVENTS         Number of records logged [default: 100000]
+"""
+import collections
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from docopt import docopt
+from ebssnapshot import logs, snapshot
+
+
+class LegacyFilter(logging.Filter):
+    """
+    Eager rendering the lazy message replaced
+    """
+    def filter(self, record):
+        if isinstance(record.msg, dict):
+            msg = json.dumps(record.msg)
+            record.msg = "uuid={uuid} action={action} result={result} json='{msg}'".format(msg=msg, **record.msg)
+        return True
+
+
+class NullHandler(logging.Handler):
+    def emit(self, record):
+        self.format(record)
+
+
+def record(i):
+    log = collections.OrderedDict()
+    log['action'] = 'create_snapshot'
+    log['uuid'] = 'bench'
+    log['VolumeId'] = 'vol-{:017x}'.format(i)
+    log['SnapshotId'] = 'snap-{:017x}'.format(i)
+    log['result'] = 'success'
+    return log
+
+
+def configure(name, log_filter, *handlers):
+    logger = logging.getLogger(name)
+    logger.filters = [log_filter]
+    logger.handlers = list(handlers)
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    return logger
+
+
+def emit(logger, events):
+    for i in xrange(events):
+        logger.info(record(i))
+
+
+def timed(func, events):
+    """
+    :return: Seconds per 100k records
+    :rtype: float
+    """
+    start = time.time()
+    func()
+    return (time.time() - start) * 100000 / events
+
+
+def child(logger, events, close=None):
+    proc = multiprocessing.Process(target=emit, args=[logger, events])
+    proc.start()
+    proc.join()
+    if close:
+        close()
+
+
+if __name__ == '__main__':
+    opts = docopt(__doc__)
+    events = int(opts['--events'])
+    directory = tempfile.mkdtemp(prefix='bench_logging')
+    results = []
+
+    try:
+        for level, label in ((logging.WARN, 'dropped'), (logging.INFO, 'formatted')):
+            handler = NullHandler(level)
+            legacy = configure('bench.legacy.' + label, LegacyFilter(), handler)
+            results.append(('legacy ' + label, timed(lambda: emit(legacy, events), events)))
+            lazy = configure('bench.lazy.' + label, snapshot.FILTER, handler)
+            results.append(('lazy ' + label, timed(lambda: emit(lazy, events), events)))
+
+        ndjson = logs.NDJSONHandler(directory)
+        logger = configure('bench.ndjson', snapshot.FILTER, ndjson)
+        results.append(('ndjson', timed(lambda: (emit(logger, events), ndjson.flush()), events)))
+        ndjson.close()
+
+        try:
+            import multiprocessing_logging
+        except ImportError:
+            multiprocessing_logging = None
+        if multiprocessing_logging:
+            shipped = multiprocessing_logging.MultiProcessingHandler('bench', NullHandler())
+            logger = configure('bench.multiprocessing_logging', snapshot.FILTER, shipped)
+            results.append(('mp_logging', timed(lambda: child(logger, events, shipped.close), events)))
+
+        batch = logs.BatchHandler([NullHandler()])
+        logger = configure('bench.batch', snapshot.FILTER, batch)
+        results.append(('batch', timed(lambda: child(logger, events, batch.close), events)))
+    finally:
+        shutil.rmtree(directory)
+
+    print('{:<20} {:>14}'.format('logging', 's/100k'))
+    for label, seconds in results:
+        print('{:<20} {:>14.3f}'.format(label, seconds))
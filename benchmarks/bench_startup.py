@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+"""
+Wall clock start-up time of the package and the CLI, each in a fresh interpreter
+
+Usage:
+    bench_startup.py [--runs RUNS]
+
+Options:
+    --runs=RUNS             Runs per command. The median is reported [default: 10]
+"""
+import os
+import subprocess
+import sys
+import time
+
+from docopt import docopt
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+COMMANDS = [
+    ('python', [sys.executable, '-c', 'pass']),
+    ('import boto3', [sys.executable, '-c', 'import boto3']),
+    ('import ebssnapshot', [sys.executable, '-c', 'import ebssnapshot']),
+    ('ebssnap --version', [sys.executable, os.path.join(ROOT, 'scripts', 'ebssnap'), '--version']),
+    ('ebssnap --help', [sys.executable, os.path.join(ROOT, 'scripts', 'ebssnap'), '--help']),
+]
+
+
+def run(command, runs):
+    """
+    :return: Median wall clock seconds
+    :rtype: float
+    """
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    timings = []
+    with open(os.devnull, 'w') as devnull:
+        for _ in range(runs):
+            start = time.time()
+            subprocess.check_call(command, cwd=ROOT, env=env, stdout=devnull)
+            timings.append(time.time() - start)
+    return sorted(timings)[len(timings) // 2]
+
+
+if __name__ == '__main__':
+    opts = docopt(__doc__)
+    runs = int(opts['--runs'])
+
+    print('{:<20} {:>12}'.format('command', 'median (ms)'))
+    for name, command in COMMANDS:
+        print('{:<20} {:>12.1f}'.format(name, run(command, runs) * 1000))
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+"""
+Per volume preparation cost of snapshot TagSpecifications
+
+Usage:
+    bench_tags.py [--volumes VOLUMES]
+
+Options:
+    --volumes=VOLUMES       Number of volumes to prepare [default: 2000]
+"""
+import getpass
+import os
+import socket
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from docopt import docopt
+from ebssnapshot import metadata, snapshot
+from stubs import volume
+
+
+def legacy_tag_specifications(description, identifier, volume):
+    """
+    Per volume tag construction the run context replaced
+    """
+    tag_specifications = [
+        {
+            'ResourceType': 'snapshot',
+            'Tags': [
+                {'Key': 'backup-desc', 'Value': description},
+                {'Key': 'backup-uuid', 'Value': identifier},
+                {'Key': 'backup-version', 'Value': metadata.__version__},
+                {'Key': 'backup-delete-protection', 'Value': 'false'},
+                {'Key': 'backup-host', 'Value': socket.getfqdn()},
+                {'Key': 'backup-user', 'Value': getpass.getuser()},
+                {'Key': 'backup-uid', 'Value': str(os.getuid())},
+                {'Key': 'backup-euid', 'Value': str(os.geteuid())},
+            ]
+        }
+    ]
+    for tag in volume.get('Tags', []):
+        tag_specifications[0]['Tags'].append(tag)
+    return tag_specifications
+
+
+def timed(func, volumes):
+    """
+    :return: Microseconds per volume
+    :rtype: float
+    """
+    start = time.time()
+    for vol in volumes:
+        func(vol)
+    return (time.time() - start) * 1e6 / len(volumes)
+
+
+if __name__ == '__main__':
+    opts = docopt(__doc__)
+    volumes = [volume(i) for i in range(int(opts['--volumes']))]
+
+    legacy = timed(lambda vol: legacy_tag_specifications('bench', 'uuid', vol), volumes)
+    context = snapshot.RunContext('bench', 'uuid')
+    cached = timed(context.tag_specifications, volumes)
+
+    print('{:<12} {:>14}'.format('tags', 'us/volume'))
+    print('{:<12} {:>14.1f}'.format('legacy', legacy))
+    print('{:<12} {:>14.1f}'.format('context', cached))
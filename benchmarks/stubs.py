@@ -0,0 +1,292 @@
+"""
+Stubbed AWS clients for benchmarking without network access
+"""
+import itertools
+import os
+import random
+import time
+import urlparse
+
+from botocore.awsrequest import AWSResponse
+from datetime import datetime, timedelta
+from dateutil.tz import tzutc
+from xml.sax.saxutils import escape
+
+
+class StubPaginator:
+    def __init__(self, group, factory, count):
+        """
+        :param group: Volumes | Snapshots
+        :type group: basestring
+        :param factory: Callable returning a resource dictionary for an index
+        :param count: Number of resources to page through
+        :type count: int
+        """
+        self.group = group
+        self.factory = factory
+        self.count = count
+
+    def paginate(self, **kwargs):
+        pagesize = kwargs.get('PaginationConfig', {}).get('PageSize', 1000)
+        for start in range(0, self.count, pagesize):
+            end = min(start + pagesize, self.count)
+            yield {self.group: [self.factory(i) for i in range(start, end)]}
+
+
+class StubEC2:
+    def __init__(self, volumes=0, snapshots=0, latency=0.0):
+        """
+        :param volumes: Number of volumes returned by describe_volumes
+        :type volumes: int
+        :param snapshots: Number of snapshots returned by describe_snapshots
+        :type snapshots: int
+        :param latency: Seconds each mutating call sleeps for
+        :type latency: float
+        """
+        self.volumes = volumes
+        self.snapshots = snapshots
+        self.latency = latency
+        self._ids = itertools.count()
+
+    def get_paginator(self, name):
+        if name == 'describe_volumes':
+            return StubPaginator('Volumes', volume, self.volumes)
+        elif name == 'describe_snapshots':
+            return StubPaginator('Snapshots', snapshot, self.snapshots)
+        raise NotImplementedError(name)
+
+    def create_snapshot(self, **kwargs):
+        time.sleep(self.latency)
+        return {'SnapshotId': 'snap-{:017x}'.format(next(self._ids)), 'StartTime': datetime.now(tz=tzutc())}
+
+    def delete_snapshot(self, **kwargs):
+        time.sleep(self.latency)
+        return {}
+
+    def get_caller_identity(self):
+        return {'Account': '123456789012', 'UserId': 'AIDASTUB', 'Arn': 'arn:aws:iam::123456789012:user/stub'}
+
+
+class StubSession:
+    def __init__(self, ec2):
+        """
+        :param ec2: Client returned for every service
+        :type ec2: StubEC2
+        """
+        self.ec2 = ec2
+
+    def client(self, service_name, **kwargs):
+        return self.ec2
+
+
+class StandIn:
+    """
+    Local EC2 and STS stand-in. Answers requests made by real botocore clients from the before-send event so the
+    full client stack (models, serialisation, parsing) is exercised without network access.
+
+    standin = StandIn(volumes=1000)
+    standin.attach(sess)
+
+    Each call sleeps for `latency` plus up to `jitter` seconds and is throttled with RequestLimitExceeded with a
+    probability of `throttle`. Throttled calls are retried by botocore as they are against EC2.
+    """
+    def __init__(self, volumes=0, snapshots=0, latency=0.0, jitter=0.0, throttle=0.0, inventory=None, seed=0):
+        """
+        :param volumes: Number of volumes returned by DescribeVolumes
+        :type volumes: int
+        :param snapshots: Number of snapshots returned by DescribeSnapshots
+        :type snapshots: int
+        :param latency: Seconds each call sleeps for
+        :type latency: float
+        :param jitter: Seconds each call sleeps for at most on top of the latency, uniformly distributed
+        :type jitter: float
+        :param throttle: Fraction of calls throttled
+        :type throttle: float
+        :param inventory: Synthetic inventory the volumes and snapshots are described from. Overrides volumes and
+                          snapshots.
+        :type inventory: Inventory
+        :param seed: Seed of the jitter and throttling. Each process draws from its own generator.
+        :type seed: int
+        """
+        self.volumes = inventory.volumes if inventory else volumes
+        self.snapshots = inventory.snapshots if inventory else snapshots
+        self.latency = latency
+        self.jitter = jitter
+        self.throttle = throttle
+        self.seed = seed
+        self._volume = inventory.volume if inventory else volume
+        self._snapshot = inventory.snapshot if inventory else snapshot
+        self._ids = itertools.count()
+        self._random = {}
+
+    def attach(self, sess):
+        """
+        :param sess: Session. Clients created from it afterwards are answered by the stand-in
+        :type sess: boto3.session.Session
+        """
+        sess.events.register('before-send', self.send)
+
+    def send(self, request, event_name, **kwargs):
+        params = dict((k, v[0]) for k, v in urlparse.parse_qs(request.body or '').items())
+        action = event_name.split('.')[-1]
+        rand = self._rand()
+        time.sleep(self.latency + (rand.uniform(0, self.jitter) if self.jitter else 0))
+        if self.throttle and rand.random() < self.throttle:
+            body = ('<Response><Errors><Error><Code>RequestLimitExceeded</Code><Message>Request limit exceeded.'
+                    '</Message></Error></Errors></Response>')
+            return AWSResponse(request.url, 503, {}, _Raw(body))
+        body = getattr(self, '_' + action)(params)
+        return AWSResponse(request.url, 200, {}, _Raw(body))
+
+    def _rand(self):
+        pid = os.getpid()
+        if pid not in self._random:
+            self._random[pid] = random.Random(self.seed * 65537 + pid)
+        return self._random[pid]
+
+    def _GetCallerIdentity(self, params):
+        return ('<GetCallerIdentityResponse><GetCallerIdentityResult>'
+                '<Arn>arn:aws:iam::123456789012:user/stub</Arn><UserId>AIDASTUB</UserId><Account>123456789012</Account>'
+                '</GetCallerIdentityResult></GetCallerIdentityResponse>')
+
+    def _CreateSnapshot(self, params):
+        return ('<CreateSnapshotResponse><snapshotId>snap-{id:017x}</snapshotId><volumeId>{VolumeId}</volumeId>'
+                '<status>pending</status><startTime>{now}</startTime></CreateSnapshotResponse>').format(
+            id=next(self._ids), now=_now(), **params)
+
+    def _DeleteSnapshot(self, params):
+        return '<DeleteSnapshotResponse><return>true</return></DeleteSnapshotResponse>'
+
+    def _DescribeImages(self, params):
+        return '<DescribeImagesResponse><imagesSet></imagesSet></DescribeImagesResponse>'
+
+    def _DescribeVolumes(self, params):
+        return self._describe(params, 'DescribeVolumes', 'volumeSet', self._volume, self.volumes)
+
+    def _DescribeSnapshots(self, params):
+        return self._describe(params, 'DescribeSnapshots', 'snapshotSet', self._snapshot, self.snapshots)
+
+    def _describe(self, params, action, group, factory, count):
+        start = int(params.get('NextToken', 0))
+        end = min(start + int(params.get('MaxResults', 1000)), count)
+        items = ''.join(_xml(factory(i)) for i in range(start, end))
+        token = '<nextToken>{}</nextToken>'.format(end) if end < count else ''
+        return '<{action}Response><{group}>{items}</{group}>{token}</{action}Response>'.format(**locals())
+
+
+class Inventory:
+    """
+    Deterministic synthetic inventory of a large account. The same seed always describes the same volumes and
+    snapshots, without holding them in memory.
+
+    inventory = Inventory(volumes=100000, snapshots=1000000)
+    StandIn(inventory=inventory)
+    """
+    ZONES = ('no-region-1a', 'no-region-1b', 'no-region-1c')
+    SIZES = (8, 8, 8, 20, 50, 100, 500, 1000)
+
+    def __init__(self, volumes=0, snapshots=0, days=90, protected=0.05, seed=0):
+        """
+        :param volumes: Number of volumes
+        :type volumes: int
+        :param snapshots: Number of snapshots, spread evenly over the volumes
+        :type snapshots: int
+        :param days: Snapshots are started up to this many days ago, uniformly distributed
+        :type days: int
+        :param protected: Fraction of snapshots tagged with delete protection
+        :type protected: float
+        :param seed: Seed of the inventory
+        :type seed: int
+        """
+        self.volumes = volumes
+        self.snapshots = snapshots
+        self.days = days
+        self.protected = protected
+        self.seed = seed
+        self.now = datetime.now(tz=tzutc()).replace(microsecond=0)
+
+    def volume(self, index):
+        rand = self._rand('volume', index)
+        tags = [{'Key': 'Name', 'Value': 'host-{}'.format(index)}]
+        if rand.random() < 0.1:
+            tags.append({'Key': 'backup-priority', 'Value': str(rand.randint(1, 10))})
+        return {
+            'VolumeId': 'vol-{:017x}'.format(index),
+            'AvailabilityZone': rand.choice(self.ZONES),
+            'Size': rand.choice(self.SIZES),
+            'State': 'in-use',
+            'Tags': tags,
+        }
+
+    def snapshot(self, index):
+        rand = self._rand('snapshot', index)
+        protected = 'true' if rand.random() < self.protected else 'false'
+        return {
+            'SnapshotId': 'snap-{:017x}'.format(index),
+            'VolumeId': 'vol-{:017x}'.format(index % self.volumes if self.volumes else index),
+            'StartTime': self.now - timedelta(seconds=rand.randint(0, self.days * 86400)),
+            'State': 'completed',
+            'Tags': [{'Key': 'backup-delete-protection', 'Value': protected}],
+        }
+
+    def _rand(self, kind, index):
+        return random.Random('{}-{}-{}'.format(self.seed, kind, index))
+
+
+class _Raw:
+    def __init__(self, body):
+        self.body = body
+
+    def stream(self, **kwargs):
+        yield self.body
+
+
+#
+# Resources
+#
+def volume(index):
+    return {
+        'VolumeId': 'vol-{:017x}'.format(index),
+        'AvailabilityZone': 'no-region-1a',
+        'Size': 8,
+        'State': 'in-use',
+        'Tags': [{'Key': 'Name', 'Value': 'host-{}'.format(index)}],
+    }
+
+
+def snapshot(index):
+    return {
+        'SnapshotId': 'snap-{:017x}'.format(index),
+        'VolumeId': 'vol-{:017x}'.format(index),
+        'StartTime': datetime(2018, 1, 1, tzinfo=tzutc()),
+        'State': 'completed',
+        'Tags': [{'Key': 'backup-delete-protection', 'Value': 'false'}],
+    }
+
+
+#
+# Utilities
+#
+def _now():
+    return datetime.now(tz=tzutc()).strftime('%Y-%m-%dT%H:%M:%S.000Z')
+
+
+def _xml(resource):
+    """
+    Render a resource dictionary as an EC2 query protocol item
+    """
+    fields = {
+        'VolumeId': 'volumeId', 'SnapshotId': 'snapshotId', 'AvailabilityZone': 'availabilityZone', 'Size': 'size',
+        'State': 'status',
+    }
+    parts = []
+    for key, value in resource.items():
+        if key == 'Tags':
+            tags = ''.join('<item><key>{}</key><value>{}</value></item>'.format(escape(t['Key']), escape(t['Value']))
+                           for t in value)
+            parts.append('<tagSet>{}</tagSet>'.format(tags))
+        elif key == 'StartTime':
+            parts.append('<startTime>{}</startTime>'.format(value.strftime('%Y-%m-%dT%H:%M:%S.000Z')))
+        elif key in fields:
+            parts.append('<{tag}>{value}</{tag}>'.format(tag=fields[key], value=escape(str(value))))
+    return '<item>{}</item>'.format(''.join(parts))
@@ -0,0 +1,111 @@
+import os
+import threading
+
+
+# EC2 paginators loaded by warm
+PAGINATORS = ('describe_volumes', 'describe_snapshots', 'describe_instances')
+
+
+class ClientPool:
+    def __init__(self, session):
+        """
+        botocore clients and caller identity of a session, shared by every EBSSnapshot using the session. E.G.
+
+        pool = ClientPool(boto3.session.Session())
+        pool.warm(region='us-east-1')
+        ec2 = pool.client('ec2', region='us-east-1')
+
+        Clients are created once per service, region and config. The service models, endpoints, paginators and
+        credentials they are built from are loaded once per session and cached by botocore. Warming the pool in the
+        boss loads them before workers are forked, so a worker process builds its clients from memory instead of
+        parsing the service model again.
+
+        Clients are not carried across a fork as their connection pools belong to the parent. A forked worker gets
+        new clients on first use. The caller identity is kept.
+
+        :param session: boto3 session
+        :type session: boto3.session.Session
+        """
+        self.session = session
+        self._lock = threading.RLock()
+        self._pid = os.getpid()
+        self._clients = {}
+        self._identity = None
+
+    def client(self, service, region=None, config=None):
+        """
+        Create or reuse a client. boto3 sessions are not thread safe, so clients are created under the pool lock.
+
+        :param service: Service name. E.G. ec2
+        :type service: basestring
+        :param region: AWS region. Defaults to the region of the session.
+        :type region: basestring
+        :param config: botocore config
+        :type config: botocore.client.Config
+        :return: botocore client
+        """
+        self._forked()
+        key = (service, region, config)
+        with self._lock:
+            if key not in self._clients:
+                self._clients[key] = self.session.client(service, region_name=region, config=config)
+            return self._clients[key]
+
+    def identity(self):
+        """
+        Caller identity of the session. Requested from STS once.
+
+        :return: STS GetCallerIdentity response
+        :rtype: dict
+        """
+        self._forked()
+        with self._lock:
+            if self._identity is None:
+                self._identity = self.client('sts').get_caller_identity()
+            return self._identity
+
+    def warm(self, region=None, config=None):
+        """
+        Load the EC2 and STS service models, the EC2 paginators, endpoints and credentials. Called by the boss before
+        workers are started.
+
+        :param region: AWS region
+        :type region: basestring
+        :param config: botocore config of the EC2 client
+        :type config: botocore.client.Config
+        :return: self
+        :rtype: ClientPool
+        """
+        ec2 = self.client('ec2', region, config)
+        if hasattr(ec2, 'can_paginate'):
+            for operation in PAGINATORS:
+                ec2.can_paginate(operation)
+        self.client('sts')
+        return self
+
+    def _forked(self):
+        if self._pid != os.getpid():
+            # The lock may have been held by another thread of the parent when it forked
+            self._lock = threading.RLock()
+            self._pid = os.getpid()
+            self._clients = {}
+
+
+#
+# Utilities
+#
+def sized(config, connections):
+    """
+    Config with a HTTP connection pool of at least `connections` connections
+
+    :param config: botocore config
+    :type config: botocore.client.Config
+    :param connections: Number of threads sharing a client
+    :type connections: int
+    :rtype: botocore.client.Config
+    """
+    from botocore.client import Config
+
+    if isinstance(config, Config) and (config.max_pool_connections or 0) < connections:
+        return config.merge(Config(max_pool_connections=connections))
+    return config
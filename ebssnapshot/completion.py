@@ -0,0 +1,250 @@
+import calendar
+import collections
+import threading
+import time
+
+import shaping
+import snapshot
+
+from botocore.exceptions import ClientError
+from Queue import Empty
+
+
+# Seconds between polls while snapshots are completing
+INTERVAL = 15
+
+# Longest interval between polls. The interval doubles after every poll that completes nothing.
+MAX_INTERVAL = 300
+
+# Snapshot IDs per DescribeSnapshots call
+DESCRIBE_IDS = 1000
+
+# Completion time percentiles reported
+PERCENTILES = (50, 90, 99)
+
+
+class CompletionTracker:
+    def __init__(self, ebs, timeout, interval=INTERVAL, max_interval=MAX_INTERVAL, batch=DESCRIBE_IDS):
+        """
+        Poll the state of the snapshots created by a run until they complete. E.G.
+
+        tracker = CompletionTracker(ebs, timeout=3600)
+        completions = tracker.start(multiprocessing.Queue())
+        ... workers put (SnapshotId, StartTime, VolumeId) on completions ...
+        summary = tracker.stop()
+
+        The tracker runs in a thread of the boss process, so no worker waits on a snapshot. Snapshots are added as
+        they are created and every pending snapshot is described in batches of up to `batch` IDs per
+        DescribeSnapshots call. Polling backs off from `interval` to `max_interval` while nothing completes. Once the
+        run has dispatched everything the tracker waits at most `timeout` seconds, then flags the snapshots still
+        pending as stuck. With a timeout of 0 the tracker stops without waiting, which is used when it only signals
+        completions to a shaper.
+
+        :param ebs: Used to describe snapshots
+        :type ebs: EBSSnapshot
+        :param timeout: Seconds to wait for pending snapshots once every snapshot has been created
+        :type timeout: int
+        :param interval: Shortest number of seconds between polls
+        :type interval: float
+        :param max_interval: Longest number of seconds between polls
+        :type max_interval: float
+        :param batch: Snapshot IDs per DescribeSnapshots call
+        :type batch: int
+        """
+        self.ebs = ebs
+        self.timeout = timeout
+        self.interval = interval
+        self.max_interval = max_interval
+        self.batch = batch
+        self.counter = collections.Counter(tracked=0, completed=0, snapshot_error=0, stuck=0)
+        self.durations = []
+        self.polls = 0
+        self.logger = snapshot.getLogger('ebssnapshot.CompletionTracker')
+        self._queue = None
+        self._signals = None
+        self._volumes = {}
+        self._thread = None
+
+    def start(self, queue, signals=None):
+        """
+        Start polling
+
+        :param queue: Queue workers put (SnapshotId, StartTime[, VolumeId]) on. A sentinel (None) is put by `stop`.
+        :param signals: Optional shaper queue (COMPLETED, VolumeId) is put on when a snapshot completes or fails
+        :return: The queue
+        """
+        self._queue = queue
+        self._signals = signals
+        self._thread = threading.Thread(target=self._track)
+        self._thread.daemon = True
+        self._thread.start()
+        return queue
+
+    def stop(self):
+        """
+        Signal that every snapshot has been created and wait for the pending snapshots to complete, or for the
+        timeout
+
+        :return: Number of snapshots tracked, completed, failed as snapshot_error and stuck
+        :rtype: dict
+        """
+        self._queue.put(None)
+        self._thread.join()
+        return dict(self.counter)
+
+    def percentiles(self):
+        """
+        :return: Seconds from StartTime to completion by percentile, and the longest. None if nothing completed.
+        :rtype: collections.OrderedDict
+        """
+        if not self.durations:
+            return None
+
+        durations = sorted(self.durations)
+        result = collections.OrderedDict()
+        for percentile in PERCENTILES:
+            rank = max(int(len(durations) * percentile / 100.0 + 0.5), 1)
+            result['p{}'.format(percentile)] = round(durations[rank - 1], 1)
+        result['max'] = round(durations[-1], 1)
+        return result
+
+    #
+    # Internals
+    #
+    def _track(self):
+        pending = {}
+        closed = False
+        deadline = None
+        interval = self.interval
+        next_poll = time.time() + interval
+        while True:
+            # Take snapshots off the queue until the next poll is due
+            while not closed and time.time() < next_poll:
+                try:
+                    item = self._queue.get(True, max(next_poll - time.time(), 0))
+                except Empty:
+                    break
+                if item is None:
+                    closed = True
+                    deadline = time.time() + self.timeout
+                    if pending:
+                        next_poll = min(next_poll, deadline)
+                else:
+                    pending[item[0]] = _epoch(item[1])
+                    if len(item) > 2:
+                        self._volumes[item[0]] = item[2]
+                    self.counter['tracked'] += 1
+
+            if closed and (not pending or not self.timeout):
+                break
+
+            time.sleep(max(next_poll - time.time(), 0))
+            changed = False
+            try:
+                changed = self._poll(pending) if pending else False
+            except Exception as msg:
+                self.logger.error(self._log('error', error=str(msg)))
+
+            # Back off while snapshots are pending and none of them completed
+            interval = min(interval * 2, self.max_interval) if pending and not changed else self.interval
+            if closed and pending and time.time() >= deadline:
+                self._flag(pending)
+                break
+
+            next_poll = time.time() + interval
+            if closed:
+                next_poll = min(next_poll, deadline)
+
+        self._summary()
+
+    def _poll(self, pending):
+        """
+        Describe the pending snapshots and drop the ones completed or failed
+
+        :param pending: StartTime epoch by SnapshotId
+        :type pending: dict
+        :return: Whether any snapshot completed or failed
+        :rtype: bool
+        """
+        self.polls += 1
+        ids = sorted(pending)
+        finished = 0
+        for start in range(0, len(ids), self.batch):
+            for snapshot_id, snap in self._describe(ids[start:start + self.batch]):
+                if snap is not None and snap.get('State') == 'pending':
+                    continue
+
+                started = pending.pop(snapshot_id)
+                finished += 1
+                volume_id = self._volumes.pop(snapshot_id, None)
+                if self._signals is not None and volume_id:
+                    self._signals.put((shaping.COMPLETED, volume_id))
+                if snap is not None and snap.get('State') == 'completed':
+                    self.counter['completed'] += 1
+                    self.durations.append(time.time() - started)
+                    if self.ebs.metrics:
+                        self.ebs.metrics.observe('snapshot_completion_seconds', self.durations[-1])
+                else:
+                    self.counter['snapshot_error'] += 1
+                    log = self._log('error', snapshot_id)
+                    log['State'] = snap.get('State') if snap else 'missing'
+                    log['StateMessage'] = snap.get('StateMessage') if snap else 'Snapshot not found'
+                    self.logger.error(log)
+                    if volume_id:
+                        # Snapshotted again when the run is resumed
+                        self.ebs._record(volume_id, log)
+        return finished > 0
+
+    def _describe(self, ids):
+        """
+        DescribeSnapshots by ID. A call fails as a whole if one of its snapshots no longer exists, in which case the
+        IDs are split until the missing snapshots are found.
+
+        :return: (SnapshotId, snapshot) pairs, the snapshot being None if missing
+        :rtype: list
+        """
+        try:
+            result = self.ebs.connection().describe_snapshots(SnapshotIds=ids)
+        except ClientError as client_error:
+            if client_error.response.get('Error', {}).get('Code') != 'InvalidSnapshot.NotFound':
+                raise
+            if len(ids) == 1:
+                return [(ids[0], None)]
+            middle = len(ids) // 2
+            return self._describe(ids[:middle]) + self._describe(ids[middle:])
+
+        return [(snap['SnapshotId'], snap) for snap in result['Snapshots']]
+
+    def _flag(self, pending):
+        for snapshot_id in sorted(pending):
+            self.counter['stuck'] += 1
+            log = self._log('error', snapshot_id)
+            log['State'] = 'pending'
+            log['Pending'] = round(time.time() - pending[snapshot_id], 1)
+            self.logger.warning(log)
+
+    def _summary(self):
+        log = self._log('success' if not self.counter['snapshot_error'] and not self.counter['stuck'] else 'error')
+        log['Stages'] = dict(self.counter)
+        log['Polls'] = self.polls
+        log['Percentiles'] = self.percentiles()
+        self.logger.info(log)
+
+    def _log(self, result, snapshot_id=None, error=None):
+        log = collections.OrderedDict()
+        log['action'] = 'snapshot_completion'
+        log['uuid'] = self.ebs.uuid
+        log['result'] = result
+        log['region'] = self.ebs.region
+        if snapshot_id:
+            log['SnapshotId'] = snapshot_id
+        if error:
+            log['error'] = error
+        return log
+
+
+#
+# Utilities
+#
+def _epoch(timestamp):
+    return calendar.timegm(timestamp.utctimetuple())
@@ -0,0 +1,91 @@
+import multiprocessing.util
+import threading
+
+import clients
+
+
+# Seconds assumed role credentials are valid for. AWS caps chained role sessions at one hour.
+DURATION = 3600
+
+# Separator of the role ARNs of a role chain
+SEPARATOR = ','
+
+
+def chain(role):
+    """
+    Role ARNs of a role chain. E.G.
+
+    chain('arn:aws:iam::111111111111:role/Hub,arn:aws:iam::222222222222:role/EBSSnapshot')
+
+    :param role: One role ARN or a comma separated role chain, assumed left to right
+    :type role: basestring
+    :rtype: list
+    """
+    return [arn.strip() for arn in role.split(SEPARATOR) if arn.strip()]
+
+
+def assume_role_session(role, region=None, name=None, source=None, duration=DURATION):
+    """
+    Session with assumed role credentials that refresh themselves ahead of expiry. E.G.
+
+    sess = assume_role_session('arn:aws:iam::111111111111:role/Hub,arn:aws:iam::222222222222:role/EBSSnapshot',
+                               region='us-east-1', name='EBSSnapshot-us-east-1')
+
+    Each role of a chain is assumed with the credentials of the previous role, the first with the credentials of
+    `source`. Every link refreshes on its own, so a long run never presents expired credentials.
+
+    botocore starts refreshing 15 minutes before expiry. Until 10 minutes before expiry only one thread refreshes
+    while the others keep signing with the current credentials, so calls in flight are not blocked. Thread workers
+    share the credentials of the boss. Process workers inherit them and refresh their own copy.
+
+    :param role: One role ARN or a comma separated role chain
+    :type role: basestring
+    :param region: AWS region of the STS endpoint and of the session
+    :type region: basestring
+    :param name: Role session name
+    :type name: basestring
+    :param source: Session of the first link. Defaults to the default credential chain.
+    :type source: boto3.session.Session
+    :param duration: Seconds the credentials of each link are valid for
+    :type duration: int
+    :rtype: boto3.session.Session
+    """
+    import boto3
+
+    sess = source or boto3.session.Session(region_name=region)
+    for arn in chain(role):
+        sess = _assume(sess, arn, region, name or 'EBSSnapshot', duration)
+    return sess
+
+
+#
+# Utilities
+#
+def _assume(source, role, region, name, duration):
+    import boto3
+    import botocore.session
+    from botocore.credentials import RefreshableCredentials
+
+    pool = clients.ClientPool(source)
+
+    def refresh():
+        creds = pool.client('sts', region).assume_role(RoleArn=role, RoleSessionName=name,
+                                                       DurationSeconds=duration)['Credentials']
+        return {
+            'access_key': creds['AccessKeyId'],
+            'secret_key': creds['SecretAccessKey'],
+            'token': creds['SessionToken'],
+            'expiry_time': creds['Expiration'].isoformat(),
+        }
+
+    credentials = RefreshableCredentials.create_from_metadata(refresh(), refresh, 'assume-role')
+    multiprocessing.util.register_after_fork(credentials, _after_fork)
+
+    botocore_session = botocore.session.Session()
+    botocore_session._credentials = credentials
+    return boto3.session.Session(botocore_session=botocore_session, region_name=region)
+
+
+def _after_fork(credentials):
+    # Another thread of the parent may have been refreshing when it forked
+    credentials._refresh_lock = threading.Lock()
@@ -0,0 +1,191 @@
+import clients
+import multiprocessing
+import multiprocessing.dummy
+import multiprocessing.sharedctypes
+import scaling
+
+
+class WorkerFailed(Exception):
+    def __init__(self, results, error):
+        """
+        Raised by a worker that failed, carrying the results counted before it failed
+
+        :param results: Number of items by result
+        :type results: collections.Counter
+        :param error: What failed
+        :type error: basestring
+        """
+        Exception.__init__(self, error)
+        self.results = results
+
+
+#
+# Executors
+#
+class ProcessExecutor:
+    """
+    One process per worker. Every worker builds its own EBSSnapshot and EC2 client from the boss client pool, warmed
+    before the workers are forked.
+    """
+    name = 'process'
+
+    def queue(self, maxsize):
+        """
+        :param maxsize: Queue capacity
+        :type maxsize: int
+        :rtype: multiprocessing.JoinableQueue
+        """
+        return multiprocessing.JoinableQueue(maxsize)
+
+    def result_queue(self):
+        """
+        :rtype: multiprocessing.Queue
+        """
+        return multiprocessing.Queue()
+
+    def slots(self, size):
+        """
+        Integers shared by the boss and its workers
+
+        :param size: Number of integers
+        :type size: int
+        :rtype: multiprocessing.sharedctypes.RawArray
+        """
+        return multiprocessing.sharedctypes.RawArray('l', size)
+
+    def prepare(self, ebs):
+        """
+        Prepare the boss EBSSnapshot before any worker is started. Loads the service models and caller identity once
+        so that workers inherit them.
+
+        :type ebs: EBSSnapshot
+        """
+        ebs.session()
+        ebs.clients().warm(ebs.region, ebs.config())
+        ebs.connection()
+        ebs.aws_identity()
+
+    def start(self, worker, workerid, jobqueue, resultqueue, ebs):
+        """
+        Start a worker
+
+        :param worker: Worker callable. Called as worker(workerid, jobqueue, ebs)
+        :type worker: Callable
+        :param workerid: Worker ID
+        :type workerid: int
+        :param jobqueue: Multi Producer and Consumer Queue
+        :param resultqueue: Queue the worker return value is put on as (workerid, result, metrics)
+        :param ebs: Boss EBSSnapshot
+        :type ebs: EBSSnapshot
+        :return: Started worker
+        :rtype: multiprocessing.Process
+        """
+        proc = multiprocessing.Process(target=_run_worker, args=[worker, workerid, jobqueue, resultqueue, ebs, True])
+        proc.daemon = True
+        proc.start()
+        return proc
+
+
+class ThreadExecutor:
+    """
+    One thread per worker. All workers share the boss EC2 client, boto3 clients being thread safe. The client
+    connection pool is sized to the number of workers.
+    """
+    name = 'thread'
+
+    def queue(self, maxsize):
+        """
+        :param maxsize: Queue capacity
+        :type maxsize: int
+        :rtype: multiprocessing.dummy.JoinableQueue
+        """
+        return multiprocessing.dummy.JoinableQueue(maxsize)
+
+    def result_queue(self):
+        """
+        :rtype: multiprocessing.dummy.Queue
+        """
+        return multiprocessing.dummy.Queue()
+
+    def slots(self, size):
+        """
+        Integers shared by the boss and its workers
+
+        :param size: Number of integers
+        :type size: int
+        :rtype: list
+        """
+        return [0] * size
+
+    def prepare(self, ebs):
+        """
+        Size the connection pool to the most workers of the run and create the shared client up front. Creating clients from a session is not
+        thread safe.
+
+        :type ebs: EBSSnapshot
+        """
+        config = clients.sized(ebs.config(), scaling.capacity(ebs))
+        if config is not ebs.config():
+            ebs.config(config)
+        ebs.connection()
+        ebs.aws_identity()
+
+    def start(self, worker, workerid, jobqueue, resultqueue, ebs):
+        """
+        Start a worker
+
+        :param worker: Worker callable. Called as worker(workerid, jobqueue, ebs)
+        :type worker: Callable
+        :param workerid: Worker ID
+        :type workerid: int
+        :param jobqueue: Multi Producer and Consumer Queue
+        :param resultqueue: Queue the worker return value is put on as (workerid, result, metrics)
+        :param ebs: Boss EBSSnapshot, shared with the worker
+        :type ebs: EBSSnapshot
+        :return: Started worker
+        :rtype: multiprocessing.dummy.Process
+        """
+        thread = multiprocessing.dummy.Process(target=_run_worker, args=[worker, workerid, jobqueue, resultqueue, ebs, False])
+        thread.daemon = True
+        thread.start()
+        return thread
+
+
+EXECUTORS = {
+    ProcessExecutor.name: ProcessExecutor,
+    ThreadExecutor.name: ThreadExecutor,
+}
+
+
+def executor(name):
+    """
+    Executor by name
+
+    :param name: process | thread
+    :type name: basestring
+    :rtype: ProcessExecutor | ThreadExecutor
+    """
+    try:
+        return EXECUTORS[name]()
+    except KeyError:
+        raise ValueError('Unknown executor {name}. Expected one of: {names}'.format(
+            name=name, names=', '.join(sorted(EXECUTORS))))
+
+
+#
+# Utilities
+#
+def _run_worker(worker, workerid, jobqueue, resultqueue, ebs, clone):
+    """
+    Worker entry point. Runs the worker, against a copy of the boss EBSSnapshot if clone is set, and reports its
+    return value with the metrics recorded by the copy. A worker that fails reports the results it counted before
+    failing.
+    """
+    if clone:
+        ebs = ebs.clone()
+    try:
+        result = worker(workerid, jobqueue, ebs)
+    except WorkerFailed as failure:
+        resultqueue.put((workerid, failure.results, ebs.metrics if clone else None))
+        raise
+    resultqueue.put((workerid, result, ebs.metrics if clone else None))
@@ -0,0 +1,353 @@
+import calendar
+import fnmatch
+import json
+import os
+import time
+
+from datetime import datetime, timedelta
+from dateutil.parser import parse
+from dateutil.tz import tzutc
+from store import Store
+
+
+# Default inventory location
+DEFAULT_PATH = os.path.join('~', '.ebssnapshot', 'inventory.db')
+
+# Seconds before an incremental refresh is replaced by a full refresh
+TTL = 86400
+
+# EC2 accepts at most 200 values per filter. Refreshes reaching further back are full refreshes.
+MAX_FILTER_VALUES = 200
+
+# Version of the schema. Caches of an older version, E.G. holding pickled items, are dropped and refreshed in full.
+VERSION = 1
+
+SCHEMA = [
+    'CREATE TABLE IF NOT EXISTS volumes (account TEXT, region TEXT, id TEXT, start REAL, state TEXT, seen REAL, '
+    'data TEXT, PRIMARY KEY (account, region, id))',
+    'CREATE TABLE IF NOT EXISTS snapshots (account TEXT, region TEXT, id TEXT, start REAL, state TEXT, seen REAL, '
+    'data TEXT, PRIMARY KEY (account, region, id))',
+    'CREATE TABLE IF NOT EXISTS refreshes (account TEXT, region TEXT, kind TEXT, full REAL, refreshed REAL, '
+    'watermark REAL, PRIMARY KEY (account, region, kind))',
+]
+
+# Item fields, top level or nested, holding times. Cached as ISO 8601 strings.
+TIMES = ('AttachTime', 'CreateTime', 'StartTime')
+
+# How each kind is described and where its fields are
+KINDS = {
+    'volumes': {'id': 'VolumeId', 'start': 'CreateTime', 'since': 'create-time', 'pending': 'creating'},
+    'snapshots': {'id': 'SnapshotId', 'start': 'StartTime', 'since': 'start-time', 'pending': 'pending'},
+}
+
+# Filters that can be applied to cached items. Each returns the values of an item the filter values are matched to.
+FILTERS = {
+    'availability-zone': lambda item: [item.get('AvailabilityZone')],
+    'attachment.instance-id': lambda item: [a.get('InstanceId') for a in item.get('Attachments', [])],
+    'encrypted': lambda item: [str(item.get('Encrypted')).lower()],
+    'owner-id': lambda item: [item.get('OwnerId')],
+    'snapshot-id': lambda item: [item.get('SnapshotId')],
+    'status': lambda item: [item.get('State')],
+    'tag-key': lambda item: [tag['Key'] for tag in item.get('Tags', [])],
+    'volume-id': lambda item: [item.get('VolumeId')],
+    'volume-type': lambda item: [item.get('VolumeType')],
+}
+
+
+class Inventory(Store):
+    def __init__(self, path=DEFAULT_PATH, ttl=TTL):
+        """
+        On disk cache of the volumes and snapshots of each account and region. E.G.
+
+        ebs = EBSSnapshot(region='us-east-1', inventory=Inventory())
+        ebs.create_snapshot_boss(filters)
+
+        Items are read from the cache after a refresh. A refresh is incremental when the last full refresh is less
+        than `ttl` seconds old. DescribeVolumes and DescribeSnapshots have no range filters, so an incremental refresh
+        only describes items created on or after the day of the watermark, using a create-time or start-time wildcard
+        filter per day. The watermark is the oldest pending item or the newest item seen. Items deleted by other tools
+        are only dropped by a full refresh. Snapshots created and deleted through this cache are written through.
+
+        :param path: SQLite database file
+        :type path: basestring
+        :param ttl: Seconds between full refreshes
+        :type ttl: int
+        """
+        Store.__init__(self, path, SCHEMA, version=VERSION)
+        self.ttl = ttl
+
+    #
+    # Reads
+    #
+    def volume_pages(self, ebs, filters=None, PageSize=None):
+        """
+        Refresh then list the cached volumes of an EBSSnapshot account and region
+
+        :param ebs: Used to describe and to identify the account and region
+        :type ebs: EBSSnapshot
+        :param filters: List of AWS filters. Applied to the cached volumes, see FILTERS.
+        :type filters: list
+        :param PageSize: Volumes per page. Defaults to the page_size of ebs.
+        :type PageSize: int
+        :rtype: generator
+        """
+        return self._pages(ebs, 'volumes', filters, PageSize)
+
+    def snapshot_pages(self, ebs, filters=None, PageSize=None):
+        """
+        Refresh then list the cached snapshots owned by an EBSSnapshot account and region
+
+        :param ebs: Used to describe and to identify the account and region
+        :type ebs: EBSSnapshot
+        :param filters: List of AWS filters. Applied to the cached snapshots, see FILTERS.
+        :type filters: list
+        :param PageSize: Snapshots per page. Defaults to the page_size of ebs.
+        :type PageSize: int
+        :rtype: generator
+        """
+        return self._pages(ebs, 'snapshots', filters, PageSize)
+
+    def summary(self):
+        """
+        :return: One entry per account, region and kind with the item count and refresh times
+        :rtype: list
+        """
+        conn = self.connection()
+        rows = []
+        for kind in sorted(KINDS):
+            counts = dict(((account, region), count) for account, region, count in conn.execute(
+                'SELECT account, region, COUNT(*) FROM {kind} GROUP BY account, region'.format(kind=kind)))
+            for account, region, full, refreshed, watermark in conn.execute(
+                    'SELECT account, region, full, refreshed, watermark FROM refreshes WHERE kind = ? '
+                    'ORDER BY account, region', (kind,)):
+                rows.append({
+                    'account': account,
+                    'region': region,
+                    'kind': kind,
+                    'count': counts.get((account, region), 0),
+                    'full': _isoformat(full),
+                    'refreshed': _isoformat(refreshed),
+                    'watermark': _isoformat(watermark),
+                })
+        return rows
+
+    #
+    # Writes
+    #
+    def refresh(self, ebs, kind, full=False):
+        """
+        Refresh the cached volumes or snapshots of an EBSSnapshot account and region
+
+        :param ebs: Used to describe and to identify the account and region
+        :type ebs: EBSSnapshot
+        :param kind: volumes | snapshots
+        :type kind: basestring
+        :param full: Describe every item, even if the last full refresh is less than ttl seconds old
+        :type full: bool
+        :return: Number of items described and removed, and whether the refresh was full
+        :rtype: dict
+        """
+        account, region = _scope(ebs)
+        conn = self.connection()
+        now = time.time()
+        row = conn.execute('SELECT full, watermark FROM refreshes WHERE account = ? AND region = ? AND kind = ?',
+                           (account, region, kind)).fetchone()
+        values = None
+        if not full and row and now - row[0] < self.ttl:
+            values = since(row[1], now)
+        filters = [{'Name': KINDS[kind]['since'], 'Values': values}] if values else None
+
+        if kind == 'volumes':
+            pages = ebs.volume_pages(filters=filters)
+        else:
+            pages = ebs.snapshot_pages(filters=filters, owner_ids=['self'])
+
+        described = 0
+        for page in pages:
+            described += len(page)
+            self._put(conn, account, region, kind, page, now)
+            conn.commit()
+
+        removed = 0
+        if filters is None:
+            removed = conn.execute('DELETE FROM {kind} WHERE account = ? AND region = ? AND seen < ?'.format(
+                kind=kind), (account, region, now)).rowcount
+
+        pending = conn.execute('SELECT MIN(start) FROM {kind} WHERE account = ? AND region = ? AND state = ?'.format(
+            kind=kind), (account, region, KINDS[kind]['pending'])).fetchone()[0]
+        newest = conn.execute('SELECT MAX(start) FROM {kind} WHERE account = ? AND region = ?'.format(
+            kind=kind), (account, region)).fetchone()[0]
+        watermark = pending or newest or now
+        conn.execute('INSERT OR REPLACE INTO refreshes (account, region, kind, full, refreshed, watermark) '
+                     'VALUES (?, ?, ?, ?, ?, ?)',
+                     (account, region, kind, now if filters is None else row[0], now, watermark))
+        conn.commit()
+        return {'described': described, 'removed': removed, 'full': filters is None}
+
+    def add_snapshot(self, account, region, snapshot):
+        """
+        Write a created snapshot through to the cache
+
+        :param snapshot: Snapshot as returned by CreateSnapshot or DescribeSnapshots
+        :type snapshot: dict
+        """
+        conn = self.connection()
+        self._put(conn, account, region, 'snapshots', [snapshot], time.time())
+        conn.commit()
+
+    def remove_snapshot(self, account, region, snapshot_id):
+        """
+        Remove a deleted snapshot from the cache
+        """
+        conn = self.connection()
+        conn.execute('DELETE FROM snapshots WHERE account = ? AND region = ? AND id = ?',
+                     (account, region, snapshot_id))
+        conn.commit()
+
+    def prune(self, account=None, region=None, older=None):
+        """
+        Remove cached accounts and regions
+
+        :param account: Only prune this account
+        :type account: basestring
+        :param region: Only prune this region
+        :type region: basestring
+        :param older: Only prune accounts and regions not refreshed for this many days
+        :type older: int
+        :return: Number of items removed by kind
+        :rtype: dict
+        """
+        clauses = []
+        args = []
+        if account:
+            clauses.append('account = ?')
+            args.append(account)
+        if region:
+            clauses.append('region = ?')
+            args.append(region)
+        if older is not None:
+            clauses.append('refreshed < ?')
+            args.append(time.time() - older * 86400)
+        where = ' AND '.join(clauses) or '1'
+
+        conn = self.connection()
+        removed = {}
+        for kind in sorted(KINDS):
+            scopes = conn.execute('SELECT account, region FROM refreshes WHERE kind = ? AND {where}'.format(
+                where=where), [kind] + args).fetchall()
+            removed[kind] = 0
+            for scope in scopes:
+                removed[kind] += conn.execute('DELETE FROM {kind} WHERE account = ? AND region = ?'.format(
+                    kind=kind), scope).rowcount
+                conn.execute('DELETE FROM refreshes WHERE account = ? AND region = ? AND kind = ?', scope + (kind,))
+        conn.commit()
+        return removed
+
+    #
+    # Internals
+    #
+    def _pages(self, ebs, kind, filters, PageSize):
+        self.refresh(ebs, kind)
+        account, region = _scope(ebs)
+        size = PageSize or ebs.page_size
+        cursor = self.connection().execute(
+            'SELECT data FROM {kind} WHERE account = ? AND region = ?'.format(kind=kind), (account, region))
+        while True:
+            rows = cursor.fetchmany(size)
+            if not rows:
+                break
+            page = [item for item in (json.loads(row[0], object_hook=_decode) for row in rows) if match(item, filters)]
+            if page:
+                yield page
+
+    def _put(self, conn, account, region, kind, items, seen):
+        fields = KINDS[kind]
+        conn.executemany(
+            'INSERT OR REPLACE INTO {kind} (account, region, id, start, state, seen, data) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)'.format(kind=kind),
+            [(account, region, item[fields['id']], _epoch(item.get(fields['start'])), item.get('State'), seen,
+              json.dumps(_strip(item), default=_encode)) for item in items])
+
+
+#
+# Utilities
+#
+def match(item, filters):
+    """
+    Match a volume or snapshot to AWS filters. Values may use the * and ? wildcards.
+
+    :param item: Volume or snapshot
+    :type item: dict
+    :param filters: List of AWS filters
+    :type filters: list
+    :rtype: bool
+    :raises ValueError: Filter not supported by the inventory
+    """
+    for flt in filters or []:
+        name = flt['Name']
+        if name.startswith('tag:'):
+            key = name[4:]
+            values = [tag['Value'] for tag in item.get('Tags', []) if tag['Key'] == key]
+        elif name in FILTERS:
+            values = FILTERS[name](item)
+        else:
+            raise ValueError('Filter {name} is not supported by the inventory. Expected tag:<key> or one of: '
+                             '{names}'.format(name=name, names=', '.join(sorted(FILTERS))))
+
+        if not any(value is not None and fnmatch.fnmatchcase(value, pattern)
+                   for value in values for pattern in flt['Values']):
+            return False
+
+    return True
+
+
+def _scope(ebs):
+    return ebs.aws_identity()['Account'], ebs.region
+
+
+def _strip(item):
+    return dict((key, value) for key, value in item.items() if key != 'ResponseMetadata')
+
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError('{!r} is not JSON serializable'.format(value))
+
+
+def _decode(entry):
+    for key in TIMES:
+        if isinstance(entry.get(key), basestring):
+            entry[key] = parse(entry[key])
+    return entry
+
+
+def _epoch(timestamp):
+    if timestamp is None:
+        return None
+    return calendar.timegm(timestamp.utctimetuple())
+
+
+def _isoformat(epoch):
+    if epoch is None:
+        return None
+    return datetime.fromtimestamp(epoch, tzutc()).isoformat()
+
+
+def since(watermark, now):
+    """
+    Day wildcards matching every create-time or start-time from the day of the watermark to today
+
+    :return: Filter values, or None if a full refresh is needed
+    :rtype: list
+    """
+    if watermark is None:
+        return None
+
+    day = datetime.fromtimestamp(watermark, tzutc()).date()
+    today = datetime.fromtimestamp(now, tzutc()).date()
+    days = (today - day).days + 1
+    if days > MAX_FILTER_VALUES:
+        return None
+
+    return ['{:%Y-%m-%d}*'.format(day + timedelta(days=i)) for i in range(days)]
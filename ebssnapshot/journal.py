@@ -0,0 +1,191 @@
+import os
+import time
+
+from store import Store
+
+
+# Default journal directory. One journal per run UUID.
+DEFAULT_DIRECTORY = os.path.join('~', '.ebssnapshot', 'journal')
+
+# Item key by action
+KEYS = {
+    'create_snapshot': 'VolumeId',
+    'expire_snapshot': 'SnapshotId',
+}
+
+SCHEMA = [
+    'CREATE TABLE IF NOT EXISTS runs (account TEXT, region TEXT, action TEXT, started REAL, '
+    'PRIMARY KEY (account, region))',
+    'CREATE TABLE IF NOT EXISTS items (account TEXT, region TEXT, id TEXT, state TEXT, result TEXT, updated REAL, '
+    'PRIMARY KEY (account, region, id))',
+]
+
+# Item states
+DISPATCHED = 'dispatched'
+COMPLETED = 'completed'
+FAILED = 'failed'
+
+# Run summary counts of the items a resumed run retries: failed, deferred by EC2 or the shaper, or snapshots that
+# failed to complete
+RETRIED = ('error', 'deferred', 'deferral_exhausted', 'snapshot_error')
+
+
+def settled(summary):
+    """
+    Whether a run left nothing for a resumed run to retry, in which case its journal can be removed
+
+    :param summary: Run summary, or the totals of an orchestrated run
+    :type summary: dict
+    :rtype: bool
+    """
+    return not any(summary.get(key) for key in RETRIED)
+
+
+class Journal(Store):
+    def __init__(self, identifier, directory=DEFAULT_DIRECTORY):
+        """
+        Durable record of the items dispatched and completed by a run, kept per account and region. E.G.
+
+        ebs = EBSSnapshot(region='us-east-1', identifier=run_uuid, journal=Journal(run_uuid))
+        ebs.create_snapshot_boss(filters)
+
+        A run with the UUID of an interrupted run skips the items completed by it. Items that were dispatched but not
+        completed are reconciled by the boss before the run starts. Failed items are retried.
+
+        :param identifier: Run UUID
+        :type identifier: basestring
+        :param directory: Directory holding one journal file per run
+        :type directory: basestring
+        """
+        Store.__init__(self, os.path.join(directory, '{}.db'.format(identifier)), SCHEMA)
+        self.uuid = identifier
+
+    def start(self, account, region, action):
+        """
+        Record the action of a run
+
+        :raises ValueError: The run was journaled for a different action
+        """
+        conn = self.connection()
+        row = conn.execute('SELECT action FROM runs WHERE account = ? AND region = ?', (account, region)).fetchone()
+        if row and row[0] != action:
+            raise ValueError('Run {uuid} was a {journaled} run, it cannot be resumed as {action}'.format(
+                uuid=self.uuid, journaled=row[0], action=action))
+        if not row:
+            conn.execute('INSERT INTO runs (account, region, action, started) VALUES (?, ?, ?, ?)',
+                         (account, region, action, time.time()))
+            conn.commit()
+
+    def track(self, batches, account, region, action, counter=None):
+        """
+        Pipeline stage. Drop the items completed by a previous attempt of the run and record the others as
+        dispatched, one transaction per batch.
+
+        :param batches: Iterable of lists of volumes or snapshots
+        :param action: create_snapshot | expire_snapshot
+        :type action: basestring
+        :param counter: Counter the number of items skipped is added to as 'resumed'
+        :type counter: collections.Counter
+        :rtype: generator
+        """
+        key = KEYS[action]
+        completed = self.ids(account, region, COMPLETED)
+        if counter is not None:
+            counter['resumed'] += 0
+
+        conn = self.connection()
+        for batch in batches:
+            kept = [item for item in batch if item[key] not in completed]
+            if counter is not None:
+                counter['resumed'] += len(batch) - len(kept)
+            if not kept:
+                continue
+
+            now = time.time()
+            conn.executemany(
+                'INSERT OR REPLACE INTO items (account, region, id, state, result, updated) VALUES (?, ?, ?, ?, ?, ?)',
+                [(account, region, item[key], DISPATCHED, None, now) for item in kept])
+            conn.commit()
+            yield kept
+
+    def complete(self, account, region, item_id, result=None):
+        """
+        Record a completed item
+
+        :param item_id: VolumeId or SnapshotId
+        :type item_id: basestring
+        :param result: ID of the resource created, if any
+        :type result: basestring
+        """
+        self._set(account, region, item_id, COMPLETED, result)
+
+    def fail(self, account, region, item_id):
+        """
+        Record a failed item. It is retried when the run is resumed.
+        """
+        self._set(account, region, item_id, FAILED, None)
+
+    def buffer(self):
+        """
+        Hold the items completed or failed by the current process and thread until they are flushed, so that a worker
+        writes the items of a job in one transaction. Items of a worker that dies before flushing are left
+        dispatched and reconciled when the run is resumed.
+        """
+        self._local.pending = []
+
+    def flush(self):
+        """
+        Write the items held since `py:function:: Journal.buffer` and stop holding them
+        """
+        pending = getattr(self._local, 'pending', None)
+        self._local.pending = None
+        if pending:
+            self._write(pending)
+
+    def ids(self, account, region, state):
+        """
+        :return: IDs of the items in a state
+        :rtype: set
+        """
+        return set(row[0] for row in self.connection().execute(
+            'SELECT id FROM items WHERE account = ? AND region = ? AND state = ?', (account, region, state)))
+
+    def summary(self):
+        """
+        :return: Number of items by state
+        :rtype: dict
+        """
+        return dict(self.connection().execute('SELECT state, COUNT(*) FROM items GROUP BY state'))
+
+    def remove(self):
+        """
+        Delete the journal file
+        """
+        self.connection().close()
+        self._local.pid = None
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(self.path + suffix):
+                os.remove(self.path + suffix)
+
+    def _set(self, account, region, item_id, state, result):
+        row = (account, region, item_id, state, result, time.time())
+        pending = getattr(self._local, 'pending', None)
+        if pending is not None:
+            pending.append(row)
+        else:
+            self._write([row])
+
+    def _write(self, rows):
+        """
+        Write item states unless a later state was written first. E.G. a snapshot the completion tracker saw fail
+        before the worker that created it flushed its job.
+        """
+        conn = self.connection()
+        conn.executemany(
+            'INSERT OR IGNORE INTO items (account, region, id, state, result, updated) VALUES (?, ?, ?, ?, ?, ?)', rows)
+        conn.executemany(
+            'UPDATE items SET state = ?, result = ?, updated = ? '
+            'WHERE account = ? AND region = ? AND id = ? AND updated <= ?',
+            [(state, result, updated, account, region, item_id, updated)
+             for account, region, item_id, state, result, updated in rows])
+        conn.commit()
@@ -0,0 +1,269 @@
+import collections
+import json
+import logging
+import multiprocessing
+import multiprocessing.util
+import os
+import threading
+import time
+
+from datetime import datetime
+from dateutil.tz import tzutc
+
+
+# Records shipped per batch from a worker process
+BATCH_SIZE = 100
+
+# Seconds a worker process holds records before shipping them
+FLUSH_INTERVAL = 1.0
+
+# Bytes of NDJSON lines buffered before they are written
+BUFFER_SIZE = 65536
+
+
+class Message:
+    def __init__(self, fields):
+        """
+        Log record message rendered only when a handler formats it. Log records built by EBSSnapshot are
+        dictionaries with uuid, action and result keys, rendered as:
+
+        uuid=<uuid> action=<action> result=<result> json='<fields as JSON>'
+
+        :param fields: Log record
+        :type fields: dict
+        """
+        self.fields = fields
+        self._text = None
+
+    def __str__(self):
+        if self._text is None:
+            self._text = "uuid={uuid} action={action} result={result} json='{msg}'".format(
+                msg=json.dumps(self.fields), **self.fields)
+        return self._text
+
+
+class BatchHandler(logging.Handler):
+    def __init__(self, handlers, size=BATCH_SIZE, interval=FLUSH_INTERVAL):
+        """
+        Ship the records of worker processes to the handlers of the boss in batches. Records logged by the boss
+        process, including thread workers, are handled directly. Created in the boss before workers are started.
+
+        A worker process renders each record and holds it until `size` records are held, `interval` seconds have
+        passed since the last batch or an ERROR is logged. Records held are shipped when the worker exits. Records held
+        by a worker that is killed are lost.
+
+        :param handlers: Handlers of the boss
+        :type handlers: list
+        :param size: Records per batch
+        :type size: int
+        :param interval: Seconds a record is held for at most, unless the worker is idle
+        :type interval: float
+        """
+        logging.Handler.__init__(self)
+        self.handlers = handlers
+        self.size = size
+        self.interval = interval
+        self.pid = os.getpid()
+        self.queue = multiprocessing.Queue()
+        self._buffer = []
+        self._flushed = time.time()
+        self._finalized = None
+        self._closed = False
+        self._listener = threading.Thread(target=self._receive, name='ebssnapshot-logs')
+        self._listener.daemon = True
+        self._listener.start()
+
+    def emit(self, record):
+        if os.getpid() == self.pid:
+            self._handle(record)
+            return
+
+        try:
+            self._buffer.append(_prepare(self, record))
+            if self._finalized != os.getpid():
+                # Worker processes run multiprocessing finalizers on exit, not atexit handlers
+                multiprocessing.util.Finalize(self, self.flush, exitpriority=10)
+                self._finalized = os.getpid()
+            if (len(self._buffer) >= self.size or record.levelno >= logging.ERROR or
+                    time.time() - self._flushed >= self.interval):
+                self.flush()
+        except (KeyboardInterrupt, SystemExit):
+            raise
+        except Exception:
+            self.handleError(record)
+
+    def flush(self):
+        """
+        Ship the records held by a worker process
+        """
+        self.acquire()
+        try:
+            if self._buffer and os.getpid() != self.pid:
+                self.queue.put(self._buffer)
+                self._buffer = []
+            self._flushed = time.time()
+        finally:
+            self.release()
+
+    def close(self):
+        """
+        In the boss, handle the batches still queued then close the handlers of the boss
+        """
+        self.flush()
+        if os.getpid() == self.pid and not self._closed:
+            self._closed = True
+            self.queue.put(None)
+            self._listener.join()
+            for handler in self.handlers:
+                handler.close()
+        logging.Handler.close(self)
+
+    def _receive(self):
+        while True:
+            batch = self.queue.get()
+            if batch is None:
+                break
+            for record in batch:
+                self._handle(record)
+
+    def _handle(self, record):
+        for handler in self.handlers:
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+
+class NDJSONHandler(logging.Handler):
+    def __init__(self, directory, prefix='ebssnapshot', size=BUFFER_SIZE):
+        """
+        Write records as newline delimited JSON, one file per process: <directory>/<prefix>-<pid>.ndjson. Each
+        worker process writes its own file, so nothing is shipped to the boss. Thread workers share the file of the
+        boss.
+
+        Each line holds the time, level, logger name and process ID, followed by the fields of the record. Lines are
+        buffered and appended `size` bytes at a time. A worker process drops the lines it inherited from the boss.
+
+        :param directory: Directory of the NDJSON files. Created if missing.
+        :type directory: basestring
+        :param prefix: File name prefix
+        :type prefix: basestring
+        :param size: Bytes buffered before they are written
+        :type size: int
+        """
+        logging.Handler.__init__(self)
+        self.directory = directory
+        self.prefix = prefix
+        self.size = size
+        self._fd = None
+        self._pid = None
+        self._lines = []
+        self._buffered = 0
+
+    def emit(self, record):
+        try:
+            if self._pid != os.getpid():
+                self._open()
+
+            line = collections.OrderedDict()
+            line['time'] = datetime.fromtimestamp(record.created, tzutc()).isoformat()
+            line['level'] = record.levelname
+            line['logger'] = record.name
+            line['pid'] = record.process
+            if isinstance(record.msg, Message):
+                line.update(record.msg.fields)
+            else:
+                line['message'] = record.getMessage()
+
+            text = json.dumps(line) + '\n'
+            self._lines.append(text)
+            self._buffered += len(text)
+            if self._buffered >= self.size or record.levelno >= logging.ERROR:
+                self.flush()
+        except (KeyboardInterrupt, SystemExit):
+            raise
+        except Exception:
+            self.handleError(record)
+
+    def flush(self):
+        self.acquire()
+        try:
+            if self._lines and self._pid == os.getpid():
+                os.write(self._fd, ''.join(self._lines))
+            self._lines = []
+            self._buffered = 0
+        finally:
+            self.release()
+
+    def close(self):
+        self.flush()
+        self.acquire()
+        try:
+            if self._fd is not None and self._pid == os.getpid():
+                os.close(self._fd)
+            self._fd = None
+        finally:
+            self.release()
+        logging.Handler.close(self)
+
+    def path(self, pid=None):
+        """
+        :return: NDJSON file of a process. Defaults to the current process.
+        :rtype: basestring
+        """
+        return os.path.join(self.directory, '{prefix}-{pid}.ndjson'.format(prefix=self.prefix,
+                                                                          pid=pid or os.getpid()))
+
+    def _open(self):
+        if not os.path.exists(self.directory):
+            try:
+                os.makedirs(self.directory)
+            except OSError:
+                if not os.path.isdir(self.directory):
+                    raise
+
+        if self._pid is not None:
+            # Forked from the boss. The lines held and the file belong to the boss.
+            multiprocessing.util.Finalize(self, self.close, exitpriority=10)
+        self._lines = []
+        self._buffered = 0
+        self._fd = os.open(self.path(), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        self._pid = os.getpid()
+
+
+def install(size=BATCH_SIZE, ndjson=None, logger=None):
+    """
+    Ship the records of worker processes in batches to the handlers of a logger, and optionally write every record
+    to a NDJSON file per process. Called once logging is configured and before workers are started.
+
+    :param size: Records per batch, see `py:class:: BatchHandler`
+    :type size: int
+    :param ndjson: NDJSON directory, see `py:class:: NDJSONHandler`
+    :type ndjson: basestring
+    :param logger: Defaults to the root logger
+    :type logger: logging.Logger
+    :rtype: BatchHandler
+    """
+    logger = logger or logging.getLogger()
+    handlers = list(logger.handlers)
+    batch = BatchHandler(handlers, size=size)
+    for handler in handlers:
+        logger.removeHandler(handler)
+    logger.addHandler(batch)
+    if ndjson:
+        logger.addHandler(NDJSONHandler(ndjson))
+
+    return batch
+
+
+#
+# Utilities
+#
+def _prepare(handler, record):
+    """
+    Render a record so that it pickles, as logging.handlers.QueueHandler does
+    """
+    if record.exc_info:
+        handler.format(record)
+        record.exc_info = None
+    record.msg = record.getMessage()
+    record.args = None
+    return record
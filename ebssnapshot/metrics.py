@@ -0,0 +1,297 @@
+import bisect
+import collections
+import json
+import os
+import threading
+import time
+
+from ratelimit import THROTTLE_CODES
+
+
+# Prefix of every exported metric name
+PREFIX = 'ebssnapshot_'
+
+# Histogram upper bounds by metric. Other histograms use LATENCY_BUCKETS.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+BUCKETS = {
+    'boss_queue_depth': (0, 1, 2, 4, 8, 16, 32, 64, 128, 256),
+    'snapshot_completion_seconds': (60, 300, 600, 1800, 3600, 7200, 14400, 28800, 86400),
+}
+
+# Export formats
+FORMATS = ('prometheus', 'json')
+
+
+class Metrics:
+    def __init__(self):
+        """
+        Counters, gauges and histograms of a run. E.G.
+
+        ebs = EBSSnapshot(region='us-east-1', metrics=Metrics())
+        ebs.create_snapshot_boss(filters)
+        ebs.metrics.write('/var/lib/node_exporter/ebssnapshot.prom')
+
+        Thread workers share the boss registry. Process workers record to their own registry which is returned with
+        their results when they exit and merged by the boss, so collecting metrics adds no round trip.
+
+        Metrics are identified by name and labels:
+            api_calls_total, api_latency_seconds, api_retries_total, api_throttles_total, api_errors_total and
+            api_connection_errors_total by action. Latency includes client side rate limiting and retries.
+            ratelimit_wait_seconds_total by action
+            boss_queue_depth and boss_blocked_seconds_total by region, sampled on every dispatch
+            worker_busy_seconds_total and worker_idle_seconds_total by region
+            items_total by action and result
+            run_duration_seconds, items_per_second and worker_utilisation by action and region
+            snapshot_completion_seconds
+        """
+        self._lock = threading.Lock()
+        self.counters = collections.Counter()
+        self.gauges = {}
+        self.histograms = {}
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    #
+    # Recording
+    #
+    def inc(self, name, value=1, **labels):
+        """
+        Add to a counter
+
+        :param name: Metric name
+        :type name: basestring
+        :param value: Amount added
+        :type value: float
+        :param labels: Metric labels
+        """
+        key = _key(name, labels)
+        with self._lock:
+            self.counters[key] += value
+
+    def set(self, name, value, **labels):
+        """
+        Set a gauge
+        """
+        key = _key(name, labels)
+        with self._lock:
+            self.gauges[key] = value
+
+    def observe(self, name, value, **labels):
+        """
+        Add an observation to a histogram
+        """
+        key = _key(name, labels)
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [0] * (len(_buckets(name)) + 1) + [0.0]
+            histogram[bisect.bisect_left(_buckets(name), value)] += 1
+            histogram[-1] += value
+
+    def value(self, name, **labels):
+        """
+        :return: Value of a counter, 0 if it was never incremented
+        :rtype: float
+        """
+        with self._lock:
+            return self.counters[_key(name, labels)]
+
+    def quantile(self, name, q, **labels):
+        """
+        Estimate a quantile of a histogram as Prometheus histogram_quantile does, interpolating linearly within the
+        bucket the quantile falls in. Observations over the highest bound are reported as the highest bound.
+
+        :param name: Histogram name
+        :type name: basestring
+        :param q: Quantile between 0 and 1
+        :type q: float
+        :return: Estimated quantile, None if nothing was observed
+        :rtype: float
+        """
+        with self._lock:
+            histogram = self.histograms.get(_key(name, labels))
+            if not histogram or not sum(histogram[:-1]):
+                return None
+            rank = q * sum(histogram[:-1])
+            lower, previous = 0.0, 0
+            for bound, total in _cumulative(name, histogram):
+                if total >= rank:
+                    if bound == float('inf'):
+                        return lower
+                    return lower + (bound - lower) * (rank - previous) / (total - previous)
+                lower, previous = bound, total
+
+    def merge(self, other):
+        """
+        Add the metrics recorded by a worker. Gauges are replaced.
+
+        :type other: Metrics
+        """
+        with self._lock:
+            self.counters.update(other.counters)
+            self.gauges.update(other.gauges)
+            for key, histogram in other.histograms.items():
+                if key in self.histograms:
+                    self.histograms[key] = [a + b for a, b in zip(self.histograms[key], histogram)]
+                else:
+                    self.histograms[key] = list(histogram)
+
+    def attach(self, client):
+        """
+        Record the latency, retries, throttles and errors of every call made by a botocore client
+
+        :param client: botocore client
+        """
+        service = client.meta.service_model.service_id.hyphenize()
+        client.meta.events.register('before-call.{}'.format(service), self._before_call)
+        client.meta.events.register('after-call.{}'.format(service), self._after_call)
+        client.meta.events.register('needs-retry.{}'.format(service), self._needs_retry)
+
+    #
+    # Export
+    #
+    def summary(self):
+        """
+        :return: Counters, gauges and histograms keyed by name{labels}. Histograms as count, sum, mean and
+                 cumulative bucket counts.
+        :rtype: collections.OrderedDict
+        """
+        with self._lock:
+            result = collections.OrderedDict()
+            for key in sorted(self.counters):
+                result[_format(key)] = self.counters[key]
+            for key in sorted(self.gauges):
+                result[_format(key)] = self.gauges[key]
+            for key in sorted(self.histograms):
+                histogram = self.histograms[key]
+                count = sum(histogram[:-1])
+                entry = collections.OrderedDict()
+                entry['count'] = count
+                entry['sum'] = round(histogram[-1], 6)
+                entry['mean'] = round(histogram[-1] / count, 6) if count else None
+                entry['buckets'] = collections.OrderedDict(
+                    (_bound(bound), total) for bound, total in _cumulative(key[0], histogram))
+                result[_format(key)] = entry
+            return result
+
+    def prometheus(self):
+        """
+        :return: Metrics in the Prometheus text exposition format
+        :rtype: basestring
+        """
+        with self._lock:
+            lines = []
+            for kind, values in (('counter', self.counters), ('gauge', self.gauges)):
+                for name in sorted(set(key[0] for key in values)):
+                    lines.append('# TYPE {prefix}{name} {kind}'.format(prefix=PREFIX, name=name, kind=kind))
+                    for key in sorted(k for k in values if k[0] == name):
+                        lines.append('{metric} {value}'.format(metric=PREFIX + _format(key),
+                                                               value=_number(values[key])))
+
+            for name in sorted(set(key[0] for key in self.histograms)):
+                lines.append('# TYPE {prefix}{name} histogram'.format(prefix=PREFIX, name=name))
+                for key in sorted(k for k in self.histograms if k[0] == name):
+                    histogram = self.histograms[key]
+                    for bound, total in _cumulative(name, histogram):
+                        bucket = (name + '_bucket', key[1] + (('le', _bound(bound)),))
+                        lines.append('{metric} {value}'.format(metric=PREFIX + _format(bucket), value=total))
+                    lines.append('{metric} {value}'.format(metric=PREFIX + _format((name + '_sum', key[1])),
+                                                           value=_number(histogram[-1])))
+                    lines.append('{metric} {value}'.format(metric=PREFIX + _format((name + '_count', key[1])),
+                                                           value=sum(histogram[:-1])))
+            return '\n'.join(lines) + '\n'
+
+    def write(self, path, fmt='prometheus'):
+        """
+        Write the metrics to a file. The file is replaced atomically so that a textfile collector never reads a
+        partial file.
+
+        :param path: Output file
+        :type path: basestring
+        :param fmt: prometheus | json
+        :type fmt: basestring
+        :raises ValueError: Unknown format
+        """
+        if fmt == 'prometheus':
+            text = self.prometheus()
+        elif fmt == 'json':
+            text = json.dumps(self.summary(), indent=4) + '\n'
+        else:
+            raise ValueError('Unknown metrics format {fmt}. Expected one of: {formats}'.format(
+                fmt=fmt, formats=', '.join(FORMATS)))
+
+        temp = '{path}.{pid}.tmp'.format(path=path, pid=os.getpid())
+        with open(temp, 'w') as stream:
+            stream.write(text)
+        os.rename(temp, path)
+
+    #
+    # botocore event handlers
+    #
+    def _before_call(self, model=None, context=None, **kwargs):
+        if context is not None:
+            context['metrics_started'] = time.time()
+
+    def _after_call(self, http_response=None, parsed=None, model=None, context=None, **kwargs):
+        action = model.name
+        self.inc('api_calls_total', action=action)
+        if context and 'metrics_started' in context:
+            self.observe('api_latency_seconds', time.time() - context['metrics_started'], action=action)
+
+        parsed = parsed or {}
+        retries = parsed.get('ResponseMetadata', {}).get('RetryAttempts', 0)
+        if retries:
+            self.inc('api_retries_total', retries, action=action)
+        code = parsed.get('Error', {}).get('Code')
+        if code:
+            self.inc('api_errors_total', action=action, code=code)
+
+    def _needs_retry(self, response=None, operation=None, caught_exception=None, **kwargs):
+        if caught_exception is not None:
+            self.inc('api_connection_errors_total', action=operation.name, error=type(caught_exception).__name__)
+        elif response and response[1].get('Error', {}).get('Code') in THROTTLE_CODES:
+            self.inc('api_throttles_total', action=operation.name)
+
+
+#
+# Utilities
+#
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def _buckets(name):
+    return BUCKETS.get(name, LATENCY_BUCKETS)
+
+
+def _cumulative(name, histogram):
+    total = 0
+    for bound, count in zip(_buckets(name) + (float('inf'),), histogram[:-1]):
+        total += count
+        yield bound, total
+
+
+def _bound(bound):
+    return '+Inf' if bound == float('inf') else _number(bound)
+
+
+def _number(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def _format(key):
+    name, labels = key
+    if not labels:
+        return name
+    return '{name}{{{labels}}}'.format(name=name, labels=','.join(
+        '{label}="{value}"'.format(label=label, value=str(value).replace('\\', '\\\\').replace('"', '\\"'))
+        for label, value in labels))
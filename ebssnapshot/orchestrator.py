@@ -0,0 +1,175 @@
+import collections
+import threading
+import time
+import uuid
+
+import executor
+import snapshot
+
+
+Target = collections.namedtuple('Target', ['role', 'region'])
+
+
+class Orchestrator:
+    def __init__(self, targets, concurrency=8, region_concurrency=2, identifier=None, **kwargs):
+        """
+        Run the create or expire boss against many (role, region) targets. E.G.
+
+        orchestrator = Orchestrator([Target(role=None, region='us-east-1'), Target(role=arn, region='us-west-2')])
+        orchestrator.create()
+
+        Targets run concurrently in threads, at most `concurrency` at once and at most `region_concurrency` per region.
+        One assumed role session and client pool is created per account role and reused across its regions.
+
+        :param targets: List of Target or (role, region) tuples
+        :type targets: list
+        :param concurrency: Maximum number of targets running at once
+        :type concurrency: int
+        :param region_concurrency: Maximum number of targets running at once in any one region
+        :type region_concurrency: int
+        :param identifier: Universally Unique Identifier shared by every target. Automatically generated if not supplied.
+        :type identifier: basestring
+        :param kwargs: Passed through to EBSSnapshot (desc, workers, executor, connecttimeout, readtimeout...)
+        """
+        self.targets = [Target(*target) for target in targets]
+        self.concurrency = concurrency
+        self.region_concurrency = region_concurrency
+        self.uuid = identifier or str(uuid.uuid1())
+        self.kwargs = kwargs
+        self.kwargs.setdefault('executor', 'thread')
+        self.logger = snapshot.getLogger('ebssnapshot.Orchestrator')
+        self._lock = threading.Lock()
+        self._pools = {}
+
+    def create(self, filters=None, plan=None):
+        """
+        Create snapshots for every target
+
+        :param filters: List of AWS filters
+        :type filters: list
+        :param plan: Add the volumes of every target to this plan instead of snapshotting them
+        :type plan: plan.Plan
+        :return: Aggregated summary
+        :rtype: dict
+        """
+        return self.run(lambda ebs: ebs.create_snapshot_boss(filters, plan=plan), 'create_snapshot')
+
+    def expire(self, filters=None, gt=None, lt=None, retention=None, plan=None):
+        """
+        Expire snapshots for every target
+
+        :param filters: List of AWS filters
+        :type filters: list
+        :param gt: days from current date
+        :type gt: int
+        :param lt: days from current date
+        :type lt: int
+        :param retention: Expire by retention policy instead of the gt/lt filters
+        :type retention: retention.Retention
+        :param plan: Add the snapshots of every target to this plan instead of deleting them
+        :type plan: plan.Plan
+        :return: Aggregated summary
+        :rtype: dict
+        """
+        return self.run(lambda ebs: ebs.expire_snapshot_boss(filters, gt=gt, lt=lt, retention=retention, plan=plan),
+                        'expire_snapshot')
+
+    def apply(self, plan):
+        """
+        Execute a plan for every target
+
+        :param plan: Plan built by create or expire
+        :type plan: plan.Plan
+        :return: Aggregated summary
+        :rtype: dict
+        """
+        return self.run(lambda ebs: ebs.apply_plan(plan), 'apply_plan')
+
+    def run(self, func, action):
+        """
+        Run func(ebs) for every target
+
+        :param func: Called with the EBSSnapshot of a target. Returns the boss summary.
+        :type func: Callable
+        :param action: Action name used for logging
+        :type action: basestring
+        :return: Aggregated summary
+        :rtype: dict
+        """
+        started = time.time()
+        slots = threading.BoundedSemaphore(self.concurrency)
+        region_slots = dict((region, threading.BoundedSemaphore(self.region_concurrency))
+                            for region in set(target.region for target in self.targets))
+        results = [None] * len(self.targets)
+
+        def target_worker(index, target):
+            # Region slot first so that a target waiting on a busy region does not hold a global slot
+            with region_slots[target.region]:
+                with slots:
+                    results[index] = self._run_target(func, action, target)
+
+        threads = []
+        for index, target in enumerate(self.targets):
+            thread = threading.Thread(target=target_worker, args=[index, target])
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+
+        for thread in threads:
+            thread.join()
+
+        totals = collections.Counter()
+        for result in results:
+            totals.update(result['summary'])
+
+        summary = collections.OrderedDict()
+        summary['action'] = 'orchestrate'
+        summary['uuid'] = self.uuid
+        summary['result'] = 'error' if any(r['result'] == 'error' for r in results) else 'success'
+        summary['duration'] = round(time.time() - started, 3)
+        summary['totals'] = dict(totals)
+        summary['targets'] = results
+        self.logger.info(summary)
+        return summary
+
+    def clients(self, role, region):
+        """
+        Client pool of an account role. Its session and caller identity are created once and reused across regions.
+
+        :param role: The IAM role ARN to assume or None
+        :type role: basestring
+        :param region: AWS region used to assume the role
+        :type region: basestring
+        :rtype: clients.ClientPool
+        """
+        with self._lock:
+            if role not in self._pools:
+                conn = snapshot.EC2Connection(region=region, identifier=self.uuid, role=role)
+                conn.session()
+                self._pools[role] = conn.clients()
+
+            return self._pools[role]
+
+    def _run_target(self, func, action, target):
+        started = time.time()
+        result = collections.OrderedDict()
+        result['role'] = target.role
+        result['region'] = target.region
+        try:
+            pool = self.clients(target.role, target.region)
+            ebs = snapshot.EBSSnapshot(region=target.region, identifier=self.uuid, role=target.role, **self.kwargs)
+            ebs.clients(pool)
+            with self._lock:
+                executor.executor(ebs.executor).prepare(ebs)
+
+            result['summary'] = func(ebs) or {}
+            result['result'] = 'success'
+        except Exception as msg:
+            self.logger.exception('{action} failed for role={role} region={region}'.format(
+                action=action, role=target.role, region=target.region))
+            result['summary'] = {}
+            result['result'] = 'error'
+            result['error'] = str(msg)
+
+        result['duration'] = round(time.time() - started, 3)
+        return result
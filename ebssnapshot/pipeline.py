@@ -0,0 +1,170 @@
+import collections
+import sys
+import threading
+
+from Queue import Empty, Queue
+
+
+class Pipeline:
+    def __init__(self, source, counter=None):
+        """
+        Composable stages over a stream of batches. Each stage works on a whole batch and stages are lazy, so only
+        the batches in flight are held in memory. E.G.
+
+        pipeline = Pipeline(prefetch(ebs.volume_pages())).count('described').filter(predicate, 'skipped').batch(10)
+        boss(ebs, worker, pipeline)
+
+        :param source: Iterable of batches (lists), such as describe pages
+        :param counter: Counter stages add to. Created if not supplied.
+        :type counter: collections.Counter
+        """
+        self.counter = collections.Counter() if counter is None else counter
+        self._batches = iter(source)
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        return next(self._batches)
+
+    def filter(self, predicate, key=None):
+        """
+        Drop items that do not match a predicate
+
+        :param predicate: Called with each item. Items it returns False for are dropped.
+        :type predicate: Callable
+        :param key: Counter key incremented for every dropped item
+        :type key: basestring
+        :rtype: Pipeline
+        """
+        if key:
+            self.counter[key] += 0
+
+        def stage(batches):
+            for batch in batches:
+                kept = [item for item in batch if predicate(item)]
+                if key:
+                    self.counter[key] += len(batch) - len(kept)
+                if kept:
+                    yield kept
+
+        self._batches = stage(self._batches)
+        return self
+
+    def map(self, func):
+        """
+        Transform every item
+
+        :param func: Called with each item. Returns the item passed to the next stage.
+        :type func: Callable
+        :rtype: Pipeline
+        """
+        def stage(batches):
+            for batch in batches:
+                yield [func(item) for item in batch]
+
+        self._batches = stage(self._batches)
+        return self
+
+    def stage(self, func):
+        """
+        Add a stage operating on the stream of batches
+
+        :param func: Called with an iterator of batches. Returns an iterator of batches.
+        :type func: Callable
+        :rtype: Pipeline
+        """
+        self._batches = func(self._batches)
+        return self
+
+    def count(self, key):
+        """
+        Count the items passing through
+
+        :param key: Counter key
+        :type key: basestring
+        :rtype: Pipeline
+        """
+        self.counter[key] += 0
+
+        def stage(batches):
+            for batch in batches:
+                self.counter[key] += len(batch)
+                yield batch
+
+        self._batches = stage(self._batches)
+        return self
+
+    def batch(self, size):
+        """
+        Regroup items into batches of up to `size` items
+
+        :param size: Items per batch
+        :type size: int
+        :rtype: Pipeline
+        """
+        def stage(batches):
+            pending = []
+            for batch in batches:
+                pending.extend(batch)
+                while len(pending) >= size:
+                    yield pending[:size]
+                    pending = pending[size:]
+            if pending:
+                yield pending
+
+        self._batches = stage(self._batches)
+        return self
+
+    def items(self):
+        """
+        :return: Items one at a time
+        :rtype: generator
+        """
+        for batch in self._batches:
+            for item in batch:
+                yield item
+
+
+def prefetch(batches, depth=1):
+    """
+    Read ahead from an iterable in a background thread. Used so the next describe page is fetched while the
+    current one is processed. At most `depth` batches are buffered. The thread is started on first use.
+
+    :param batches: Iterable of batches
+    :param depth: Number of batches to read ahead
+    :type depth: int
+    :rtype: generator
+    """
+    buffered = Queue(maxsize=depth)
+    done = object()
+    stop = threading.Event()
+
+    def reader():
+        try:
+            for batch in batches:
+                buffered.put((batch, None))
+                if stop.is_set():
+                    return
+            buffered.put((done, None))
+        except Exception:
+            buffered.put((done, sys.exc_info()))
+
+    thread = threading.Thread(target=reader)
+    thread.daemon = True
+    thread.start()
+    try:
+        while True:
+            batch, error = buffered.get()
+            if batch is done:
+                if error:
+                    raise error[0], error[1], error[2]
+                return
+            yield batch
+    finally:
+        # Unblock the reader if it is waiting on a full buffer
+        stop.set()
+        try:
+            buffered.get_nowait()
+        except Empty:
+            pass
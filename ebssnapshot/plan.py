@@ -0,0 +1,168 @@
+import collections
+import json
+import threading
+import uuid
+
+from datetime import datetime
+from dateutil.parser import parse
+from dateutil.tz import tzutc
+
+
+# Plan file format version
+VERSION = 1
+
+# Fields kept for each planned item. Enough to execute the item and to review it.
+FIELDS = {
+    'create_snapshot': ('VolumeId', 'AvailabilityZone', 'Size', 'Attachments', 'Tags'),
+    'expire_snapshot': ('SnapshotId', 'VolumeId', 'StartTime', 'Tags'),
+}
+
+# Item key plans are sorted by
+KEYS = {
+    'create_snapshot': 'VolumeId',
+    'expire_snapshot': 'SnapshotId',
+}
+
+
+class Plan:
+    def __init__(self, action, identifier=None, description=None, created=None, targets=None):
+        """
+        Serialized execution plan. Volumes to snapshot or snapshots to delete, grouped by account and region. E.G.
+
+        plan = Plan('expire_snapshot')
+        ebs.expire_snapshot_boss(filters, gt=-7, plan=plan)
+        plan.save('expire.json')
+
+        ebs.apply_plan(Plan.load('expire.json'))
+
+        Items are sorted and written with sorted keys so that plans can be reviewed and diffed.
+
+        :param action: create_snapshot | expire_snapshot
+        :type action: basestring
+        :param identifier: Run UUID the plan is applied with. Automatically generated if not supplied.
+        :type identifier: basestring
+        :param description: Text describing the plan
+        :type description: basestring
+        :param created: When the plan was created. ISO 8601.
+        :type created: basestring
+        :param targets: Planned targets as saved
+        :type targets: list
+        :raises ValueError: Unknown action
+        """
+        if action not in FIELDS:
+            raise ValueError('Unknown plan action {action}. Expected one of: {actions}'.format(
+                action=action, actions=', '.join(sorted(FIELDS))))
+
+        self.action = action
+        self.uuid = identifier or str(uuid.uuid1())
+        self.description = description
+        self.created = created or datetime.now(tzutc()).isoformat()
+        self.targets = targets or []
+        self._lock = threading.Lock()
+
+    def add(self, account, region, role, items):
+        """
+        Add the items of a target
+
+        :param account: AWS account ID
+        :type account: basestring
+        :param region: AWS region
+        :type region: basestring
+        :param role: IAM role ARN the target is reached with or None
+        :type role: basestring
+        :param items: Volumes or snapshots
+        :type items: Iterable
+        :return: Number of items added
+        :rtype: int
+        """
+        fields = FIELDS[self.action]
+        entries = [dict((field, _serialize(item[field])) for field in fields if field in item) for item in items]
+        entries.sort(key=lambda entry: entry[KEYS[self.action]])
+
+        target = collections.OrderedDict()
+        target['account'] = account
+        target['region'] = region
+        target['role'] = role
+        target['items'] = entries
+        with self._lock:
+            self.targets.append(target)
+            self.targets.sort(key=lambda t: (t['account'], t['region']))
+
+        return len(entries)
+
+    def items(self, account, region):
+        """
+        Planned items of a target
+
+        :param account: AWS account ID
+        :type account: basestring
+        :param region: AWS region
+        :type region: basestring
+        :return: Volumes or snapshots, as passed to create_snapshot or expire_snapshot
+        :rtype: list
+        :raises ValueError: The plan has no target for the account and region
+        """
+        for target in self.targets:
+            if target['account'] == account and target['region'] == region:
+                return [_deserialize(entry) for entry in target['items']]
+
+        raise ValueError('Plan {uuid} has no items for account {account} region {region}'.format(
+            uuid=self.uuid, account=account, region=region))
+
+    def save(self, path):
+        """
+        Write the plan as JSON
+
+        :param path: Plan file
+        :type path: basestring
+        """
+        document = collections.OrderedDict()
+        document['version'] = VERSION
+        document['action'] = self.action
+        document['uuid'] = self.uuid
+        document['description'] = self.description
+        document['created'] = self.created
+        document['targets'] = self.targets
+        with open(path, 'w') as stream:
+            json.dump(document, stream, indent=4, separators=(',', ': '), sort_keys=True)
+            stream.write('\n')
+
+    @classmethod
+    def load(cls, path):
+        """
+        Read a plan written by `py:function:: Plan.save`
+
+        :param path: Plan file
+        :type path: basestring
+        :rtype: Plan
+        :raises ValueError: Unsupported plan version or action
+        """
+        with open(path) as stream:
+            document = json.load(stream)
+
+        if document.get('version') != VERSION:
+            raise ValueError('Unsupported plan version {version} in {path}'.format(
+                version=document.get('version'), path=path))
+
+        return cls(document['action'], identifier=document['uuid'], description=document.get('description'),
+                   created=document.get('created'), targets=document['targets'])
+
+
+#
+# Utilities
+#
+def _serialize(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, list):
+        return [_serialize(item) for item in value]
+    if isinstance(value, dict):
+        return dict((key, _serialize(item)) for key, item in value.items())
+    return value
+
+
+def _deserialize(entry):
+    item = dict(entry)
+    if 'StartTime' in item:
+        item['StartTime'] = parse(item['StartTime'])
+    return item
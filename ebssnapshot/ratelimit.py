@@ -0,0 +1,198 @@
+import collections
+import functools
+import multiprocessing
+import threading
+import time
+
+
+# Error codes that signal the caller is sending requests too fast
+THROTTLE_CODES = ('RequestLimitExceeded', 'Throttling', 'ThrottlingException')
+
+# Mutating actions that are rate limited by default
+ACTIONS = ('CreateSnapshot', 'CreateSnapshots', 'DeleteSnapshot')
+
+
+class TokenBucket:
+    # Offsets into the shared state array
+    RATE, TOKENS, UPDATED, THROTTLES, CALLS, DECREASED, RESPONSES, LATENCY, WAITED = range(9)
+
+    def __init__(self, rate=10.0, min_rate=0.5, max_rate=200.0, increase=1.0, decrease=0.5, cooldown=1.0):
+        """
+        Token bucket with an AIMD (additive increase, multiplicative decrease) refill rate. State is kept in shared
+        memory so a bucket created before workers are started is shared by every worker process and thread.
+
+        :param rate: Initial refill rate in calls per second
+        :type rate: float
+        :param min_rate: Lowest rate the bucket decreases to
+        :type min_rate: float
+        :param max_rate: Highest rate the bucket increases to
+        :type max_rate: float
+        :param increase: Calls per second added for every second of successful calls
+        :type increase: float
+        :param decrease: Factor the rate is multiplied by when throttled
+        :type decrease: float
+        :param cooldown: Seconds after a decrease during which further throttles do not decrease the rate again
+        :type cooldown: float
+        """
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.cooldown = cooldown
+        self._lock = multiprocessing.Lock()
+        self._state = multiprocessing.RawArray('d', 9)
+        self._state[self.RATE] = min(max(rate, min_rate), max_rate)
+        self._state[self.TOKENS] = 1.0
+        self._state[self.UPDATED] = time.time()
+
+    def acquire(self):
+        """
+        Block until a call may be made
+
+        :return: Seconds waited
+        :rtype: float
+        """
+        waited = 0.0
+        state = self._state
+        while True:
+            with self._lock:
+                now = time.time()
+                rate = state[self.RATE]
+                state[self.TOKENS] = min(max(rate, 1.0), state[self.TOKENS] + (now - state[self.UPDATED]) * rate)
+                state[self.UPDATED] = now
+                if state[self.TOKENS] >= 1.0:
+                    state[self.TOKENS] -= 1.0
+                    state[self.CALLS] += 1
+                    state[self.WAITED] += waited
+                    return waited
+
+                wait = (1.0 - state[self.TOKENS]) / rate
+
+            time.sleep(wait)
+            waited += wait
+
+    def throttled(self):
+        """
+        Record a throttled call. Decreases the rate at most once per cooldown and drains the bucket.
+        """
+        state = self._state
+        with self._lock:
+            now = time.time()
+            state[self.THROTTLES] += 1
+            if now - state[self.DECREASED] >= self.cooldown:
+                state[self.RATE] = max(self.min_rate, state[self.RATE] * self.decrease)
+                state[self.DECREASED] = now
+                state[self.TOKENS] = min(state[self.TOKENS], 0.0)
+
+    def succeeded(self):
+        """
+        Record a successful call. Increases the rate by `increase` calls per second of successful calls.
+        """
+        state = self._state
+        with self._lock:
+            state[self.RATE] = min(self.max_rate, state[self.RATE] + self.increase / state[self.RATE])
+
+    def responded(self, latency):
+        """
+        Record the latency of a response, from the time the call was sent
+        """
+        state = self._state
+        with self._lock:
+            state[self.RESPONSES] += 1
+            state[self.LATENCY] += latency
+
+    def stats(self):
+        """
+        :return: Current rate, number of calls made and number of calls throttled
+        :rtype: dict
+        """
+        with self._lock:
+            return {
+                'rate': round(self._state[self.RATE], 3),
+                'calls': int(self._state[self.CALLS]),
+                'throttles': int(self._state[self.THROTTLES]),
+            }
+
+    def totals(self):
+        """
+        :return: Calls made, calls throttled, responses, seconds waited for responses and seconds waited for tokens
+                 since the bucket was created
+        :rtype: collections.Counter
+        """
+        with self._lock:
+            return collections.Counter(
+                calls=self._state[self.CALLS], throttles=self._state[self.THROTTLES],
+                responses=self._state[self.RESPONSES], latency=self._state[self.LATENCY],
+                waited=self._state[self.WAITED])
+
+
+class RateLimiter:
+    def __init__(self, region=None, actions=ACTIONS, **kwargs):
+        """
+        Client side rate limits for a region, one TokenBucket per API action. Buckets are created up front so that
+        they are shared with workers started afterwards.
+
+        :param region: AWS region
+        :type region: basestring
+        :param actions: API action names to limit
+        :type actions: list
+        :param kwargs: Passed through to TokenBucket
+        """
+        self.region = region
+        self.buckets = dict((action, TokenBucket(**kwargs)) for action in actions)
+        self._sent = threading.local()
+
+    def attach(self, client, metrics=None):
+        """
+        Limit calls made by a botocore client. Every HTTP attempt, including botocore retries, waits for a token and
+        every response adjusts the rate of its action.
+
+        :param client: botocore client
+        :param metrics: Optional registry the time spent waiting for tokens is added to
+        :type metrics: metrics.Metrics
+        """
+        service = client.meta.service_model.service_id.hyphenize()
+        before_send = functools.partial(self._before_send, metrics=metrics) if metrics else self._before_send
+        for action in self.buckets:
+            client.meta.events.register_first('before-send.{}.{}'.format(service, action), before_send)
+            client.meta.events.register('needs-retry.{}.{}'.format(service, action), self._needs_retry)
+
+    def stats(self):
+        """
+        :return: Bucket stats by action
+        :rtype: dict
+        """
+        return dict((action, bucket.stats()) for action, bucket in self.buckets.items())
+
+    def totals(self):
+        """
+        :return: Bucket totals summed over every action. See `py:function:: TokenBucket.totals`.
+        :rtype: collections.Counter
+        """
+        totals = collections.Counter()
+        for bucket in self.buckets.values():
+            totals.update(bucket.totals())
+        return totals
+
+    def _before_send(self, event_name, metrics=None, **kwargs):
+        action = event_name.split('.')[-1]
+        waited = self.buckets[action].acquire()
+        if metrics and waited:
+            metrics.inc('ratelimit_wait_seconds_total', waited, action=action)
+        # Handlers of a call run in the thread making it
+        self._sent.started = time.time()
+
+    def _needs_retry(self, response=None, operation=None, **kwargs):
+        if not response:
+            return
+
+        bucket = self.buckets[operation.name]
+        started = getattr(self._sent, 'started', None)
+        if started is not None:
+            bucket.responded(time.time() - started)
+            self._sent.started = None
+        http_response, parsed = response
+        if parsed.get('Error', {}).get('Code') in THROTTLE_CODES:
+            bucket.throttled()
+        elif http_response.status_code < 400:
+            bucket.succeeded()
@@ -0,0 +1,198 @@
+import calendar
+import collections
+
+import snapshot
+
+
+# Snapshot tag holding a per volume retention spec. Copied from the volume when the snapshot is created.
+POLICY_TAG = 'backup-policy'
+
+# VolumeId of snapshots copied from another snapshot. Copies of unrelated volumes share it.
+UNKNOWN_VOLUME = 'vol-ffffffff'
+
+# Seconds per bucket for the fixed length periods
+HOUR = 3600
+DAY = 86400
+
+
+class Policy:
+    PERIODS = ('hourly', 'daily', 'weekly', 'monthly', 'yearly')
+
+    def __init__(self, last=1, hourly=0, daily=0, weekly=0, monthly=0, yearly=0):
+        """
+        Grandfather-father-son retention. For each period the newest snapshot of each of the `n` most recent
+        periods that have a snapshot is kept. E.G. daily=7 keeps the newest snapshot of each of the last 7 days that
+        have a snapshot.
+
+        :param last: Number of most recent snapshots always kept
+        :type last: int
+        :param hourly: Number of hourly snapshots kept
+        :type hourly: int
+        :param daily: Number of daily snapshots kept
+        :type daily: int
+        :param weekly: Number of weekly (Monday to Sunday UTC) snapshots kept
+        :type weekly: int
+        :param monthly: Number of monthly snapshots kept
+        :type monthly: int
+        :param yearly: Number of yearly snapshots kept
+        :type yearly: int
+        """
+        self.last = last
+        self.hourly = hourly
+        self.daily = daily
+        self.weekly = weekly
+        self.monthly = monthly
+        self.yearly = yearly
+
+    @classmethod
+    def parse(cls, spec):
+        """
+        Policy from a spec string. E.G. "last=1,daily=7,weekly=4,monthly=12"
+
+        :param spec: Comma separated period=count pairs
+        :type spec: basestring
+        :rtype: Policy
+        :raises ValueError: Unknown period, invalid count or a spec that keeps no snapshots
+        """
+        kwargs = {}
+        for part in spec.split(','):
+            if not part.strip():
+                continue
+            name, _, value = part.partition('=')
+            name = name.strip()
+            if name not in ('last',) + cls.PERIODS:
+                raise ValueError('Unknown retention period {name} in "{spec}"'.format(**locals()))
+            kwargs[name] = int(value)
+            if kwargs[name] < 0:
+                raise ValueError('Negative retention count in "{spec}"'.format(**locals()))
+        if not kwargs:
+            raise ValueError('Empty retention spec "{spec}"'.format(**locals()))
+        if not any(kwargs.values()):
+            raise ValueError('Retention spec "{spec}" keeps no snapshots'.format(**locals()))
+        return cls(**kwargs)
+
+    def keep(self, entries):
+        """
+        Select the entries to keep
+
+        :param entries: Entries of a single volume sorted newest first. Each entry is a tuple whose first three items
+                        are the StartTime as epoch seconds, the year and the month.
+        :type entries: list
+        :return: Indexes into entries of the snapshots kept
+        :rtype: set
+        """
+        kept = set(range(min(self.last, len(entries))))
+        periods = [
+            (self.hourly, lambda entry: entry[0] // HOUR),
+            (self.daily, lambda entry: entry[0] // DAY),
+            # The epoch is a Thursday. Shift by 3 days so that weeks start on Monday.
+            (self.weekly, lambda entry: (entry[0] // DAY + 3) // 7),
+            (self.monthly, lambda entry: (entry[1], entry[2])),
+            (self.yearly, lambda entry: entry[1]),
+        ]
+        for count, bucket in periods:
+            if not count:
+                continue
+            previous = None
+            found = 0
+            for index, entry in enumerate(entries):
+                current = bucket(entry)
+                if current != previous:
+                    kept.add(index)
+                    previous = current
+                    found += 1
+                    if found == count:
+                        break
+
+        return kept
+
+
+class Retention:
+    def __init__(self, policy, tag=POLICY_TAG):
+        """
+        Decide which snapshots to expire across a whole snapshot stream. Snapshots are grouped by VolumeId and by
+        the retention spec in their `tag` tag, falling back to `policy`. Each group is sorted once, so a stream of n
+        snapshots is decided in O(n log n). Copied snapshots, whose volume is unknown, are retained.
+
+        Only the fields needed to decide and to delete are held for each snapshot: SnapshotId, VolumeId, StartTime
+        and State.
+
+        :param policy: Default policy for snapshots without a policy tag
+        :type policy: Policy
+        :param tag: Snapshot tag holding a per volume retention spec
+        :type tag: basestring
+        """
+        self.policy = policy
+        self.tag = tag
+        self.logger = snapshot.getLogger('ebssnapshot.Retention')
+        self._policies = {}
+
+    def expire(self, batches, counter=None, size=1000):
+        """
+        Pipeline stage. Consumes every batch of snapshots then yields the snapshots to expire.
+
+        :param batches: Iterable of lists of snapshots as returned by DescribeSnapshots
+        :param counter: Counter the number of snapshots retained is added to as 'retained'
+        :type counter: collections.Counter
+        :param size: Snapshots per batch yielded
+        :type size: int
+        :rtype: generator
+        """
+        groups = collections.defaultdict(list)
+        retained = 0
+        for batch in batches:
+            for snap in batch:
+                if snap['VolumeId'] == UNKNOWN_VOLUME:
+                    retained += 1
+                    continue
+                start = snap['StartTime']
+                groups[(snap['VolumeId'], self._spec(snap))].append(
+                    (calendar.timegm(start.utctimetuple()), start.year, start.month,
+                     snap['SnapshotId'], snap.get('State', 'completed'), start))
+
+        expired = []
+        for (volume_id, spec), entries in groups.iteritems():
+            policy = self._policy(spec)
+            if not policy:
+                retained += len(entries)
+                continue
+
+            entries.sort(reverse=True)
+            kept = policy.keep(entries)
+            for index, entry in enumerate(entries):
+                # Pending snapshots are never expired
+                if index in kept or entry[4] != 'completed':
+                    retained += 1
+                    continue
+
+                expired.append({'SnapshotId': entry[3], 'VolumeId': volume_id, 'StartTime': entry[5]})
+                if len(expired) >= size:
+                    yield expired
+                    expired = []
+
+        if counter is not None:
+            counter['retained'] += retained
+        if expired:
+            yield expired
+
+    def _spec(self, snap):
+        for tag in snap.get('Tags', []):
+            if tag['Key'] == self.tag:
+                return tag['Value']
+        return None
+
+    def _policy(self, spec):
+        """
+        Policy for a spec. Invalid specs return None, and their snapshots are retained.
+        """
+        if spec is None:
+            return self.policy
+
+        if spec not in self._policies:
+            try:
+                self._policies[spec] = Policy.parse(spec)
+            except ValueError as msg:
+                self.logger.warning('Retaining snapshots with invalid {tag} tag: {msg}'.format(tag=self.tag, msg=msg))
+                self._policies[spec] = None
+
+        return self._policies[spec]
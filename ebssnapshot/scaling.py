@@ -0,0 +1,199 @@
+import collections
+import time
+
+import snapshot
+
+
+# Seconds of calls each scaling decision is made from
+WINDOW = 10
+
+# Workers added at once while jobs back up
+STEP = 2
+
+# Factor the workers are multiplied by when throttled
+DECREASE = 0.5
+
+# Fraction of calls throttled over which workers are removed
+MAX_THROTTLE = 0.02
+
+# Times the fastest mean latency seen over which workers are removed
+MAX_LATENCY = 2.0
+
+# Fraction of worker time spent waiting on the client side rate limiter over which workers are not added
+MAX_WAITING = 0.5
+
+
+class Bounds:
+    def __init__(self, minimum=1, maximum=16):
+        """
+        Workers an autoscaled run keeps between
+
+        :param minimum: Fewest workers
+        :type minimum: int
+        :param maximum: Most workers
+        :type maximum: int
+        :raises ValueError: Minimum under 1 or over the maximum
+        """
+        if minimum < 1 or maximum < minimum:
+            raise ValueError('Invalid worker bounds {minimum}:{maximum}'.format(**locals()))
+        self.minimum = minimum
+        self.maximum = maximum
+
+    @classmethod
+    def parse(cls, spec):
+        """
+        Bounds from a spec string. E.G. "2:32"
+
+        :param spec: MIN:MAX
+        :type spec: basestring
+        :rtype: Bounds
+        :raises ValueError: Invalid spec
+        """
+        minimum, sep, maximum = spec.partition(':')
+        if not sep:
+            raise ValueError('Expected MIN:MAX worker bounds, got "{spec}"'.format(**locals()))
+        return cls(int(minimum), int(maximum))
+
+    def clamp(self, workers):
+        """
+        :rtype: int
+        """
+        return min(max(workers, self.minimum), self.maximum)
+
+
+class Autoscaler:
+    def __init__(self, bounds, ebs, window=WINDOW, step=STEP, decrease=DECREASE, max_throttle=MAX_THROTTLE,
+                 max_latency=MAX_LATENCY, max_waiting=MAX_WAITING):
+        """
+        Decide how many workers a run uses from the calls its workers made over the last window. E.G.
+
+        autoscaler = Autoscaler(Bounds(2, 32), ebs)
+        supervisor = Supervisor(backend, worker, jobqueue, resultqueue, ebs, autoscaler=autoscaler)
+
+        Calls, throttles, response latency and the time spent waiting for tokens are read from the rate limiter of
+        the run, shared by every worker. Jobs backing up in the boss are sampled every time the supervisor checks its
+        workers. Like the rate limiter, workers are added additively and removed multiplicatively:
+
+            throttled: more than `max_throttle` of calls were throttled. Workers are multiplied by `decrease`.
+            latency: mean latency is over `max_latency` times the fastest window seen. One worker is removed.
+            rate_limited: workers spent more than `max_waiting` of their time waiting for tokens. Adding workers
+                          would only add waiting, so the workers are kept.
+            backlog: jobs backed up. `step` workers are added.
+            idle: no jobs backed up. One worker is removed.
+
+        Every decision is logged, at info level when it changes the workers.
+
+        :param bounds: Workers kept between
+        :type bounds: Bounds
+        :param ebs: Boss EBSSnapshot
+        :type ebs: EBSSnapshot
+        :param window: Seconds of calls each decision is made from
+        :type window: float
+        :param step: Workers added at once
+        :type step: int
+        :param decrease: Factor the workers are multiplied by when throttled
+        :type decrease: float
+        :param max_throttle: Fraction of calls throttled over which workers are removed
+        :type max_throttle: float
+        :param max_latency: Times the fastest mean latency over which workers are removed
+        :type max_latency: float
+        :param max_waiting: Fraction of worker time spent waiting for tokens over which workers are not added
+        :type max_waiting: float
+        """
+        self.bounds = bounds
+        self.ebs = ebs
+        self.window = window
+        self.step = step
+        self.decrease = decrease
+        self.max_throttle = max_throttle
+        self.max_latency = max_latency
+        self.max_waiting = max_waiting
+        self.counter = collections.Counter(scaled_up=0, scaled_down=0, peak_workers=0)
+        self.baseline = None
+        self.logger = snapshot.getLogger('ebssnapshot.Autoscaler')
+        self._totals = ebs.ratelimiter().totals()
+        self._started = time.time()
+        self._backlog = []
+
+    def sample(self, backlog):
+        """
+        Record the jobs backed up in the boss
+
+        :type backlog: int
+        """
+        self._backlog.append(backlog)
+
+    def decide(self, workers):
+        """
+        Decide how many workers to use once a window has passed since the last decision
+
+        :param workers: Workers in use
+        :type workers: int
+        :return: Workers to use, or None within a window of the last decision
+        :rtype: int
+        """
+        self.counter['peak_workers'] = max(self.counter['peak_workers'], workers)
+        now = time.time()
+        elapsed = now - self._started
+        if elapsed < self.window or not workers:
+            return None
+
+        totals = self.ebs.ratelimiter().totals()
+        delta = collections.Counter(totals)
+        delta.subtract(self._totals)
+        calls = delta['calls']
+        throttled = float(delta['throttles']) / calls if calls else 0.0
+        latency = float(delta['latency']) / delta['responses'] if delta['responses'] else None
+        waiting = float(delta['waited']) / (elapsed * workers) if elapsed else 0.0
+        backlog = float(sum(self._backlog)) / len(self._backlog) if self._backlog else 0.0
+        if latency is not None and not delta['throttles'] and (self.baseline is None or latency < self.baseline):
+            self.baseline = latency
+
+        if throttled > self.max_throttle:
+            reason, target = 'throttled', int(workers * self.decrease)
+        elif latency is not None and self.baseline and latency > self.baseline * self.max_latency:
+            reason, target = 'latency', workers - 1
+        elif waiting > self.max_waiting:
+            reason, target = 'rate_limited', workers
+        elif backlog >= 1:
+            reason, target = 'backlog', workers + self.step
+        else:
+            reason, target = 'idle', workers - 1
+        target = self.bounds.clamp(target)
+
+        log = collections.OrderedDict()
+        log['action'] = 'autoscale'
+        log['uuid'] = self.ebs.uuid
+        log['result'] = 'success'
+        log['region'] = self.ebs.region
+        log['Workers'] = workers
+        log['Target'] = target
+        log['Reason'] = reason
+        log['Calls'] = int(calls)
+        log['Throttled'] = round(throttled, 4)
+        log['LatencyMs'] = None if latency is None else round(latency * 1000, 1)
+        log['BaselineMs'] = None if self.baseline is None else round(self.baseline * 1000, 1)
+        log['Waiting'] = round(waiting, 3)
+        log['Backlog'] = round(backlog, 1)
+        if target != workers:
+            self.counter['scaled_up' if target > workers else 'scaled_down'] += 1
+            self.logger.info(log)
+        else:
+            self.logger.debug(log)
+
+        self._totals = totals
+        self._started = now
+        self._backlog = []
+        return target
+
+
+def capacity(ebs):
+    """
+    Most workers a run may have at once
+
+    :type ebs: EBSSnapshot
+    :rtype: int
+    """
+    if ebs.autoscale:
+        return ebs.autoscale.maximum
+    return ebs.workers
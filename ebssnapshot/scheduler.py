@@ -0,0 +1,87 @@
+import calendar
+import heapq
+import itertools
+
+
+# Volume tag holding the priority of a volume. Higher integers are dispatched first, untagged volumes are 0.
+PRIORITY_TAG = 'backup-priority'
+
+# Seconds of snapshot history used to rank volumes by the age of their latest snapshot. Volumes without a snapshot
+# in the window rank as the oldest.
+AGE_WINDOW = 7 * 86400
+
+
+class Scheduler:
+    def __init__(self, capacity, latest=None):
+        """
+        Reorder a stream of volumes so the most important volumes are dispatched first. E.G.
+
+        stream.stage(Scheduler(10000, ebs.latest_snapshots(AGE_WINDOW)).stage)
+
+        Volumes are ranked by the integer value of their backup-priority tag, then by the start time of their latest
+        snapshot, oldest first, then by size, largest first. Large volumes take the longest to snapshot.
+
+        At most `capacity` volumes are held in a heap. Once it is full every volume streamed in releases the highest
+        ranked volume held, and the volumes left are released in order once the stream is exhausted. The order is
+        exact when the stream holds no more than `capacity` volumes, otherwise volumes are only reordered within a
+        window of `capacity` volumes. No volume is dispatched before the heap fills or the stream ends.
+
+        :param capacity: Volumes held at most
+        :type capacity: int
+        :param latest: Latest snapshot by VolumeId, as returned by `py:function:: EBSSnapshot.latest_snapshots`
+        :type latest: dict
+        """
+        self.capacity = capacity
+        self.latest = latest or {}
+        self.peak = 0
+
+    def rank(self, volume):
+        """
+        :return: Sort key of a volume. Lower keys are dispatched first.
+        :rtype: tuple
+        """
+        snap = self.latest.get(volume['VolumeId'])
+        started = calendar.timegm(snap['StartTime'].utctimetuple()) if snap else float('-inf')
+        return -priority(volume), started, -volume.get('Size', 0)
+
+    def stage(self, batches):
+        """
+        Pipeline stage. See `py:function:: pipeline.Pipeline.stage`.
+
+        :param batches: Iterable of lists of volumes
+        :rtype: generator
+        """
+        heap = []
+        sequence = itertools.count()
+        for batch in batches:
+            released = []
+            for volume in batch:
+                # The sequence keeps volumes of equal rank in stream order
+                entry = (self.rank(volume), next(sequence), volume)
+                if len(heap) < self.capacity:
+                    heapq.heappush(heap, entry)
+                else:
+                    released.append(heapq.heappushpop(heap, entry)[2])
+            self.peak = max(self.peak, len(heap))
+            if released:
+                yield released
+
+        if heap:
+            yield [heapq.heappop(heap)[2] for _ in range(len(heap))]
+
+
+#
+# Utilities
+#
+def priority(volume):
+    """
+    :return: Integer value of the backup-priority tag of a volume. 0 if it is missing or not an integer.
+    :rtype: int
+    """
+    for tag in volume.get('Tags', []):
+        if tag['Key'] == PRIORITY_TAG:
+            try:
+                return int(tag['Value'])
+            except ValueError:
+                return 0
+    return 0
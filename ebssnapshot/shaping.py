@@ -0,0 +1,272 @@
+import collections
+import heapq
+import itertools
+import time
+
+from botocore.exceptions import ClientError
+from Queue import Empty
+
+
+# CreateSnapshot and CreateSnapshots error codes that defer a volume instead of failing it
+DEFER_CODES = ('SnapshotCreationPerVolumeRateExceeded', 'ConcurrentSnapshotLimitExceeded')
+
+# Seconds a deferred item waits before it is dispatched again, multiplied by the number of times it was deferred.
+# EC2 asks for at least 15 seconds between snapshots of a volume.
+DEFER_DELAY = 15
+
+# Times an item is deferred before it is given up on
+MAX_DEFERRALS = 10
+
+# Seconds the boss waits for a signal before checking that workers are still alive
+SIGNAL_INTERVAL = 5
+
+# Signals. Workers signal the outcome of every item dispatched, the completion tracker signals finished snapshots.
+CREATED = 'created'
+FAILED = 'failed'
+DEFERRED = 'deferred'
+COMPLETED = 'completed'
+
+
+class Limits:
+    SCOPES = ('account', 'zone', 'volume')
+
+    def __init__(self, account=0, zone=0, volume=1):
+        """
+        Limits on the snapshots in flight, from dispatch until the snapshot completes. 0 is unlimited.
+
+        :param account: Snapshots in flight in the account and region
+        :type account: int
+        :param zone: Snapshots in flight per availability zone
+        :type zone: int
+        :param volume: Snapshots in flight per volume
+        :type volume: int
+        """
+        self.account = account
+        self.zone = zone
+        self.volume = volume
+
+    @classmethod
+    def parse(cls, spec):
+        """
+        Limits from a spec string. E.G. "account=100,zone=25,volume=1"
+
+        :param spec: Comma separated scope=limit pairs
+        :type spec: basestring
+        :rtype: Limits
+        :raises ValueError: Unknown scope or invalid limit
+        """
+        kwargs = {}
+        for part in spec.split(','):
+            if not part.strip():
+                continue
+            name, _, value = part.partition('=')
+            name = name.strip()
+            if name not in cls.SCOPES:
+                raise ValueError('Unknown pending snapshot scope {name} in "{spec}"'.format(**locals()))
+            kwargs[name] = int(value)
+            if kwargs[name] < 0:
+                raise ValueError('Negative pending snapshot limit in "{spec}"'.format(**locals()))
+        return cls(**kwargs)
+
+
+class Shaper:
+    def __init__(self, limits, size, delay=DEFER_DELAY, max_deferrals=MAX_DEFERRALS, interval=SIGNAL_INTERVAL):
+        """
+        Admit volumes to a create run only while the snapshots in flight are under the limits of their account, zone
+        and volume. E.G.
+
+        shaper = Shaper(Limits(account=100, zone=25), size=10)
+        signals = shaper.start(queue)
+        boss dispatches shaper.stage(batches, alive)
+
+        A volume holds its slots from dispatch until its worker signals that creating its snapshot failed or was
+        deferred, or until the completion tracker signals that its snapshot completed. Volumes over a limit are held
+        by the boss, which waits for signals. Volumes deferred by EC2 give back their slots and are dispatched again
+        after `delay` seconds times the number of deferrals, at most `max_deferrals` times. The shaper runs in the
+        boss. Workers reach it through the signal queue.
+
+        :param limits: Limits on the snapshots in flight
+        :type limits: Limits
+        :param size: Items per job sent to a worker
+        :type size: int
+        :param delay: Seconds a deferred item waits, multiplied by the number of times it was deferred
+        :type delay: float
+        :param max_deferrals: Times an item is deferred before it is given up on
+        :type max_deferrals: int
+        :param interval: Seconds to wait for a signal before checking that workers are still alive
+        :type interval: float
+        """
+        self.limits = limits
+        self.size = size
+        self.delay = delay
+        self.max_deferrals = max_deferrals
+        self.interval = interval
+        self.counter = collections.Counter(redispatched=0, deferral_exhausted=0, admission_waits=0)
+        self.inflight = collections.Counter()
+        self.peak = collections.Counter()
+        self._slots = {}
+        self._dispatched = set()
+        self._deferred = []
+        self._deferrals = collections.Counter()
+        self._sequence = itertools.count()
+        self._signals = None
+        self._exhausted = []
+
+    def start(self, queue):
+        """
+        :param queue: Queue workers and the completion tracker put (signal, payload) on
+        :return: The queue
+        """
+        self._signals = queue
+        return queue
+
+    def stage(self, batches, alive=None):
+        """
+        Admit the items of a stream of batches as capacity frees up. Ends once the stream is exhausted and every item
+        dispatched has either been created or given up on.
+
+        :param batches: Iterable of lists of volumes and InstanceGroups
+        :param alive: Called to check that workers are still alive while waiting for signals
+        :type alive: Callable
+        :rtype: generator
+        """
+        source = (item for batch in batches for item in batch)
+        admitted = []
+        item = None
+        while True:
+            self._receive(0)
+            if item is None:
+                item = self._ready() or next(source, None)
+
+            if item is None:
+                if admitted:
+                    yield admitted
+                    admitted = []
+                if not self._deferred and not self._dispatched:
+                    return
+                if alive and not alive():
+                    return
+                self._receive(self._wait())
+                continue
+
+            if self._admit(item):
+                admitted.append(item)
+                item = None
+                if len(admitted) >= self.size:
+                    yield admitted
+                    admitted = []
+                continue
+
+            if admitted:
+                yield admitted
+                admitted = []
+            if alive and not alive():
+                return
+            self.counter['admission_waits'] += 1
+            self._receive(self._wait())
+
+    def exhausted(self):
+        """
+        :return: Items deferred `max_deferrals` times
+        :rtype: list
+        """
+        return list(self._exhausted)
+
+    #
+    # Internals
+    #
+    def _admit(self, item):
+        needed = collections.Counter()
+        for volume in item_volumes(item):
+            for key in self._keys(volume):
+                needed[key] += 1
+
+        for key, count in needed.items():
+            limit = getattr(self.limits, key[0])
+            # A scope with nothing in flight always admits, so a group larger than a limit cannot stall the run
+            if limit and self.inflight[key] and self.inflight[key] + count > limit:
+                return False
+
+        for volume in item_volumes(item):
+            keys = self._keys(volume)
+            for key in keys:
+                self.inflight[key] += 1
+                self.peak[key[0]] = max(self.peak[key[0]], self.inflight[key])
+            self._slots[volume['VolumeId']] = keys
+            self._dispatched.add(volume['VolumeId'])
+        return True
+
+    def _keys(self, volume):
+        return [('account', None), ('zone', volume.get('AvailabilityZone')), ('volume', volume['VolumeId'])]
+
+    def _release(self, volume_id):
+        self._dispatched.discard(volume_id)
+        for key in self._slots.pop(volume_id, []):
+            self.inflight[key] -= 1
+            if not self.inflight[key]:
+                del self.inflight[key]
+
+    def _receive(self, timeout):
+        """
+        Apply the signals received, waiting up to `timeout` seconds for the first one
+        """
+        block = timeout > 0
+        while True:
+            try:
+                signal, payload = self._signals.get(block, timeout) if block else self._signals.get_nowait()
+            except Empty:
+                return
+            block = False
+
+            if signal == CREATED:
+                self._dispatched.discard(payload)
+            elif signal in (FAILED, COMPLETED):
+                self._release(payload)
+            elif signal == DEFERRED:
+                for volume in item_volumes(payload):
+                    self._release(volume['VolumeId'])
+                self._defer(payload)
+
+    def _defer(self, item):
+        key = _key(item)
+        self._deferrals[key] += 1
+        if self._deferrals[key] > self.max_deferrals:
+            self.counter['deferral_exhausted'] += 1
+            self._exhausted.append(item)
+            return
+        ready = time.time() + self.delay * self._deferrals[key]
+        heapq.heappush(self._deferred, (ready, next(self._sequence), item))
+
+    def _ready(self):
+        if self._deferred and self._deferred[0][0] <= time.time():
+            self.counter['redispatched'] += 1
+            return heapq.heappop(self._deferred)[2]
+        return None
+
+    def _wait(self):
+        if self._deferred:
+            return min(max(self._deferred[0][0] - time.time(), 0.01), self.interval)
+        return self.interval
+
+
+#
+# Utilities
+#
+def deferred(error):
+    """
+    :return: Whether a create call failed with an error that defers the volume
+    :rtype: bool
+    """
+    return isinstance(error, ClientError) and error.response.get('Error', {}).get('Code') in DEFER_CODES
+
+
+def item_volumes(item):
+    """
+    :return: Volumes of a volume or InstanceGroup
+    :rtype: list
+    """
+    return item.Volumes if hasattr(item, 'Volumes') else [item]
+
+
+def _key(item):
+    return item.InstanceId if hasattr(item, 'InstanceId') else item['VolumeId']
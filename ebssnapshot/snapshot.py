@@ -1,24 +1,59 @@
 import backoff
-import boto3
 import collections
 import getpass
 import logging
 import multiprocessing
 import os
-import placebo
-import json
 import signal
 import socket
 import sys
+import threading
+import time
 import uuid
 
+import clients
+import completion
+import credentials
+import executor
+import inventory
+import journal
+import logs
 import metadata
+import metrics
+import pipeline
+import ratelimit
+import scaling
+import scheduler
+import shaping
+import supervisor
 
 from botocore.exceptions import ClientError
-from botocore.client import Config
 from datetime import datetime, timedelta
 from dateutil.tz import tzutc
-from multiprocessing import Process, JoinableQueue
+
+# Seconds the boss blocks on a full job queue before checking that workers are still alive
+LIVENESS_INTERVAL = 5
+
+# Job queue capacity per worker
+QUEUE_DEPTH = 2
+
+# Items returned per describe call. DescribeVolumes returns at most 500 and DescribeSnapshots at most 1000.
+PAGE_SIZE = 1000
+
+# Items per job sent to a worker
+BATCH_SIZE = 10
+
+# EC2 accepts at most 200 values per filter
+FILTER_VALUES = 200
+
+# Tag carrying the idempotency token of a snapshot
+TOKEN_TAG = 'backup-token'
+
+# Worker results counted as items processed
+RESULTS = ('success', 'error', 'skipped')
+
+# Volumes of an instance snapshotted together by one CreateSnapshots call
+InstanceGroup = collections.namedtuple('InstanceGroup', ['InstanceId', 'ExcludeBootVolume', 'Volumes'])
 
 
 #
@@ -27,23 +62,27 @@ from multiprocessing import Process, JoinableQueue
 class Filter(logging.Filter):
     def filter(self, record):
         """
-        Render as a json string
+        Render as a json string. Rendering is deferred until a handler formats the record, see `py:class::
+        logs.Message`.
         """
-        if isinstance(record.msg, collections.OrderedDict) or isinstance(record.msg, dict) or isinstance(record.msg, list):
-            msg = "uuid={uuid} action={action} result={result} json='{msg}'".format(msg=json.dumps(record.msg), **record.msg)
-            record.msg = msg
+        if isinstance(record.msg, dict):
+            record.msg = logs.Message(record.msg)
 
         allow = True
         return allow
 
 
+# Shared by every logger so that getLogger does not add a filter per call
+FILTER = Filter()
+
+
 def getLogger(name):
     """
     Logging setup
     :return:
     """
     logger = logging.getLogger(name)
-    logger.addFilter(Filter())
+    logger.addFilter(FILTER)
     return logger
 
 
@@ -60,7 +99,8 @@ class EC2Connection:
         :type identifier: basestring
         :param retries: The number of retries. Defaults to 4
         :type identifier: int
-        :param role: The IAM role ARN to assume. Ignored if not specified
+        :param role: The IAM role ARN to assume, or a comma separated role chain assumed left to right. Ignored if not
+                     specified
         :type identifier: basestring
         :param connecttimeout: Boto3 connection timeout
         :type connecttimeout: int
@@ -74,8 +114,10 @@ class EC2Connection:
         self._retries = retries
         self._recorder = None
         self._ec2 = None
+        self._ec2_config = None
         self._sess = None
         self._config = None
+        self._clients = None
         self._caller_identity = None
         self._config = self.config()
         self.role = role
@@ -83,13 +125,18 @@ class EC2Connection:
 
     def config(self, config=None):
         """
-        AWS config
+        AWS config. Replacing it drops the client created from the previous config, so that the next connection uses
+        the new one. E.G. a connection pool resized for the workers after the boss listed image snapshots.
         :param config:
         :return:
         """
         if config:
+            if self._ec2_config is not None and config is not self._ec2_config:
+                self._ec2 = None
+                self._ec2_config = None
             self._config = config
         elif not self._config:
+            from botocore.client import Config
             self._config = Config(connect_timeout=self.connecttimeout, read_timeout=self.readtimeout)
 
         return self._config
@@ -105,11 +152,13 @@ class EC2Connection:
         """
         if conn:
             self._ec2 = conn
+            self._ec2_config = None
 
         if not self._ec2:
-            sess = self.session()
+            self.session()
             try:
-                self._ec2 = sess.client('ec2', region_name=self.region, config=self._config)
+                self._ec2 = self.clients().client('ec2', self.region, self._config)
+                self._ec2_config = self._config
 
             except Exception as msg:
                 self.logger.exception(msg)
@@ -124,12 +173,29 @@ class EC2Connection:
         :return:
         """
         if not self._caller_identity:
-            self._caller_identity = self._sess.client('sts').get_caller_identity()
+            self._caller_identity = self.clients().identity()
         return self._caller_identity
 
+    def clients(self, pool=None):
+        """
+        Create or reuse the client pool of the session. The session is created if it was not set.
+
+        :param pool: Set optional client pool. Its session replaces the session.
+        :type pool: clients.ClientPool
+        :rtype: clients.ClientPool
+        """
+        if pool:
+            self._clients = pool
+            self._sess = pool.session
+        elif not self._clients or self._clients.session is not self._sess:
+            self._clients = clients.ClientPool(self._sess or self.session())
+
+        return self._clients
+
     def session(self, sess=None):
         """
-        Create or reuse a session
+        Create or reuse a session. Assumed role credentials are refreshed ahead of expiry, see
+        `py:function:: credentials.assume_role_session`.
 
         :param sess: Set optional session object
         :type sess: boto3.session.Session
@@ -140,42 +206,102 @@ class EC2Connection:
             self._sess = sess
 
         if not self._sess:
+            # boto3 and placebo are imported where they are first needed, so the CLI starts without loading them
+            import boto3
+
             try:
                 if self.role is not None:
-                    client = boto3.client('sts', region_name=self.region)
-
-                    rsp = client.assume_role(
-                        RoleArn=self.role,
-                        RoleSessionName='EBSSnapshot-' + self.region)
-
-                    creds = rsp['Credentials']
-                    self._sess = boto3.session.Session(
-                        region_name=self.region,
-                        aws_access_key_id=creds['AccessKeyId'],
-                        aws_secret_access_key=creds['SecretAccessKey'],
-                        aws_session_token=creds['SessionToken'])
+                    self._sess = credentials.assume_role_session(self.role, region=self.region,
+                                                                 name='EBSSnapshot-' + self.region)
 
                 else:
                     self._sess = boto3.session.Session()
             except Exception as msg:
                 self.logger.exception(str(msg))
 
-        self.aws_identity()
+        if self._sess:
+            self.aws_identity()
         return self._sess
 
     def record(self, directory):
         """
-        Use Placebo to record the session
+        Use Placebo to record the session. Placebo is an optional dependency.
 
         :param directory:
         :return:
+        :raises ImportError: Placebo is not installed
         """
+        try:
+            import placebo
+        except ImportError:
+            raise ImportError('Recording a session requires placebo. Install it with: pip install ebssnapshot[record]')
+
         if not os.path.exists(directory):
             os.makedirs(directory)
         self._recorder = placebo.attach(self.session(), data_path=directory)
         self._recorder.record()
 
 
+class RunContext:
+    def __init__(self, description, identifier, identity=None):
+        """
+        Constants for the duration of a run. Computed once by the boss and shared with the workers.
+
+        :param description: Text describing function. Used for the backup-desc tag.
+        :type description: basestring
+        :param identifier: Run UUID
+        :type identifier: basestring
+        :param identity: Caller identity as returned by STS GetCallerIdentity
+        :type identity: dict
+        """
+        self.description = description
+        self.uuid = identifier
+        self.identity = identity or {}
+        self.host = socket.getfqdn()
+        self.user = getpass.getuser()
+        self.uid = str(os.getuid())
+        self.euid = str(os.geteuid())
+        self.tags = [
+            {'Key': 'backup-desc', 'Value': self.description},
+            {'Key': 'backup-uuid', 'Value': self.uuid},
+            {'Key': 'backup-version', 'Value': metadata.__version__},
+            {'Key': 'backup-delete-protection', 'Value': 'false'},
+            {'Key': 'backup-host', 'Value': self.host},
+            {'Key': 'backup-user', 'Value': self.user},
+            {'Key': 'backup-uid', 'Value': self.uid},
+            {'Key': 'backup-euid', 'Value': self.euid},
+        ]
+
+    def tag_specifications(self, volume):
+        """
+        Snapshot TagSpecifications. The run tags and the idempotency token of the volume, followed by the volume tags.
+
+        :param volume: Individual record as yielded by `py:function:: EBSSnapshot.volumes`
+        :type volume: dict
+        :rtype: list
+        """
+        return [{'ResourceType': 'snapshot', 'Tags': self.tags + self.token_tags(volume['VolumeId']) +
+                 volume.get('Tags', [])}]
+
+    def token(self, resource_id):
+        """
+        Idempotency token of the snapshots created for a volume or an instance by this run. CreateSnapshot and
+        CreateSnapshots take no ClientToken, so the token is written to the backup-token tag instead.
+
+        :param resource_id: VolumeId or InstanceId
+        :type resource_id: basestring
+        :rtype: basestring
+        """
+        return '{uuid}:{resource_id}'.format(uuid=self.uuid, resource_id=resource_id)
+
+    def token_tags(self, resource_id):
+        """
+        :return: backup-token tag of a volume or an instance
+        :rtype: list
+        """
+        return [{'Key': TOKEN_TAG, 'Value': self.token(resource_id)}]
+
+
 #
 # Application
 #
@@ -193,7 +319,10 @@ def giveup(client_error):
 
 
 class EBSSnapshot(EC2Connection):
-    def __init__(self, region=None, desc=None, workers=4, identifier=None, retries=4, role=None, connecttimeout=5, readtimeout=3600):
+    def __init__(self, region=None, desc=None, workers=4, identifier=None, retries=4, role=None, connecttimeout=5, readtimeout=3600,
+                 executor='process', rate=10.0, page_size=PAGE_SIZE, batch=BATCH_SIZE, inventory=None,
+                 instances=False, journal=None, dedup=0, wait=0, metrics=None, schedule=0, pending=None,
+                 autoscale=None):
         """
         EBS snapshot class. E.G.
 
@@ -203,96 +332,503 @@ class EBSSnapshot(EC2Connection):
         :param region: Name of aws region
         :param desc: Text describing function. Used for logging and creates a AWS tag against the snapshot.
         :param workers: Number of process/thread workers to initiate
-        :param role: role ARN to assume
+        :param role: role ARN, or comma separated role chain, to assume
         :param connecttimeout: Connection timeout
         :type connecttimeout: int
         :param readtimeout: Read timeout
         :type readtimeout: int
+        :param executor: Worker backend. process | thread
+        :type executor: basestring
+        :param rate: Initial calls per second for each rate limited API action
+        :type rate: float
+        :param page_size: Items returned per describe call
+        :type page_size: int
+        :param batch: Items per job sent to a worker
+        :type batch: int
+        :param inventory: List volumes and snapshots from a local cache instead of describing them on every run
+        :type inventory: inventory.Inventory
+        :param instances: Snapshot the volumes of an instance together with one CreateSnapshots call
+        :type instances: bool
+        :param journal: Record dispatched and completed items, and skip the items completed by an earlier attempt of
+                        the run. The run is identified by `identifier`.
+        :type journal: journal.Journal
+        :param dedup: Skip volumes with a pending snapshot or a snapshot started in the last `dedup` seconds by any
+                      run. 0 disables.
+        :type dedup: int
+        :param wait: Track the snapshots created until they complete, waiting at most `wait` seconds once every
+                     snapshot has been created. 0 disables. See `py:class:: completion.CompletionTracker`.
+        :type wait: int
+        :param metrics: Record API, queue, worker and run metrics
+        :type metrics: metrics.Metrics
+        :param schedule: Dispatch the most important volumes first, reordering them within a window of `schedule`
+                         volumes. 0 disables. See `py:class:: scheduler.Scheduler`.
+        :type schedule: int
+        :param pending: Limit the snapshots in flight per account, availability zone and volume, admitting volumes as
+                        snapshots complete. Volumes EC2 defers are dispatched again. See `py:class:: shaping.Shaper`.
+        :type pending: shaping.Limits
+        :param autoscale: Add and remove workers within these bounds from the latency, throttling and backlog of the
+                          run, starting from `workers`. See `py:class:: scaling.Autoscaler`.
+        :type autoscale: scaling.Bounds
         """
         EC2Connection.__init__(self, region=region, identifier=identifier, retries=retries, role=role, connecttimeout=connecttimeout, readtimeout=readtimeout)
         self.description = desc or 'EBSSnapshot script'
         self.workers = workers
+        self.executor = executor
+        self.rate = rate
+        self.page_size = page_size
+        self.batch = batch
+        self.inventory = inventory
+        self.instances = instances
+        self.journal = journal
+        self.dedup = dedup
+        self.wait = wait
+        self.metrics = metrics
+        self.schedule = schedule
+        self.pending = pending
+        self.autoscale = autoscale
+        self._completions = None
+        self._signals = None
+        self._context = None
+        self._ratelimiter = None
+        self._supervision = None
         self.logger = getLogger('ebssnapshot.EBSSnapshot')
 
-    def volumes(self, filters=None, PageSize=10000):
+    def clone(self):
+        """
+        Copy of this EBSSnapshot sharing the same client pool, run context, rate limiter, completion and signal queues,
+        supervision channel and caller identity. Used by process workers. The copy records to a metrics registry of its own, returned to the boss
+        when the worker exits.
+
+        :rtype: EBSSnapshot
+        """
+        ebs = EBSSnapshot(region=self.region, desc=self.description, workers=self.workers, identifier=self.uuid,
+                          retries=self._retries, role=self.role, connecttimeout=self.connecttimeout,
+                          readtimeout=self.readtimeout, executor=self.executor, rate=self.rate,
+                          page_size=self.page_size, batch=self.batch, inventory=self.inventory,
+                          instances=self.instances, journal=self.journal, dedup=self.dedup, wait=self.wait,
+                          metrics=metrics.Metrics() if self.metrics else None, schedule=self.schedule,
+                          pending=self.pending, autoscale=self.autoscale)
+        ebs.config(self.config())
+        ebs._completions = self._completions
+        ebs._signals = self._signals
+        ebs._context = self._context
+        ebs._ratelimiter = self._ratelimiter
+        ebs._supervision = self._supervision
+        ebs._caller_identity = self._caller_identity
+        ebs.clients(self.clients())
+        return ebs
+
+    def connection(self, conn=None):
+        """
+        Connect or reuse a connection. New botocore clients are rate limited by
+        `py:function:: EBSSnapshot.ratelimiter`, and instrumented if metrics are recorded
+
+        :param conn: Set optional connection object
+        :type conn: boto.core.EC2
+        :return: EC2 client
+        :rtype: boto3.EC2
+        """
+        previous = self._ec2
+        ec2 = EC2Connection.connection(self, conn)
+        if ec2 is not previous and hasattr(ec2, 'meta'):
+            self.ratelimiter().attach(ec2, self.metrics)
+            if self.metrics:
+                self.metrics.attach(ec2)
+
+        return ec2
+
+    def ratelimiter(self, limiter=None):
+        """
+        Create or reuse the rate limiter. Shared with workers, so it has to be created before they are started.
+
+        :param limiter: Set optional rate limiter
+        :type limiter: ratelimit.RateLimiter
+        :rtype: ratelimit.RateLimiter
+        """
+        if limiter:
+            self._ratelimiter = limiter
+        elif not self._ratelimiter:
+            self._ratelimiter = ratelimit.RateLimiter(region=self.region, rate=self.rate)
+
+        return self._ratelimiter
+
+    def context(self, ctx=None):
+        """
+        Create or reuse the run context
+
+        :param ctx: Set optional run context
+        :type ctx: RunContext
+        :rtype: RunContext
+        """
+        if ctx:
+            self._context = ctx
+        elif not self._context:
+            self._context = RunContext(self.description, self.uuid, self.aws_identity())
+
+        return self._context
+
+    def volumes(self, filters=None, PageSize=None):
         """
         List volumes
 
         :param filters: List of AWS snapshot filters
         :type filters: list
-        :param PageSize: Paginate size
+        :param PageSize: Paginate size. Defaults to the page_size of this EBSSnapshot.
+        :type PageSize: int
+        :rtype: generator
+        """
+        for page in self.volume_pages(filters=filters, PageSize=PageSize):
+            for volume in page:
+                yield volume
+
+    def volume_pages(self, filters=None, PageSize=None):
+        """
+        List volumes a describe page at a time
+
+        :param filters: List of AWS snapshot filters
+        :type filters: list
+        :param PageSize: Paginate size. Defaults to the page_size of this EBSSnapshot.
         :type PageSize: int
         :rtype: generator
         """
         ec2 = self.connection()
         paginator = ec2.get_paginator('describe_volumes')
 
-        results = None
+        kwargs = {'PaginationConfig': {'PageSize': PageSize or self.page_size}}
         if filters:
-            results = paginator.paginate(Filters=filters, PaginationConfig={'PageSize': PageSize})
-        else:
-            results = paginator.paginate(PaginationConfig={'PageSize': PageSize})
+            kwargs['Filters'] = filters
 
-        for result in results:
-            for volume in result['Volumes']:
-                yield volume
+        for result in paginator.paginate(**kwargs):
+            yield result['Volumes']
 
-    def snapshots(self, filters=None, PageSize=10000):
+    def snapshots(self, filters=None, PageSize=None, owner_ids=None):
         """
         List snapshots
 
         :param filters: List of AWS snapshot filters
         :type filters: list
-        :param PageSize: Paginate size
+        :param PageSize: Paginate size. Defaults to the page_size of this EBSSnapshot.
+        :type PageSize: int
+        :param owner_ids: Only list snapshots owned by these accounts. E.G. ['self']
+        :type owner_ids: list
+        :rtype: generator
+        """
+        for page in self.snapshot_pages(filters=filters, PageSize=PageSize, owner_ids=owner_ids):
+            for snapshot in page:
+                yield snapshot
+
+    def snapshot_pages(self, filters=None, PageSize=None, owner_ids=None):
+        """
+        List snapshots a describe page at a time
+
+        :param filters: List of AWS snapshot filters
+        :type filters: list
+        :param PageSize: Paginate size. Defaults to the page_size of this EBSSnapshot.
         :type PageSize: int
+        :param owner_ids: Only list snapshots owned by these accounts. E.G. ['self']
+        :type owner_ids: list
         :rtype: generator
         """
         ec2 = self.connection()
         paginator = ec2.get_paginator('describe_snapshots')
 
-        results = None
+        kwargs = {'PaginationConfig': {'PageSize': PageSize or self.page_size}}
         if filters:
-            results = paginator.paginate(Filters=filters, PaginationConfig={'PageSize': PageSize})
-        else:
-            results = paginator.paginate(PaginationConfig={'PageSize': PageSize})
+            kwargs['Filters'] = filters
+        if owner_ids:
+            kwargs['OwnerIds'] = owner_ids
 
-        for result in results:
-            for snapshot in result['Snapshots']:
-                yield snapshot
+        for result in paginator.paginate(**kwargs):
+            yield result['Snapshots']
+
+    def image_snapshots(self):
+        """
+        Index of the snapshots backing images registered by the account. Deleting one fails with
+        InvalidSnapshot.InUse. Images are described in one pass, paginated where botocore supports it. If images
+        cannot be described the index is empty and in use snapshots are skipped when their delete fails, as before.
+
+        :return: SnapshotIds
+        :rtype: set
+        """
+        ec2 = self.connection()
+        in_use = set()
+        try:
+            if ec2.can_paginate('describe_images'):
+                pages = (result['Images'] for result in ec2.get_paginator('describe_images').paginate(
+                    Owners=['self'], PaginationConfig={'PageSize': self.page_size}))
+            else:
+                pages = [ec2.describe_images(Owners=['self'])['Images']]
+
+            for page in pages:
+                for image in page:
+                    for mapping in image.get('BlockDeviceMappings', []):
+                        if mapping.get('Ebs', {}).get('SnapshotId'):
+                            in_use.add(mapping['Ebs']['SnapshotId'])
+        except ClientError as msg:
+            log = collections.OrderedDict()
+            log['action'] = 'describe_images'
+            log['uuid'] = self.uuid
+            log['result'] = 'error'
+            log['region'] = self.region
+            log['error'] = str(msg)
+            self.logger.warning(log)
+            return set()
+
+        return in_use
 
-    def create_snapshot_boss(self, filters=None):
+    def create_snapshot_boss(self, filters=None, plan=None):
         """
         Run the worker pool to create snapshots across multiple processes/threads
 
+        Volumes are streamed a describe page at a time, with the next page fetched while the current one is
+        dispatched, and sent to workers in batches. With an inventory, volumes are read from the cache after it is
+        refreshed. With dedup set, volumes already snapshotted recently are dropped, see
+        `py:function:: EBSSnapshot.deduplicate`. With instances set, the volumes of an instance are snapshotted
+        together, see `py:function:: EBSSnapshot.group_instances`. With a journal, volumes completed by an earlier
+        attempt of the run are skipped, see `py:function:: EBSSnapshot.reconcile`. With wait set, the boss polls the
+        snapshots created until they complete.
+
         :param filters: List of AWS filters
         :type filters: list
+        :param plan: Add the volumes to this plan instead of snapshotting them. See
+                     `py:function:: EBSSnapshot.apply_plan`.
+        :type plan: plan.Plan
+        :return: Run summary as returned by `py:function:: boss`, plus the number of volumes described, deduplicated
+                 and queued, the number of instances and volumes grouped, and with wait set the number of snapshots
+                 tracked, completed, failed and stuck
+        :rtype: dict
+        """
+        if self.inventory:
+            source = self.inventory.volume_pages(self, filters=filters)
+        else:
+            source = pipeline.prefetch(self.volume_pages(filters=filters))
+
+        stream = pipeline.Pipeline(source)
+        stream.count('described')
+        # Plans are sorted by VolumeId, so volumes are scheduled when the plan is applied
+        latest = self._latest(schedule=plan is None)
+        if self.dedup:
+            self.deduplicate(stream, latest)
+        stream.count('queued')
+        if plan is not None:
+            return self._plan(plan, stream, 'create_snapshot')
+
+        if self.schedule:
+            self.prioritise(stream, latest)
+
+        if self.journal:
+            self._track(stream, 'create_snapshot')
+        if self.instances:
+            stream.stage(lambda batches: self.group_instances(batches, stream.counter))
+        return self._run(create_worker, stream.batch(self.batch), 'create_snapshot_boss', track=True)
+
+    def deduplicate(self, stream, latest=None):
         """
+        Drop the volumes of a pipeline that have a pending snapshot, or a snapshot started in the last `dedup`
+        seconds, so that overlapping or repeated runs do not snapshot a volume twice. Dropped volumes are counted as
+        'deduplicated'. Failed snapshots do not count.
 
-        def worker(workerid, jobqueue, region=None, desc=None, uuid=None, role=None, sess=None):
-            """
-            :param workerid: Worker ID
-            :type workerid: int
-            :param jobqueue: Multi Producer and Consumer Queue
-            :type jobqueue: JoinableQueue
-            :param region: AWS region
-            :type region: basestring
-            :param desc: Descriptive text used to log
-            :param role: role ARN to assume
-            :type desc: basestring
-            """
-            ebs = EBSSnapshot(desc=desc, region=region, identifier=uuid, role=role)
-            ebs.session(sess)
-            while ebs:
-                volume = jobqueue.get()
-                try:
-                    ebs.create_snapshot(volume)
-                except Exception as msg:
-                    logging.fatal('Failed to create snapshot: {}'.format(str(msg)))
-                    raise
+        :type stream: pipeline.Pipeline
+        :param latest: Latest snapshot by VolumeId covering at least `dedup` seconds. Described if not supplied.
+        :type latest: dict
+        """
+        if latest is None:
+            latest = self.latest_snapshots(self.dedup)
+        cutoff = datetime.now(tzutc()) - timedelta(seconds=self.dedup)
+
+        def fresh(volume):
+            snap = latest.get(volume['VolumeId'])
+            return snap is not None and (snap.get('State') == 'pending' or snap['StartTime'] >= cutoff)
+
+        stream.filter(lambda volume: not fresh(volume), 'deduplicated')
+
+    def prioritise(self, stream, latest=None):
+        """
+        Reorder the volumes of a pipeline so that the most important are dispatched first. See
+        `py:class:: scheduler.Scheduler`.
+
+        :type stream: pipeline.Pipeline
+        :param latest: Latest snapshot by VolumeId covering at least `scheduler.AGE_WINDOW` seconds. Described if not
+                       supplied.
+        :type latest: dict
+        """
+        if latest is None:
+            latest = self.latest_snapshots(scheduler.AGE_WINDOW)
+        stream.stage(scheduler.Scheduler(self.schedule, latest).stage)
+
+    def latest_snapshots(self, window):
+        """
+        Index of the latest snapshot created by ebssnapshot for each volume. Only snapshots started in the last
+        `window` seconds or still pending are described: one pass with a start-time wildcard per day of the window
+        and one pass for pending snapshots, both filtered on the backup-uuid tag. With an inventory the index is
+        read from the cache instead.
+
+        :param window: Seconds
+        :type window: int
+        :return: Snapshot by VolumeId. Snapshots in the error state are ignored.
+        :rtype: dict
+        """
+        tagged = {'Name': 'tag-key', 'Values': ['backup-uuid']}
+        if self.inventory:
+            passes = [self.inventory.snapshot_pages(self, filters=[tagged])]
+        else:
+            now = time.time()
+            days = inventory.since(now - window, now)
+            if days:
+                passes = [
+                    self.snapshot_pages(filters=[tagged, {'Name': 'start-time', 'Values': days}], owner_ids=['self']),
+                    self.snapshot_pages(filters=[tagged, {'Name': 'status', 'Values': ['pending']}],
+                                        owner_ids=['self']),
+                ]
+            else:
+                passes = [self.snapshot_pages(filters=[tagged], owner_ids=['self'])]
+
+        latest = {}
+        for pages in passes:
+            for page in pages:
+                for snap in page:
+                    if snap.get('State') == 'error':
+                        continue
+                    current = latest.get(snap['VolumeId'])
+                    if current is None or snap['StartTime'] > current['StartTime']:
+                        latest[snap['VolumeId']] = snap
+        return latest
+
+    def find_token(self, token):
+        """
+        Snapshots tagged with an idempotency token. See `py:function:: RunContext.token`.
+
+        :param token: Idempotency token
+        :type token: basestring
+        :rtype: list
+        """
+        filters = [{'Name': 'tag:' + TOKEN_TAG, 'Values': [token]}]
+        return [snap for page in self.snapshot_pages(filters=filters, owner_ids=['self']) for snap in page]
+
+    def group_instances(self, batches, counter=None):
+        """
+        Pipeline stage. Group the volumes of each instance into an InstanceGroup snapshotted by one CreateSnapshots
+        call. CreateSnapshots snapshots every volume attached to an instance, or every volume but the boot volume, so
+        an instance is only grouped if the volumes streamed are exactly one of those sets. Attached volumes are held
+        until the stream is exhausted and the instances are described. Volumes that are not attached, or that belong
+        to an instance that is not grouped, are yielded to be snapshotted one at a time.
+
+        :param batches: Iterable of lists of volumes
+        :param counter: Counter the number of instances and volumes grouped are added to
+        :type counter: collections.Counter
+        :rtype: generator
+        """
+        attached = collections.defaultdict(list)
+        for batch in batches:
+            singles = []
+            for volume in batch:
+                attachments = volume.get('Attachments', [])
+                if len(attachments) == 1 and attachments[0].get('State') == 'attached':
+                    attached[attachments[0]['InstanceId']].append(volume)
+                else:
+                    singles.append(volume)
+            if singles:
+                yield singles
+
+        layouts = self.instance_layouts(list(attached))
+        groups = []
+        singles = []
+        for instance_id, volumes in attached.items():
+            selected = set(volume['VolumeId'] for volume in volumes)
+            volume_ids, root = layouts.get(instance_id, (set(), None))
+            if len(selected) > 1 and selected == volume_ids:
+                groups.append(InstanceGroup(instance_id, False, volumes))
+            elif len(selected) > 1 and root in volume_ids and selected == volume_ids - set([root]):
+                groups.append(InstanceGroup(instance_id, True, volumes))
+            else:
+                singles.extend(volumes)
 
-                jobqueue.task_done()
+        if counter is not None:
+            counter['instances'] += len(groups)
+            counter['grouped'] += sum(len(group.Volumes) for group in groups)
+        if groups:
+            yield groups
+        if singles:
+            yield singles
 
-        boss(self, worker, self.volumes(filters=filters))
+    def instance_layouts(self, instance_ids):
+        """
+        EBS volumes attached to instances
+
+        :param instance_ids: Instance IDs
+        :type instance_ids: list
+        :return: Attached volume IDs and boot volume ID by instance ID. Instances not found are omitted.
+        :rtype: dict
+        """
+        layouts = {}
+        paginator = self.connection().get_paginator('describe_instances')
+        for start in range(0, len(instance_ids), FILTER_VALUES):
+            filters = [{'Name': 'instance-id', 'Values': instance_ids[start:start + FILTER_VALUES]}]
+            for page in paginator.paginate(Filters=filters, PaginationConfig={'PageSize': self.page_size}):
+                for reservation in page['Reservations']:
+                    for instance in reservation['Instances']:
+                        devices = dict((mapping['DeviceName'], mapping['Ebs']['VolumeId'])
+                                       for mapping in instance.get('BlockDeviceMappings', []) if 'Ebs' in mapping)
+                        layouts[instance['InstanceId']] = (set(devices.values()),
+                                                           devices.get(instance.get('RootDeviceName')))
+        return layouts
+
+    def create_instance_snapshots(self, group):
+        """
+        Create crash consistent snapshots of the volumes of an instance with one CreateSnapshots call. Snapshots are
+        tagged with the run tags, the idempotency token of the instance and the tags of their volume. If the call
+        fails after it may have reached EC2, snapshots already tagged with the token are used instead of failing.
+
+        :param group: Instance and volumes as yielded by `py:function:: EBSSnapshot.group_instances`
+        :type group: InstanceGroup
+        :return: Log record for each volume, including volumes attached after the instance was described
+        :rtype: list
+        """
+        context = self.context()
+        token = context.token(group.InstanceId)
+        tags = context.tags + context.token_tags(group.InstanceId)
+        tag_specifications = [{'ResourceType': 'snapshot', 'Tags': tags}]
+        logs = collections.OrderedDict()
+        for volume in group.Volumes:
+            logs[volume['VolumeId']] = self._instance_log(group, volume, tags)
+
+        created = []
+        try:
+            try:
+                snapshots = self._create_snapshots(group, self.description, tag_specifications)['Snapshots']
+            except Exception as error:
+                if shaping.deferred(error):
+                    raise
+                snapshots = self._recover(token)
+            for snap in snapshots:
+                if snap['VolumeId'] not in logs:
+                    # Attached after the instance was described. Snapshotted all the same.
+                    volume = {'VolumeId': snap['VolumeId'], 'AvailabilityZone': group.Volumes[0]['AvailabilityZone']}
+                    logs[snap['VolumeId']] = self._instance_log(group, volume, tags)
+                log = logs[snap['VolumeId']]
+                log['StartTime'] = snap['StartTime'].isoformat()
+                log['SnapshotId'] = snap['SnapshotId']
+                log['Account'] = context.identity['Account']
+                log['UserId'] = context.identity['UserId']
+                log['result'] = "success"
+                self.logger.info(log)
+                created.append(snap)
+
+                if self.inventory:
+                    self.inventory.add_snapshot(context.identity['Account'], self.region, snap)
+        except Exception as msg:
+            for log in logs.values():
+                log['error'] = str(msg)
+                log['result'] = 'deferred' if shaping.deferred(msg) else "error"
+                self.logger.log(logging.WARNING if log['result'] == 'deferred' else logging.ERROR, log)
+
+        # Journaled before tracked, so that a snapshot the tracker sees fail stays failed in the journal
+        for volume_id, log in logs.items():
+            self._record(volume_id, log)
+        for snap in created:
+            self._created(snap)
+        self._settle(group, logs.values())
+        return logs.values()
 
     def create_snapshot(self, volume):
         """
@@ -300,6 +836,8 @@ class EBSSnapshot(EC2Connection):
 
         :param volume: Individual record as yielded by `py:function:: EBSSnapshot.volumes`
         :type volume: dict
+        :return: Log record
+        :rtype: collections.OrderedDict
         """
         log = collections.OrderedDict()
         log['action'] = 'create_snapshot'
@@ -309,76 +847,204 @@ class EBSSnapshot(EC2Connection):
         log['VolumeTags'] = taginfo(volume)
 
         # Add tags for identification
-        tag_specifications = [
-            {
-                'ResourceType': 'snapshot',
-                'Tags': [
-                    {'Key': 'backup-desc', 'Value': self.description},
-                    {'Key': 'backup-uuid', 'Value': self.uuid},
-                    {'Key': 'backup-version', 'Value': metadata.__version__},
-                    {'Key': 'backup-delete-protection', 'Value': 'false'},
-                    {'Key': 'backup-host', 'Value': socket.getfqdn()},
-                    {'Key': 'backup-user', 'Value': getpass.getuser()},
-                    {'Key': 'backup-uid', 'Value': str(os.getuid())},
-                    {'Key': 'backup-euid', 'Value': str(os.geteuid())},
-                ]
-            }
-        ]
-        for tag in volume.get('Tags', []):
-            tag_specifications[0]['Tags'].append(tag)
-
+        context = self.context()
+        tag_specifications = context.tag_specifications(volume)
         log['SnapshotTags'] = taginfo(tag_specifications[0])
 
-        # Create Snapshot
+        # Create Snapshot. A call that failed after it may have reached EC2 is resolved by its idempotency token.
         try:
-            result = self._create_snapshot(volume, self.description, tag_specifications)
+            try:
+                result = self._create_snapshot(volume, self.description, tag_specifications)
+            except Exception as error:
+                if shaping.deferred(error):
+                    raise
+                result = self._recover(context.token(volume['VolumeId']))[0]
 
             log['StartTime'] = result['StartTime'].isoformat()
             log['SnapshotId'] = result['SnapshotId']
-            log['Account'] = self.aws_identity()['Account']
-            log['UserId'] = self.aws_identity()['UserId']
+            log['Account'] = context.identity['Account']
+            log['UserId'] = context.identity['UserId']
             log['result'] = "success"
             self.logger.info(log)
+
+            if self.inventory:
+                self.inventory.add_snapshot(context.identity['Account'], self.region, result)
         except Exception as msg:
             log['error'] = str(msg)
-            log['result'] = "error"
-            self.logger.error(log)
-            return
+            if shaping.deferred(msg):
+                # Dispatched again by the boss when shaping, else retried when the run is resumed
+                log['result'] = 'deferred'
+                self.logger.warning(log)
+            else:
+                log['result'] = "error"
+                self.logger.error(log)
+
+        # Journaled before tracked, so that a snapshot the tracker sees fail stays failed in the journal
+        self._record(volume['VolumeId'], log)
+        if log['result'] == 'success':
+            self._created(result)
+        self._settle(volume, [log])
+        return log
 
-    def expire_snapshot_boss(self, filters=None, gt=None, lt=None):
+    def expire_snapshot_boss(self, filters=None, gt=None, lt=None, retention=None, plan=None):
         """
         Delete snapshots that have been expired.
+
+        Only snapshots owned by the account are listed and filters are applied by DescribeSnapshots. Snapshots still
+        in life are dropped by the boss before they are queued. DescribeSnapshots has no range filter on StartTime so
+        the age cutoff cannot be pushed any further upstream. Snapshots are streamed and batched as for
+        `py:function:: EBSSnapshot.create_snapshot_boss`. With a retention policy every snapshot is read before any
+        is queued, the policy deciding per volume. With an inventory, snapshots are read from the cache after it is
+        refreshed. With a journal, snapshots deleted by an earlier attempt of the run are skipped. Snapshots backing
+        images registered by the account cannot be deleted and are dropped before they are queued, see
+        `py:function:: EBSSnapshot.image_snapshots`.
+
+        :param filters: List of AWS filters
+        :type filters: list
+        :param gt: days from current date
+        :type gt: int
+        :param lt: days from current date
+        :type lt: int
+        :param retention: Decide which snapshots expire with a retention policy instead of the gt/lt filters
+        :type retention: retention.Retention
+        :param plan: Add the snapshots to this plan instead of deleting them. See
+                     `py:function:: EBSSnapshot.apply_plan`.
+        :type plan: plan.Plan
+        :return: Run summary as returned by `py:function:: boss`, plus the number of snapshots described, pruned as
+                 in life or retained, dropped as in use by an image, and queued
+        :rtype: dict
         """
+        in_use = self.image_snapshots()
+        if self.inventory:
+            source = self.inventory.snapshot_pages(self, filters=filters)
+        else:
+            source = pipeline.prefetch(self.snapshot_pages(filters=filters, owner_ids=['self']))
 
-        def worker(workerid, jobqueue, region=None, desc=None, uuid=None, role=None, sess=None):
-            """
-            :param workerid: Worker ID
-            :type workerid: int
-            :param jobqueue: Multi Producer and Consumer Queue
-            :type jobqueue: JoinableQueue
-            :param region: AWS region
-            :type region: basestring
-            :param desc: Descriptive text used to create a tag and log
-            :type desc: basestring
-            """
-            ebs = EBSSnapshot(desc=desc, region=region, identifier=uuid, role=role)
-            ebs.session(sess)
-            while ebs:
-                snapshot = jobqueue.get()
-                try:
-                    # Filter out snapshots depending on tags
-                    if ebs.filter_inlife_snapshot(snapshot, gt=gt, lt=lt):
-                        jobqueue.task_done()
-                        continue
+        stream = pipeline.Pipeline(source)
+        stream.count('described')
+        if retention:
+            stream.stage(lambda batches: retention.expire(batches, stream.counter))
+        else:
+            stream.filter(lambda snapshot: not self.filter_inlife_snapshot(snapshot, gt=gt, lt=lt), 'inlife')
+        # Each snapshot dropped here is a DeleteSnapshot call that would fail with InvalidSnapshot.InUse
+        stream.filter(lambda snapshot: snapshot['SnapshotId'] not in in_use, 'in_use')
+        stream.count('queued')
+        if plan is not None:
+            return self._plan(plan, stream, 'expire_snapshot')
+
+        if self.journal:
+            self._track(stream, 'expire_snapshot')
+        return self._run(expire_worker, stream.batch(self.batch), 'expire_snapshot_boss')
+
+    def apply_plan(self, plan):
+        """
+        Execute the items planned for the account and region of this EBSSnapshot. Nothing is described, so the run
+        is only limited by the number of workers and the rate limiter, except with dedup set where the recent
+        snapshots are described to drop volumes snapshotted since the plan was made. The plan UUID should be used as
+        the run identifier so that snapshots are tagged with it.
+
+        :param plan: Plan built by create_snapshot_boss or expire_snapshot_boss
+        :type plan: plan.Plan
+        :return: Run summary as returned by `py:function:: boss`, plus the number of items queued
+        :rtype: dict
+        :raises ValueError: The plan has no items for this account and region
+        """
+        items = plan.items(self.aws_identity()['Account'], self.region)
+        stream = pipeline.Pipeline([items])
+        latest = self._latest() if plan.action == 'create_snapshot' else None
+        if self.dedup and plan.action == 'create_snapshot':
+            self.deduplicate(stream, latest)
+        stream.count('queued')
+        if self.schedule and plan.action == 'create_snapshot':
+            self.prioritise(stream, latest)
+        if self.journal:
+            self._track(stream, plan.action)
+        if self.instances and plan.action == 'create_snapshot':
+            stream.stage(lambda batches: self.group_instances(batches, stream.counter))
+        return self._run(WORKERS[plan.action], stream.batch(self.batch), 'apply_plan',
+                         track=plan.action == 'create_snapshot')
+
+    def _plan(self, plan, stream, action):
+        """
+        Add the items of a pipeline to a plan and log the summary
 
-                    ebs.expire_snapshot(snapshot)
-                except Exception as msg:
-                    logging.fatal('Failed to delete snapshot: {}'.format(str(msg)))
-                    raise
+        :type plan: plan.Plan
+        :type stream: pipeline.Pipeline
+        :param action: Action the plan is for
+        :type action: basestring
+        :rtype: dict
+        :raises ValueError: The plan is for a different action
+        """
+        if plan.action != action:
+            raise ValueError('Cannot add {action} items to a {planned} plan'.format(action=action, planned=plan.action))
+
+        stream.counter['planned'] = plan.add(self.aws_identity()['Account'], self.region, self.role, stream.items())
+        summary = dict(stream.counter)
+
+        log = collections.OrderedDict()
+        log['action'] = action + '_plan'
+        log['uuid'] = plan.uuid
+        log['result'] = 'success'
+        log['region'] = self.region
+        log['Stages'] = summary
+        self.logger.info(log)
+        return summary
 
-                jobqueue.task_done()
+    def _run(self, worker, stream, action, track=False):
+        """
+        Run the boss over a pipeline and log the summary
+
+        :type worker: Callable
+        :type stream: pipeline.Pipeline
+        :param action: Action name used for logging
+        :type action: basestring
+        :param track: Track the snapshots created until they complete if wait is set, and shape the snapshots in flight
+                      if pending is set
+        :type track: bool
+        :rtype: dict
+        """
+        tracker = None
+        shaper = None
+        if track and self.pending:
+            shaper = shaping.Shaper(self.pending, self.batch)
+        if track and (self.wait or shaper):
+            # Snapshots completing free up the capacity of the shaper
+            tracker = completion.CompletionTracker(self, self.wait)
+
+        started = time.time()
+        summary = boss(self, worker, stream, tracker, shaper)
+        if self.metrics:
+            self._measure(action, summary, time.time() - started)
+        summary.update(stream.counter)
 
-        boss(self, worker, self.snapshots(filters=filters))
+        log = collections.OrderedDict()
+        log['action'] = action
+        log['uuid'] = self.uuid
+        log['result'] = 'success'
+        log['region'] = self.region
+        log['Stages'] = summary
+        self.logger.info(log)
+        for item in shaper.exhausted() if shaper else []:
+            self._exhausted(item)
+        return summary
+
+    def _measure(self, action, summary, duration):
+        """
+        Record the items processed, duration, throughput and worker utilisation of a run
+        """
+        items = 0
+        for result in RESULTS:
+            if summary.get(result):
+                self.metrics.inc('items_total', summary[result], action=action, result=result)
+                items += summary[result]
+
+        busy = self.metrics.value('worker_busy_seconds_total', region=self.region)
+        idle = self.metrics.value('worker_idle_seconds_total', region=self.region)
+        self.metrics.set('run_duration_seconds', round(duration, 3), action=action, region=self.region)
+        self.metrics.set('items_per_second', round(items / duration, 3) if duration else 0.0, action=action,
+                         region=self.region)
+        self.metrics.set('worker_utilisation', round(busy / (busy + idle), 3) if busy + idle else 0.0,
+                         action=action, region=self.region)
 
     @staticmethod
     def filter_inlife_snapshot(snapshot, gt=None, lt=None):
@@ -408,6 +1074,8 @@ class EBSSnapshot(EC2Connection):
         """
         :param snapshot: EBS snapshot metadata
         :type snapshot: dict
+        :return: Log record
+        :rtype: collections.OrderedDict
         """
         # Log Prep
         current_time = datetime.now(tzutc())
@@ -421,26 +1089,224 @@ class EBSSnapshot(EC2Connection):
         log['region'] = self.region
         log['SnapshotId'] = snapshot['SnapshotId']
         log['Age'] = str(age)
-        log['Account'] = self.aws_identity()['Account']
-        log['UserId'] = self.aws_identity()['UserId']
+        log['Account'] = self.context().identity['Account']
+        log['UserId'] = self.context().identity['UserId']
         log['SnapshotTags'] = taginfo(snapshot)
         try:
             self._delete_snapshot(snapshot, log)
 
+            if self.inventory and log['result'] == 'success':
+                self.inventory.remove_snapshot(log['Account'], self.region, snapshot['SnapshotId'])
+
         except Exception as msg:
             log['error'] = str(msg)
             log['result'] = "error"
             self.logger.error(log)
 
+        self._record(snapshot['SnapshotId'], log)
+        return log
+
+    def reconcile(self, counter=None):
+        """
+        Resolve the volumes dispatched but not completed by an earlier attempt of this run. A snapshot tagged with
+        the run UUID means the volume was snapshotted and it is recorded as completed. The other volumes are
+        dispatched again. Snapshots dispatched for deletion need no reconciling: once deleted they are no longer
+        listed.
+
+        :param counter: Counter the number of volumes reconciled is added to as 'reconciled'
+        :type counter: collections.Counter
+        """
+        account = self.aws_identity()['Account']
+        dispatched = self.journal.ids(account, self.region, journal.DISPATCHED)
+        reconciled = 0
+        if dispatched:
+            filters = [{'Name': 'tag:backup-uuid', 'Values': [self.uuid]}]
+            for page in self.snapshot_pages(filters=filters, owner_ids=['self']):
+                for snap in page:
+                    if snap['VolumeId'] in dispatched:
+                        self.journal.complete(account, self.region, snap['VolumeId'], snap['SnapshotId'])
+                        reconciled += 1
+
+        if counter is not None:
+            counter['reconciled'] += reconciled
+
+    def _track(self, stream, action):
+        """
+        Journal a pipeline. Volumes left in flight are reconciled first, then items completed by an earlier attempt of
+        the run are dropped and the others recorded as dispatched.
+
+        :type stream: pipeline.Pipeline
+        :param action: create_snapshot | expire_snapshot
+        :type action: basestring
+        """
+        account = self.aws_identity()['Account']
+        self.journal.start(account, self.region, action)
+        if action == 'create_snapshot':
+            self.reconcile(stream.counter)
+        stream.stage(lambda batches: self.journal.track(batches, account, self.region, action, stream.counter))
+
+    def _latest(self, schedule=True):
+        """
+        Latest snapshot by VolumeId, described once for deduplication and scheduling
+
+        :param schedule: Volumes are scheduled
+        :type schedule: bool
+        :return: None if neither is enabled
+        :rtype: dict
+        """
+        window = max(self.dedup, scheduler.AGE_WINDOW if self.schedule and schedule else 0)
+        return self.latest_snapshots(window) if window else None
+
+    def _recover(self, token):
+        """
+        Called from an exception handler after a create call failed. CreateSnapshot and CreateSnapshots take no
+        ClientToken, so a request that timed out or failed after reaching EC2 may still have created snapshots. They
+        are found by their idempotency token.
+
+        :param token: Idempotency token of the failed call
+        :type token: basestring
+        :return: Snapshots tagged with the token
+        :rtype: list
+        :raises: The exception being handled if no snapshot has the token
+        """
+        exc_info = sys.exc_info()
+        try:
+            snapshots = self.find_token(token)
+        except Exception:
+            snapshots = None
+        if not snapshots:
+            raise exc_info[0], exc_info[1], exc_info[2]
+
+        log = collections.OrderedDict()
+        log['action'] = 'create_snapshot_recover'
+        log['uuid'] = self.uuid
+        log['result'] = 'success'
+        log['Token'] = token
+        log['error'] = str(exc_info[1])
+        log['SnapshotIds'] = [snap['SnapshotId'] for snap in snapshots]
+        self.logger.warning(log)
+        return snapshots
+
+    def _instance_log(self, group, volume, tags):
+        """
+        Log record of a volume snapshotted by `py:function:: EBSSnapshot.create_instance_snapshots`
+
+        :param tags: Snapshot tags other than the tags of the volume
+        :type tags: list
+        :rtype: collections.OrderedDict
+        """
+        log = collections.OrderedDict()
+        log['action'] = 'create_snapshot'
+        log['uuid'] = self.uuid
+        log['VolumeId'] = volume['VolumeId']
+        log['AvailabilityZone'] = volume['AvailabilityZone']
+        log['InstanceId'] = group.InstanceId
+        log['VolumeTags'] = taginfo(volume)
+        log['SnapshotTags'] = taginfo({'Tags': tags + volume.get('Tags', [])})
+        return log
+
+    def _created(self, snap):
+        """
+        Hand a created snapshot to the completion tracker of the boss, if any
+        """
+        if self._completions is not None:
+            self._completions.put((snap['SnapshotId'], snap['StartTime'], snap.get('VolumeId')))
+
+    def _exhausted(self, item):
+        """
+        Log a volume or InstanceGroup deferred too many times to be dispatched again
+        """
+        log = collections.OrderedDict()
+        log['action'] = 'create_snapshot_deferral'
+        log['uuid'] = self.uuid
+        log['result'] = 'error'
+        log['region'] = self.region
+        if isinstance(item, InstanceGroup):
+            log['InstanceId'] = item.InstanceId
+        log['VolumeIds'] = [volume['VolumeId'] for volume in shaping.item_volumes(item)]
+        log['error'] = 'Deferred more than {} times'.format(shaping.MAX_DEFERRALS)
+        self.logger.error(log)
+
+    def _settle(self, item, logs):
+        """
+        Signal the outcome of a volume or InstanceGroup to the shaper of the boss, if any
+
+        :param item: Volume or InstanceGroup dispatched
+        :param logs: Log record of each volume of the item
+        :type logs: list
+        """
+        if self._signals is None:
+            return
+
+        if any(log['result'] == 'deferred' for log in logs):
+            self._signals.put((shaping.DEFERRED, item))
+            return
+        for log in logs:
+            self._signals.put((shaping.CREATED if log['result'] == 'success' else shaping.FAILED, log['VolumeId']))
+
+    def _dead_letter(self, item):
+        """
+        Give up on a volume, InstanceGroup or snapshot whose worker died processing it too many times. The item is
+        journaled as failed, so it is retried when the run is resumed.
+        """
+        log = collections.OrderedDict()
+        log['uuid'] = self.uuid
+        log['result'] = 'error'
+        log['region'] = self.region
+        if isinstance(item, dict) and 'SnapshotId' in item:
+            log['action'] = 'expire_snapshot_dead_letter'
+            log['SnapshotId'] = item['SnapshotId']
+            item_ids = [item['SnapshotId']]
+        elif isinstance(item, InstanceGroup) or isinstance(item, dict) and 'VolumeId' in item:
+            log['action'] = 'create_snapshot_dead_letter'
+            if isinstance(item, InstanceGroup):
+                log['InstanceId'] = item.InstanceId
+            item_ids = [volume['VolumeId'] for volume in shaping.item_volumes(item)]
+            log['VolumeIds'] = item_ids
+        else:
+            log['action'] = 'dead_letter'
+            log['Item'] = repr(item)
+            item_ids = []
+        log['error'] = 'Worker died {} times processing it'.format(supervisor.MAX_ATTEMPTS)
+        self.logger.error(log)
+
+        for item_id in item_ids:
+            self._record(item_id, log)
+        if self._signals is not None and log['action'] == 'create_snapshot_dead_letter':
+            for volume_id in item_ids:
+                self._signals.put((shaping.FAILED, volume_id))
+
+    def _record(self, item_id, log):
+        """
+        Journal the result of an item. Failed items are retried when the run is resumed.
+        """
+        if not self.journal:
+            return
+
+        account = self.context().identity['Account']
+        if log['result'] in ('error', 'deferred'):
+            self.journal.fail(account, self.region, item_id)
+        else:
+            self.journal.complete(account, self.region, item_id, log.get('SnapshotId'))
+
     #
-    # Retry handlers
+    # Retry handlers. Calls are paced by the shared rate limiter, so retries do not back off on their own.
     #
-    @backoff.on_exception(backoff.expo, ClientError, max_tries=10, giveup=giveup)
+    @backoff.on_exception(backoff.constant, ClientError, interval=0, jitter=None, max_tries=10, giveup=giveup)
     def _create_snapshot(self, volume, description, tag_specifications=None):
         ec2 = self.connection()
         return ec2.create_snapshot(Description=description, VolumeId=volume['VolumeId'], TagSpecifications=tag_specifications)
 
-    @backoff.on_exception(backoff.expo, ClientError, max_tries=10, giveup=giveup)
+    @backoff.on_exception(backoff.constant, ClientError, interval=0, jitter=None, max_tries=10, giveup=giveup)
+    def _create_snapshots(self, group, description, tag_specifications=None):
+        ec2 = self.connection()
+        return ec2.create_snapshots(
+            Description=description,
+            InstanceSpecification={'InstanceId': group.InstanceId, 'ExcludeBootVolume': group.ExcludeBootVolume},
+            TagSpecifications=tag_specifications,
+            CopyTagsFromSource='volume')
+
+    @backoff.on_exception(backoff.constant, ClientError, interval=0, jitter=None, max_tries=10, giveup=giveup)
     def _delete_snapshot(self, snapshot, log):
         ec2 = self.connection()
         try:
@@ -452,6 +1318,7 @@ class EBSSnapshot(EC2Connection):
             error_code = client_error.response.get('Error', {}).get('Code', 'Unknown')
             if error_code == 'InvalidSnapshot.InUse':
                 log['status'] = 'skipped'
+                log['result'] = 'skipped'
                 log['AwsCode'] = error_code
                 log['AwsMessage'] = client_error.message
                 self.logger.info(log)
@@ -459,42 +1326,239 @@ class EBSSnapshot(EC2Connection):
                 raise
 
 
+#
+# Workers
+#
+def create_worker(workerid, jobqueue, ebs):
+    """
+    Create snapshots for batches of volumes and InstanceGroups until the sentinel (None) is received
+
+    :param workerid: Worker ID
+    :type workerid: int
+    :param jobqueue: Multi Producer and Consumer Queue
+    :type jobqueue: JoinableQueue
+    :param ebs: EBSSnapshot owned by or shared with this worker
+    :type ebs: EBSSnapshot
+    :return: Number of volumes by result
+    :rtype: collections.Counter
+    """
+    results = collections.Counter()
+    for volumes in jobs(jobqueue, ebs, workerid):
+        for volume in volumes:
+            try:
+                if isinstance(volume, InstanceGroup):
+                    results.update(log['result'] for log in ebs.create_instance_snapshots(volume))
+                else:
+                    results[ebs.create_snapshot(volume)['result']] += 1
+            except Exception as msg:
+                logging.fatal('Failed to create snapshot: {}'.format(str(msg)))
+                raise executor.WorkerFailed(results, str(msg)), None, sys.exc_info()[2]
+
+    return results
+
+
+def expire_worker(workerid, jobqueue, ebs):
+    """
+    Delete batches of snapshots until the sentinel (None) is received
+
+    :param workerid: Worker ID
+    :type workerid: int
+    :param jobqueue: Multi Producer and Consumer Queue
+    :type jobqueue: JoinableQueue
+    :param ebs: EBSSnapshot owned by or shared with this worker
+    :type ebs: EBSSnapshot
+    :return: Number of snapshots by result
+    :rtype: collections.Counter
+    """
+    results = collections.Counter()
+    for snapshots in jobs(jobqueue, ebs, workerid):
+        for snapshot in snapshots:
+            try:
+                results[ebs.expire_snapshot(snapshot)['result']] += 1
+            except Exception as msg:
+                logging.fatal('Failed to delete snapshot: {}'.format(str(msg)))
+                raise executor.WorkerFailed(results, str(msg)), None, sys.exc_info()[2]
+
+    return results
+
+
+def jobs(jobqueue, ebs, workerid=None):
+    """
+    Jobs of a worker until the sentinel (None) is received. Each job is marked done once the worker asks for the
+    next one. The time spent waiting for and working on jobs is recorded if metrics are. The items completed or
+    failed by a job are journaled in one transaction once it is done.
+
+    Jobs dispatched by a supervised boss arrive as (jobid, items). The worker records that it waits for a job, the
+    job it holds and each item it starts in its slot of the supervision channel, and acknowledges the job once it
+    asks for the next one. See `py:class:: supervisor.Supervisor`.
+
+    :param jobqueue: Multi Producer and Consumer Queue
+    :type jobqueue: JoinableQueue
+    :param ebs: EBSSnapshot owned by or shared with the worker
+    :type ebs: EBSSnapshot
+    :param workerid: Worker ID. Required under supervision.
+    :type workerid: int
+    :rtype: generator
+    """
+    supervision = getattr(ebs, '_supervision', None)
+    run = getattr(ebs, 'journal', None)
+    while True:
+        if supervision is not None:
+            if supervision.retiring(workerid):
+                return
+            supervision.wait(workerid)
+        waited = time.time()
+        job = jobqueue.get()
+        started = time.time()
+        if job is None:
+            jobqueue.task_done()
+            if ebs.metrics:
+                ebs.metrics.inc('worker_idle_seconds_total', started - waited, region=ebs.region)
+            return
+
+        if run is not None:
+            run.buffer()
+        try:
+            if supervision is None:
+                yield job
+            else:
+                jobid, items = job
+                supervision.hold(workerid, jobid)
+                yield supervision.track(workerid, items)
+        finally:
+            # Journaled before the job is acknowledged. Also runs when the worker raises and the generator is closed.
+            if run is not None:
+                run.flush()
+        if supervision is not None:
+            supervision.release(workerid, jobid)
+        jobqueue.task_done()
+        if ebs.metrics:
+            ebs.metrics.inc('worker_idle_seconds_total', started - waited, region=ebs.region)
+            ebs.metrics.inc('worker_busy_seconds_total', time.time() - started, region=ebs.region)
+
+
+# Worker by plan action
+WORKERS = {
+    'create_snapshot': create_worker,
+    'expire_snapshot': expire_worker,
+}
+
+
 #
 # Utilities
 #
-def boss(ebs, worker, iterable):
+def boss(ebs, worker, iterable, tracker=None, shaper=None):
     """
     Boss Process
 
+    Jobs are dispatched with a blocking put so the boss sleeps while the queue is at capacity. Worker liveness is
+    checked when a put times out and at most every `supervisor.CHECK_INTERVAL` seconds. Once every job is
+    acknowledged a sentinel (None) is queued for every worker so that workers exit cleanly.
+
+    Workers are started by the executor named by ebs.executor and called as worker(workerid, jobqueue, ebs). They
+    take their jobs with `py:function:: jobs`. A worker may return a mapping of result counts which is added to the
+    run summary.
+
+    Workers are supervised. A worker that dies is replaced and the items of its job it had not finished are
+    dispatched again. An item its worker died processing too many times is dead-lettered. See
+    `py:class:: supervisor.Supervisor`.
+
+    With ebs.autoscale, workers are started and retired within its bounds as the latency, throttling and backlog of
+    the run change. See `py:class:: scaling.Autoscaler`.
+
+    With a completion tracker, workers hand the snapshots they create to the tracker which polls them from the boss
+    while jobs are dispatched. The boss waits for it once the workers have exited.
+
+    With a shaper, jobs are only dispatched while the snapshots in flight are under its limits. Workers signal the
+    outcome of every item and the tracker signals the snapshots that complete, so the shaper admits more items as
+    capacity frees up and dispatches deferred items again.
+
     :type ebs: EBSSnapshot
     :type worker: Callable
     :param iterable:
-    :return:
+    :param tracker: Optional completion tracker
+    :type tracker: completion.CompletionTracker
+    :param shaper: Optional shaper. Requires a tracker.
+    :type shaper: shaping.Shaper
+    :return: Run summary. Number of jobs dispatched, job counts by result, the tracker, shaper and autoscaler
+             counts, and the workers respawned, jobs requeued and items dead-lettered if any.
+    :rtype: dict
     """
     logger = getLogger('ebssnapshot.boss')
-    jobqueue = JoinableQueue(ebs.workers)
-    procs = []
-    for i in range(1, ebs.workers + 1):
-        proc = Process(target=worker, args=[i, jobqueue, ebs.region, ebs.description, ebs.uuid, ebs.role, ebs.session()])
-        proc.daemon = True
-        proc.start()
-        procs.append(proc)
-
-    signal.signal(signal.SIGINT, terminate)
-    signal.signal(signal.SIGTERM, terminate)
-
+    backend = executor.executor(ebs.executor)
+    ebs.ratelimiter()
+    backend.prepare(ebs)
+    ebs.context()
+    jobqueue = backend.queue(scaling.capacity(ebs) * QUEUE_DEPTH)
+    resultqueue = backend.result_queue()
+    if shaper:
+        ebs._signals = shaper.start(backend.result_queue())
+    if tracker:
+        ebs._completions = tracker.start(backend.result_queue(), ebs._signals)
+    autoscaler = scaling.Autoscaler(ebs.autoscale, ebs) if ebs.autoscale else None
+    supervision = supervisor.Supervisor(backend, worker, jobqueue, resultqueue, ebs, dead_letter=ebs._dead_letter,
+                                        autoscaler=autoscaler, timeout=LIVENESS_INTERVAL)
+    ebs._supervision = supervision.channel
+    supervision.start()
+    if shaper:
+        iterable = shaper.stage(iterable, supervision.poll)
+
+    # Signal handlers can only be installed from the main thread
+    if threading.current_thread().name == 'MainThread':
+        signal.signal(signal.SIGINT, terminate)
+        signal.signal(signal.SIGTERM, terminate)
+
+    summary = collections.Counter(dispatched=0)
     for job in iterable:
-        while True:
-            running = any(p.is_alive() for p in procs)
-            if not running:
-                logger.fatal('No children are alive: Exiting')
-                sys.exit(-1)
-
-            if jobqueue.empty():
-                jobqueue.put(job, block=True, timeout=60)
-                break
+        if ebs.metrics:
+            measure(ebs, supervision, job)
+        else:
+            supervision.dispatch(job)
+        summary['dispatched'] += 1
+
+    # Workers that died never mark their job done, so the boss waits for acknowledgements instead of the queue
+    supervision.join()
+    summary.update(supervision.stop())
+    summary.update(dict((key, count) for key, count in supervision.counter.items() if count))
+    ebs._supervision = None
+    if autoscaler:
+        summary.update(autoscaler.counter)
+
+    if tracker:
+        summary.update(tracker.stop())
+        ebs._completions = None
+    if shaper:
+        summary.update(shaper.counter)
+        ebs._signals = None
+
+    log = collections.OrderedDict()
+    log['action'] = 'ratelimit'
+    log['uuid'] = ebs.uuid
+    log['result'] = 'success'
+    log['region'] = ebs.region
+    log['Rates'] = ebs.ratelimiter().stats()
+    logger.info(log)
+
+    return dict(summary)
+
+
+def measure(ebs, supervision, job):
+    """
+    Dispatch a job, recording the queue depth and how long the boss was blocked on a full queue
 
-    jobqueue.join()
+    :type ebs: EBSSnapshot
+    :type supervision: supervisor.Supervisor
+    :param job: Items
+    """
+    try:
+        ebs.metrics.observe('boss_queue_depth', supervision.jobqueue.qsize(), region=ebs.region)
+    except NotImplementedError:
+        # qsize is not implemented on every platform
+        pass
+
+    started = time.time()
+    supervision.dispatch(job)
+    ebs.metrics.inc('boss_blocked_seconds_total', time.time() - started, region=ebs.region)
 
 
 def taginfo(dictobject):
@@ -0,0 +1,59 @@
+import os
+import sqlite3
+import threading
+
+
+class Store:
+    def __init__(self, path, schema, version=None):
+        """
+        SQLite database shared by a boss and its workers. One connection is opened per process and thread, so a store
+        created before the workers are started can be used by both process and thread workers.
+
+        :param path: SQLite database file. Parent directories are created on first use.
+        :type path: basestring
+        :param schema: Statements run when a connection is opened. E.G. CREATE TABLE IF NOT EXISTS ...
+        :type schema: list
+        :param version: Schema version. The tables of a database of another version are dropped before the schema is
+                        created, so only stores that can be rebuilt, such as caches, should set it.
+        :type version: int
+        """
+        self.path = os.path.expanduser(path)
+        self.schema = schema
+        self.version = version
+        self._local = threading.local()
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        del state['_local']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._local = threading.local()
+
+    def connection(self):
+        """
+        Connection for the current process and thread. The schema is created on first use.
+
+        :rtype: sqlite3.Connection
+        """
+        if getattr(self._local, 'pid', None) != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory)
+            conn = sqlite3.connect(self.path, timeout=60)
+            conn.execute('PRAGMA journal_mode=WAL')
+            # Commits are durable across crashes of the run, only a power loss may roll back the last ones
+            conn.execute('PRAGMA synchronous=NORMAL')
+            if self.version is not None and conn.execute('PRAGMA user_version').fetchone()[0] != self.version:
+                tables = conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'").fetchall()
+                for (table,) in tables:
+                    conn.execute('DROP TABLE {}'.format(table))
+                conn.execute('PRAGMA user_version = {:d}'.format(self.version))
+            for statement in self.schema:
+                conn.execute(statement)
+            conn.commit()
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+
+        return self._local.conn
@@ -0,0 +1,452 @@
+import collections
+import itertools
+import sys
+import time
+
+import snapshot
+
+from Queue import Empty, Full
+
+
+# Times a worker may die while processing an item before the item is dead-lettered
+MAX_ATTEMPTS = 3
+
+# Dead workers replaced at most per run, per worker. Once spent, dead workers are not replaced.
+RESPAWNS = 5
+
+# Seconds between checks that workers are alive while jobs are dispatched
+CHECK_INTERVAL = 1.0
+
+# Seconds the boss blocks on a full job queue before checking that workers are alive
+PUT_TIMEOUT = 5
+
+# Job ID recorded by a worker that exited because it was retired
+RETIRED = -1
+
+# Job ID recorded by a worker waiting for a job
+WAITING = -2
+
+
+class Channel:
+    # Integers per worker ID and their offsets
+    WIDTH = 4
+    JOB, PROGRESS, RETIRE, RELEASED = range(4)
+
+    def __init__(self, slots, acks):
+        """
+        Shared by the boss and its workers. Each worker records the job it holds and how many of its items it has
+        finished in its slot, and acknowledges every job it finishes. The boss flags the workers it retires in their
+        slot.
+
+        Acknowledgements still buffered by a worker process are lost when it is killed, so the last job a worker
+        finished is also recorded in its slot.
+
+        :param slots: `WIDTH` integers per worker ID. See `py:function:: executor.ProcessExecutor.slots`.
+        :param acks: Queue workers put the ID of every job they finish on
+        """
+        self.slots = slots
+        self.acks = acks
+
+    def wait(self, workerid):
+        """
+        Called by a worker before it takes a job
+        """
+        self.slots[self.WIDTH * workerid + self.JOB] = WAITING
+
+    def hold(self, workerid, jobid):
+        self.slots[self.WIDTH * workerid + self.PROGRESS] = 0
+        self.slots[self.WIDTH * workerid + self.JOB] = jobid
+
+    def track(self, workerid, items):
+        """
+        Items of the held job, recording progress as the worker asks for each one
+
+        :rtype: generator
+        """
+        for index, item in enumerate(items):
+            self.slots[self.WIDTH * workerid + self.PROGRESS] = index
+            yield item
+        self.slots[self.WIDTH * workerid + self.PROGRESS] = len(items)
+
+    def release(self, workerid, jobid):
+        self.slots[self.WIDTH * workerid + self.RELEASED] = jobid
+        self.acks.put(jobid)
+        self.slots[self.WIDTH * workerid + self.JOB] = 0
+
+    def released(self, workerid):
+        """
+        :return: Job ID the worker finished last, 0 if none
+        :rtype: int
+        """
+        return int(self.slots[self.WIDTH * workerid + self.RELEASED])
+
+    def held(self, workerid):
+        """
+        :return: Job ID held, 0 if none, `WAITING` or `RETIRED`, and the number of its items finished
+        :rtype: tuple
+        """
+        return (int(self.slots[self.WIDTH * workerid + self.JOB]),
+                int(self.slots[self.WIDTH * workerid + self.PROGRESS]))
+
+    def clear(self, workerid):
+        for offset in range(self.WIDTH):
+            self.slots[self.WIDTH * workerid + offset] = 0
+
+    def retire(self, workerid, retire=True):
+        self.slots[self.WIDTH * workerid + self.RETIRE] = int(retire)
+
+    def retiring(self, workerid):
+        """
+        Called by a worker before it takes a job. A worker retiring records that it exits.
+
+        :return: Whether the worker should exit instead of taking another job
+        :rtype: bool
+        """
+        if not self.slots[self.WIDTH * workerid + self.RETIRE]:
+            return False
+        self.slots[self.WIDTH * workerid + self.JOB] = RETIRED
+        return True
+
+
+class Supervisor:
+    def __init__(self, backend, worker, jobqueue, resultqueue, ebs, dead_letter=None, autoscaler=None,
+                 max_attempts=MAX_ATTEMPTS, max_respawns=None, interval=CHECK_INTERVAL, timeout=PUT_TIMEOUT):
+        """
+        Start workers and keep them running until every job dispatched is finished. E.G.
+
+        supervisor = Supervisor(backend, worker, jobqueue, resultqueue, ebs)
+        ebs._supervision = supervisor.channel
+        supervisor.start()
+        for job in jobs:
+            supervisor.dispatch(job)
+        supervisor.join()
+        results = supervisor.stop()
+
+        Jobs are numbered and held by the boss until their worker acknowledges them. A worker that dies, whether
+        its worker function raised or its process was killed, is replaced under the same worker ID. The items of
+        the job it held that it had not finished are dispatched again, and the job it finished last is taken as
+        acknowledged. An item whose worker died `max_attempts`
+        times while processing it is handed to `dead_letter` instead, so a poison item cannot stall or stop a run.
+
+        A worker may also die after it took a job and before it recorded holding it. Jobs outstanding once every
+        worker alive waited `timeout` seconds for a job are dispatched again.
+
+        With an autoscaler, workers are started and retired as it decides every time the workers are checked.
+        Retired workers finish the job they hold and exit. See `py:class:: scaling.Autoscaler`.
+
+        :param backend: Executor the workers are started by
+        :type backend: executor.ProcessExecutor | executor.ThreadExecutor
+        :param worker: Worker callable. Called as worker(workerid, jobqueue, ebs)
+        :type worker: Callable
+        :param jobqueue: Queue jobs are dispatched on as (jobid, items)
+        :param resultqueue: Queue workers put (workerid, results, metrics) on when they exit or fail
+        :param ebs: Boss EBSSnapshot
+        :type ebs: EBSSnapshot
+        :param dead_letter: Called with every item dead-lettered
+        :type dead_letter: Callable
+        :param autoscaler: Optional autoscaler. Workers are kept within its bounds, starting from ebs.workers.
+        :type autoscaler: scaling.Autoscaler
+        :param max_attempts: Times a worker may die while processing an item before it is dead-lettered
+        :type max_attempts: int
+        :param max_respawns: Dead workers replaced at most. Defaults to `RESPAWNS` per worker.
+        :type max_respawns: int
+        :param interval: Seconds between checks that workers are alive
+        :type interval: float
+        :param timeout: Seconds the boss blocks on a full job queue before checking that workers are alive
+        :type timeout: float
+        """
+        self.backend = backend
+        self.worker = worker
+        self.jobqueue = jobqueue
+        self.resultqueue = resultqueue
+        self.ebs = ebs
+        self.dead_letter = dead_letter
+        self.autoscaler = autoscaler
+        self.capacity = autoscaler.bounds.maximum if autoscaler else ebs.workers
+        self.max_attempts = max_attempts
+        self.max_respawns = RESPAWNS * self.capacity if max_respawns is None else max_respawns
+        self.interval = interval
+        self.timeout = timeout
+        self.channel = Channel(backend.slots(Channel.WIDTH * (self.capacity + 1)), backend.result_queue())
+        self.counter = collections.Counter(respawned=0, requeued=0, dead_lettered=0)
+        self.results = collections.Counter()
+        # Worker by worker ID - 1. None until started and once retired.
+        self.procs = [None] * self.capacity
+        self.logger = snapshot.getLogger('ebssnapshot.Supervisor')
+        self._started = []
+        self._reported = 0
+        self._outstanding = {}
+        self._pending = collections.deque()
+        self._abandoned = set()
+        self._retiring = set()
+        self._unheld = {}
+        self._ids = itertools.count(1)
+        self._checked = time.time()
+
+    def start(self):
+        """
+        Start the workers
+
+        :return: Worker by worker ID - 1
+        :rtype: list
+        """
+        workers = self.autoscaler.bounds.clamp(self.ebs.workers) if self.autoscaler else self.ebs.workers
+        for index in range(workers):
+            self._spawn(index)
+        return self.procs
+
+    def alive(self):
+        """
+        :return: Whether any worker is alive
+        :rtype: bool
+        """
+        return any(p.is_alive() for p in self.procs if p is not None)
+
+    def active(self):
+        """
+        :return: Indexes of the workers started and not retiring or given up on
+        :rtype: list
+        """
+        return [index for index, proc in enumerate(self.procs)
+                if proc is not None and index not in self._retiring and index not in self._abandoned]
+
+    def poll(self):
+        """
+        Replace dead workers and dispatch the jobs held back. Called while the boss waits on something other than
+        the job queue.
+
+        :return: Whether any worker is alive
+        :rtype: bool
+        """
+        self.check()
+        self._flush()
+        return self.alive()
+
+    def dispatch(self, job):
+        """
+        Put a job on the queue, blocking while the queue is full
+
+        :param job: Items
+        :type job: list
+        """
+        jobid = next(self._ids)
+        self._outstanding[jobid] = (job, 0)
+        self._pending.append((jobid, job))
+        self._flush()
+
+    def join(self):
+        """
+        Block until every job dispatched is acknowledged or dead-lettered
+        """
+        while self._outstanding or self._pending:
+            self._flush()
+            try:
+                self._outstanding.pop(self.channel.acks.get(block=True, timeout=self.interval), None)
+            except Empty:
+                self.check()
+                continue
+            if time.time() - self._checked >= self.interval:
+                self.check()
+
+    def stop(self):
+        """
+        Queue a sentinel (None) for every worker alive and wait for the workers to exit
+
+        :return: Number of items by result reported by every worker started, and the items dead-lettered as errors
+        :rtype: collections.Counter
+        """
+        # Counted up front. A worker may take a sentinel queued for another and exit before it is counted.
+        for _ in [p for p in self.procs if p is not None and p.is_alive()]:
+            while True:
+                try:
+                    self.jobqueue.put(None, block=True, timeout=self.timeout)
+                    break
+                except Full:
+                    if not self.alive():
+                        break
+
+        # Workers report once when they exit or fail. Workers that were killed never do.
+        while self._reported < len(self._started):
+            try:
+                self._report(*self.resultqueue.get(block=True, timeout=self.interval))
+            except Empty:
+                if not any(p.is_alive() for p in self._started):
+                    break
+        self._drain()
+        for proc in self._started:
+            proc.join()
+        return self.results
+
+    def scale(self, workers):
+        """
+        Start or retire workers until `workers` are active. Workers still retiring are kept on before new ones are
+        started.
+
+        :type workers: int
+        """
+        active = self.active()
+        if workers > len(active):
+            for index in sorted(self._retiring)[:workers - len(active)]:
+                self._retiring.discard(index)
+                self.channel.retire(index + 1, False)
+            free = [index for index, proc in enumerate(self.procs) if proc is None]
+            for index in free[:workers - len(self.active())]:
+                self._spawn(index)
+        else:
+            for index in sorted(active, reverse=True)[:len(active) - workers]:
+                self._retiring.add(index)
+                self.channel.retire(index + 1)
+
+    def check(self):
+        """
+        Replace dead workers and dispatch again the items they had not finished, then scale the workers if
+        autoscaled. Exits if no worker is alive and none can be replaced.
+        """
+        self._checked = time.time()
+        dead = [index for index, proc in enumerate(self.procs)
+                if proc is not None and index not in self._abandoned and not proc.is_alive()]
+        if dead:
+            self._drain()
+        for index in dead:
+            workerid = index + 1
+            jobid, finished = self.channel.held(workerid)
+            # Its acknowledgement may have been lost with the worker
+            self._outstanding.pop(self.channel.released(workerid), None)
+            self.channel.clear(workerid)
+            if jobid == RETIRED:
+                self._retiring.discard(index)
+                self.procs[index] = None
+                continue
+            self._recover(jobid, finished)
+
+            log = collections.OrderedDict()
+            log['action'] = 'worker_respawn'
+            log['uuid'] = self.ebs.uuid
+            log['region'] = self.ebs.region
+            log['WorkerId'] = workerid
+            log['ExitCode'] = getattr(self.procs[index], 'exitcode', None)
+            if self.counter['respawned'] < self.max_respawns:
+                self._retiring.discard(index)
+                self._spawn(index)
+                self.counter['respawned'] += 1
+                log['result'] = 'success'
+                self.logger.warning(log)
+            else:
+                self._abandoned.add(index)
+                log['result'] = 'error'
+                log['error'] = 'Replaced {} dead workers already'.format(self.max_respawns)
+                self.logger.error(log)
+        self._lost()
+
+        if self.autoscaler:
+            self.autoscaler.sample(self._backlog())
+            workers = self.autoscaler.decide(len(self.active()))
+            if workers is not None:
+                self.scale(workers)
+
+        if dead and not self.alive():
+            self.logger.fatal('No children are alive: Exiting')
+            sys.exit(-1)
+
+    #
+    # Internals
+    #
+    def _spawn(self, index):
+        self.channel.clear(index + 1)
+        proc = self.backend.start(self.worker, index + 1, self.jobqueue, self.resultqueue, self.ebs)
+        self.procs[index] = proc
+        self._started.append(proc)
+
+    def _backlog(self):
+        """
+        :return: Jobs dispatched and not yet taken by a worker
+        :rtype: int
+        """
+        try:
+            return self.jobqueue.qsize() + len(self._pending)
+        except NotImplementedError:
+            # qsize is not implemented on every platform
+            return len(self._pending)
+
+    def _flush(self):
+        while self._pending:
+            try:
+                self.jobqueue.put(self._pending[0], block=True, timeout=self.timeout)
+            except Full:
+                self.check()
+                continue
+            self._pending.popleft()
+            if time.time() - self._checked >= self.interval:
+                self.check()
+
+    def _drain(self):
+        """
+        Apply the acknowledgements received and gather the results of the workers that exited or failed
+        """
+        while True:
+            try:
+                self._outstanding.pop(self.channel.acks.get_nowait(), None)
+            except Empty:
+                break
+
+        while True:
+            try:
+                self._report(*self.resultqueue.get_nowait())
+            except Empty:
+                break
+
+    def _report(self, workerid, results, worker_metrics):
+        self._reported += 1
+        self.results.update(results or {})
+        if self.ebs.metrics and worker_metrics:
+            self.ebs.metrics.merge(worker_metrics)
+
+    def _lost(self):
+        """
+        Dispatch again the jobs taken by workers that died before they recorded holding them. No worker holds a job
+        while every worker alive waits for one, and jobs still queued are taken well within `timeout` seconds.
+        """
+        waiting = [self.channel.held(index + 1)[0] == WAITING
+                   for index, proc in enumerate(self.procs) if proc is not None and proc.is_alive()]
+        if self._pending or not waiting or not all(waiting):
+            self._unheld = {}
+            return
+
+        self._drain()
+        for index, proc in enumerate(self.procs):
+            if proc is not None:
+                self._outstanding.pop(self.channel.released(index + 1), None)
+        now = time.time()
+        self._unheld = dict((jobid, self._unheld.get(jobid, now)) for jobid in self._outstanding)
+        for jobid, since in sorted(self._unheld.items()):
+            if now - since >= self.timeout:
+                del self._unheld[jobid]
+                job, attempts = self._outstanding.pop(jobid)
+                self._requeue(job, attempts)
+
+    def _recover(self, jobid, finished):
+        job, attempts = self._outstanding.pop(jobid, (None, 0))
+        if not job:
+            return
+
+        items = list(job)[finished:]
+        if not items:
+            return
+
+        # The first item left was in progress when the worker died
+        attempts = (attempts if finished == 0 else 0) + 1
+        if attempts >= self.max_attempts:
+            self.counter['dead_lettered'] += 1
+            self.results['error'] += 1
+            if self.dead_letter:
+                self.dead_letter(items[0])
+            items, attempts = items[1:], 0
+            if not items:
+                return
+        self._requeue(items, attempts)
+
+    def _requeue(self, items, attempts):
+        jobid = next(self._ids)
+        self._outstanding[jobid] = (items, attempts)
+        self._pending.append((jobid, items))
+        self.counter['requeued'] += 1
@@ -12,4 +12,5 @@ setup(name=metadata.__project__,
       scripts=["scripts/ebssnap"],
       packages=['ebssnapshot'],
       install_requires=open("requirements.txt").read().splitlines(),
+      extras_require={'record': ['placebo']},
       )
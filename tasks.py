@@ -177,6 +177,20 @@ def test(c):
     c.run("pytest")
 
 
+@task
+def bench(c):
+    """
+    Benchmarks
+    """
+    c.run("python benchmarks/bench_account.py")
+    c.run("python benchmarks/bench_boss.py")
+    c.run("python benchmarks/bench_clients.py")
+    c.run("python benchmarks/bench_executor.py")
+    c.run("python benchmarks/bench_logging.py")
+    c.run("python benchmarks/bench_startup.py")
+    c.run("python benchmarks/bench_tags.py")
+
+
 @task
 def version(c):
     """
@@ -0,0 +1,75 @@
+from ebssnapshot import clients, ratelimit
+
+import shortuuid
+
+
+#
+# Fake classes shared by the tests
+#
+class FakeSession():
+    def __init__(self, ec2=None):
+        self.ec2 = ec2
+
+    def client(self, service_name, **kwargs):
+        if service_name == 'ec2' and self.ec2:
+            return self.ec2
+        return FakeSTS()
+
+
+class FakeSTS():
+    def get_caller_identity(self):
+        return {'Account': '123456789012', 'UserId': 'AIDAFAKE'}
+
+
+def fake_boto3(monkeypatch, ec2=None):
+    """
+    Replace the boto3 sessions an EBSSnapshot creates on its own with fakes
+
+    :param ec2: EC2 client of the sessions
+    """
+    import boto3
+    monkeypatch.setattr(boto3.session, 'Session', lambda *args, **kwargs: FakeSession(ec2))
+
+
+class FakeEBS():
+    """
+    Boss EBSSnapshot for workers that make no AWS calls
+    """
+    def __init__(self, workers=2, executor='process', autoscale=None, limiter=None):
+        self.workers = workers
+        self.executor = executor
+        self.autoscale = autoscale
+        self.region = 'no-region-1'
+        self.description = 'test'
+        self.uuid = shortuuid.uuid()
+        self.role = None
+        self.metrics = None
+        self.dead_letters = []
+        self._ratelimiter = limiter or ratelimit.RateLimiter(region=self.region)
+
+    def session(self):
+        return FakeSession()
+
+    def clients(self):
+        return clients.ClientPool(FakeSession())
+
+    def connection(self):
+        return None
+
+    def config(self, config=None):
+        return None
+
+    def aws_identity(self):
+        return None
+
+    def context(self):
+        return None
+
+    def ratelimiter(self):
+        return self._ratelimiter
+
+    def clone(self):
+        return self
+
+    def _dead_letter(self, item):
+        self.dead_letters.append(item)
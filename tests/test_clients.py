@@ -0,0 +1,76 @@
+from botocore.loaders import JSONFileLoader
+from ebssnapshot import clients, executor, snapshot
+
+import boto3
+import pytest
+
+
+#
+# Fake classes
+#
+class FakeSession():
+    def __init__(self):
+        self.created = []
+        self.identities = 0
+
+    def client(self, service_name, **kwargs):
+        self.created.append((service_name, kwargs.get('region_name')))
+        return FakeSTS(self)
+
+
+class FakeSTS():
+    def __init__(self, session):
+        self.session = session
+
+    def get_caller_identity(self):
+        self.session.identities += 1
+        return {'Account': '123456789012', 'UserId': 'AIDAFAKE'}
+
+
+#
+# Tests
+#
+def test_client_pool():
+    sess = FakeSession()
+    pool = clients.ClientPool(sess)
+    ec2 = pool.client('ec2', 'no-region-1')
+
+    assert pool.client('ec2', 'no-region-1') is ec2
+    assert pool.client('ec2', 'no-region-2') is not ec2
+    assert pool.identity() is pool.identity()
+    assert sess.identities == 1
+
+    # Forked worker
+    pool._pid = -1
+    assert pool.client('ec2', 'no-region-1') is not ec2
+    pool.identity()
+    assert sess.identities == 1
+    assert sess.created == [('ec2', 'no-region-1'), ('ec2', 'no-region-2'), ('sts', None), ('ec2', 'no-region-1')]
+
+
+def test_client_pool_warm(monkeypatch):
+    sess = boto3.session.Session(aws_access_key_id='stub', aws_secret_access_key='stub', region_name='no-region-1')
+    pool = clients.ClientPool(sess).warm('no-region-1')
+
+    def load_file(self, file_path):
+        pytest.fail('Loaded {} after warm'.format(file_path))
+
+    monkeypatch.setattr(JSONFileLoader, 'load_file', load_file)
+    pool._pid = -1
+    ec2 = pool.client('ec2', 'no-region-1')
+    assert ec2.get_paginator('describe_snapshots')
+    assert pool.client('sts')
+
+
+def test_clone_shares_pool():
+    sess = FakeSession()
+    ebs = snapshot.EBSSnapshot(region='no-region-1', workers=8)
+    ebs.session(sess)
+    executor.executor('process').prepare(ebs)
+    clone = ebs.clone()
+
+    assert clone.clients() is ebs.clients()
+    assert clone.aws_identity()['Account'] == '123456789012'
+    assert sess.identities == 1
+    assert clients.sized(ebs.config(), 8) is ebs.config()
+    assert clients.sized(ebs.config(), 16).max_pool_connections == 16
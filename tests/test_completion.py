@@ -0,0 +1,117 @@
+from botocore.exceptions import ClientError
+from datetime import datetime, timedelta
+from dateutil.tz import tzutc
+from ebssnapshot import completion, journal, snapshot
+from fakes import FakeSession
+from Queue import Queue
+
+
+#
+# Fake classes
+#
+class FakePaginator():
+    def __init__(self, items):
+        self.items = items
+
+    def paginate(self, **kwargs):
+        return [{'Volumes': self.items}]
+
+
+class FakeClient():
+    def __init__(self, volumes=None, states=None, pending=1):
+        """
+        :param states: Final state by SnapshotId. Snapshots not listed are missing.
+        :param pending: Number of describes a snapshot stays pending for
+        """
+        self.volumes = volumes or []
+        self.states = states or {}
+        self.pending = pending
+        self.describes = []
+
+    def get_paginator(self, name):
+        return FakePaginator(self.volumes)
+
+    def create_snapshot(self, Description, VolumeId, TagSpecifications=None):
+        self.states.setdefault('snap-' + VolumeId, 'completed')
+        return {'SnapshotId': 'snap-' + VolumeId, 'VolumeId': VolumeId, 'StartTime': datetime.now(tzutc())}
+
+    def describe_snapshots(self, SnapshotIds):
+        self.describes.append(SnapshotIds)
+        missing = [snapshot_id for snapshot_id in SnapshotIds if snapshot_id not in self.states]
+        if missing:
+            raise ClientError({'Error': {'Code': 'InvalidSnapshot.NotFound', 'Message': missing[0]}},
+                              'DescribeSnapshots')
+
+        polls = sum(1 for ids in self.describes if SnapshotIds[0] in ids)
+        return {'Snapshots': [
+            {'SnapshotId': snapshot_id, 'State': self.states[snapshot_id] if polls > self.pending else 'pending'}
+            for snapshot_id in SnapshotIds]}
+
+
+#
+# Fixtures
+#
+def fixture_ebs(client, wait=0):
+    ebs = snapshot.EBSSnapshot(region='no-region-1', executor='thread', workers=2, identifier='run-1', wait=wait)
+    ebs.session(FakeSession())
+    ebs.connection(client)
+    return ebs
+
+
+#
+# Tests
+#
+def test_completion_tracker():
+    client = FakeClient(states={'snap-1': 'completed', 'snap-2': 'error', 'snap-3': 'completed', 'snap-5': 'pending'})
+    tracker = completion.CompletionTracker(fixture_ebs(client), timeout=0.2, interval=0.01, max_interval=0.04,
+                                           batch=2)
+    queue = tracker.start(Queue())
+    started = datetime.now(tzutc()) - timedelta(seconds=30)
+    for snapshot_id in ('snap-1', 'snap-2', 'snap-3', 'snap-4', 'snap-5'):
+        queue.put((snapshot_id, started))
+    summary = tracker.stop()
+
+    assert summary == {'tracked': 5, 'completed': 2, 'snapshot_error': 2, 'stuck': 1}
+    assert all(len(ids) <= 2 for ids in client.describes)
+    percentiles = tracker.percentiles()
+    assert list(percentiles) == ['p50', 'p90', 'p99', 'max']
+    assert 30 <= percentiles['p50'] <= percentiles['max'] < 60
+
+
+def test_completion_tracker_percentiles():
+    tracker = completion.CompletionTracker(None, timeout=0)
+    assert tracker.percentiles() is None
+
+    tracker.durations = [float(i) for i in range(1, 101)]
+    assert tracker.percentiles() == {'p50': 50.0, 'p90': 90.0, 'p99': 99.0, 'max': 100.0}
+
+
+def test_create_snapshot_boss_wait(monkeypatch):
+    tracker = completion.CompletionTracker
+    monkeypatch.setattr(completion, 'CompletionTracker',
+                        lambda ebs, timeout: tracker(ebs, timeout, interval=0.01, max_interval=0.02))
+    client = FakeClient(volumes=[{'VolumeId': 'vol-{}'.format(i), 'AvailabilityZone': 'no-region-1a'}
+                                 for i in range(5)])
+    ebs = fixture_ebs(client, wait=5)
+    summary = ebs.create_snapshot_boss()
+
+    assert summary['success'] == 5
+    assert summary['tracked'] == 5 and summary['completed'] == 5 and summary['stuck'] == 0
+    assert ebs._completions is None
+
+
+def test_create_snapshot_boss_wait_error(monkeypatch, tmpdir):
+    tracker = completion.CompletionTracker
+    monkeypatch.setattr(completion, 'CompletionTracker',
+                        lambda ebs, timeout: tracker(ebs, timeout, interval=0.01, max_interval=0.02))
+    client = FakeClient(volumes=[{'VolumeId': 'vol-{}'.format(i), 'AvailabilityZone': 'no-region-1a'}
+                                 for i in range(3)], states={'snap-vol-1': 'error'})
+    run = journal.Journal('run-1', directory=str(tmpdir))
+    ebs = fixture_ebs(client, wait=5)
+    ebs.journal = run
+    summary = ebs.create_snapshot_boss()
+
+    assert summary['success'] == 3 and summary['snapshot_error'] == 1
+    # Snapshotted again when the run is resumed
+    assert run.ids('123456789012', 'no-region-1', journal.FAILED) == set(['vol-1'])
+    assert not journal.settled(summary)
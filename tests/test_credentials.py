@@ -0,0 +1,102 @@
+from botocore.awsrequest import AWSResponse
+from datetime import datetime, timedelta
+from dateutil.tz import tzutc
+from ebssnapshot import credentials, snapshot
+
+import boto3
+import botocore.endpoint
+import re
+import urlparse
+
+
+#
+# Fake classes
+#
+class Raw:
+    def __init__(self, body):
+        self.body = body
+
+    def stream(self, **kwargs):
+        yield self.body
+
+
+class FakeSTS:
+    """
+    Answers STS calls made by real botocore clients in place of the endpoint
+    """
+    def __init__(self, lifetimes=None):
+        """
+        :param lifetimes: Seconds the credentials returned by each AssumeRole call are valid for
+        """
+        self.lifetimes = list(lifetimes or [])
+        self.calls = []
+
+    def send(self, request):
+        params = dict((k, v[0]) for k, v in urlparse.parse_qs(request.body or '').items())
+        signer = re.search(r'Credential=([^/]+)/', request.headers['Authorization']).group(1)
+        self.calls.append((params['Action'], params.get('RoleArn'), signer))
+        if params['Action'] == 'GetCallerIdentity':
+            body = ('<GetCallerIdentityResponse><GetCallerIdentityResult><Arn>{arn}</Arn><UserId>AROAFAKE</UserId>'
+                    '<Account>123456789012</Account></GetCallerIdentityResult></GetCallerIdentityResponse>').format(
+                arn=signer)
+            return AWSResponse(request.url, 200, {}, Raw(body))
+
+        lifetime = self.lifetimes.pop(0) if self.lifetimes else 3600
+        body = ('<AssumeRoleResponse><AssumeRoleResult><Credentials><AccessKeyId>{key}</AccessKeyId>'
+                '<SecretAccessKey>secret</SecretAccessKey><SessionToken>token</SessionToken>'
+                '<Expiration>{expiry}</Expiration></Credentials><AssumedRoleUser><Arn>{arn}</Arn>'
+                '<AssumedRoleId>AROAFAKE:session</AssumedRoleId></AssumedRoleUser></AssumeRoleResult>'
+                '</AssumeRoleResponse>').format(
+            key='{}-{}'.format(params['RoleArn'].split('/')[-1], len(self.calls)), arn=params['RoleArn'],
+            expiry=(datetime.now(tzutc()) + timedelta(seconds=lifetime)).strftime('%Y-%m-%dT%H:%M:%SZ'))
+        return AWSResponse(request.url, 200, {}, Raw(body))
+
+
+#
+# Fixtures
+#
+def fixture_sts(monkeypatch, lifetimes=None):
+    sts = FakeSTS(lifetimes)
+    monkeypatch.setattr(botocore.endpoint.Endpoint, '_send', lambda endpoint, request: sts.send(request))
+    return sts
+
+
+def fixture_source():
+    return boto3.session.Session(aws_access_key_id='stub', aws_secret_access_key='stub', region_name='no-region-1')
+
+
+#
+# Tests
+#
+def test_assume_role_chain(monkeypatch):
+    sts = fixture_sts(monkeypatch)
+    role = 'arn:aws:iam::111111111111:role/Hub, arn:aws:iam::222222222222:role/Spoke'
+    sess = credentials.assume_role_session(role, region='no-region-1', source=fixture_source())
+
+    assert credentials.chain(role) == ['arn:aws:iam::111111111111:role/Hub',
+                                       'arn:aws:iam::222222222222:role/Spoke']
+    assert sts.calls == [('AssumeRole', 'arn:aws:iam::111111111111:role/Hub', 'stub'),
+                         ('AssumeRole', 'arn:aws:iam::222222222222:role/Spoke', 'Hub-1')]
+    assert sess.get_credentials().get_frozen_credentials().access_key == 'Spoke-2'
+
+
+def test_assume_role_refresh(monkeypatch):
+    # Credentials expiring within the mandatory refresh window are renewed before they are used
+    sts = fixture_sts(monkeypatch, lifetimes=[300, 3600])
+    sess = credentials.assume_role_session('arn:aws:iam::111111111111:role/EBSSnapshot', region='no-region-1',
+                                           source=fixture_source())
+
+    assert sess.get_credentials().get_frozen_credentials().access_key == 'EBSSnapshot-2'
+    assert sess.get_credentials().get_frozen_credentials().access_key == 'EBSSnapshot-2'
+    assert len(sts.calls) == 2
+
+
+def test_session_role(monkeypatch):
+    monkeypatch.setenv('AWS_ACCESS_KEY_ID', 'stub')
+    monkeypatch.setenv('AWS_SECRET_ACCESS_KEY', 'stub')
+    sts = fixture_sts(monkeypatch)
+    conn = snapshot.EC2Connection(region='no-region-1', role='arn:aws:iam::111111111111:role/EBSSnapshot')
+    conn.session()
+
+    assert conn.aws_identity()['Arn'] == 'EBSSnapshot-1'
+    assert [call[0] for call in sts.calls] == ['AssumeRole', 'GetCallerIdentity']
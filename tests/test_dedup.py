@@ -0,0 +1,129 @@
+from botocore.exceptions import ReadTimeoutError
+from datetime import datetime, timedelta
+from dateutil.tz import tzutc
+from ebssnapshot import inventory, snapshot
+from fakes import FakeSession
+
+import fnmatch
+
+
+#
+# Fake classes
+#
+class FakePaginator():
+    def __init__(self, client, group):
+        self.client = client
+        self.group = group
+
+    def paginate(self, **kwargs):
+        if self.group == 'Volumes':
+            return [{'Volumes': self.client.volumes}]
+
+        filters = kwargs.get('Filters') or []
+        self.client.describes.append(filters)
+        snapshots = self.client.snapshots
+        for flt in filters:
+            if flt['Name'] == 'start-time':
+                snapshots = [snap for snap in snapshots
+                             if any(fnmatch.fnmatch(snap['StartTime'].isoformat(), value) for value in flt['Values'])]
+            else:
+                snapshots = [snap for snap in snapshots if inventory.match(snap, [flt])]
+        return [{'Snapshots': snapshots}]
+
+
+class FakeClient():
+    def __init__(self, volumes=None, snapshots=None, timeouts=None, lost=None):
+        self.volumes = volumes or []
+        self.snapshots = snapshots or []
+        self.timeouts = timeouts or []
+        self.lost = lost or []
+        self.created = []
+        self.describes = []
+
+    def get_paginator(self, name):
+        return FakePaginator(self, 'Volumes' if name == 'describe_volumes' else 'Snapshots')
+
+    def create_snapshot(self, Description, VolumeId, TagSpecifications=None):
+        self.created.append(VolumeId)
+        if VolumeId in self.lost:
+            raise ReadTimeoutError(endpoint_url='https://ec2.no-region-1.amazonaws.com')
+
+        snap = {'SnapshotId': 'snap-' + VolumeId, 'VolumeId': VolumeId, 'StartTime': datetime.now(tzutc()),
+                'State': 'pending', 'Tags': TagSpecifications[0]['Tags']}
+        self.snapshots.append(snap)
+        if VolumeId in self.timeouts:
+            raise ReadTimeoutError(endpoint_url='https://ec2.no-region-1.amazonaws.com')
+        return snap
+
+
+#
+# Fixtures
+#
+NOW = datetime.now(tzutc())
+
+
+def fixture_vol(volumeid):
+    return {'VolumeId': volumeid, 'AvailabilityZone': 'no-region-1a'}
+
+
+def fixture_snap(volumeid, age, state='completed'):
+    return {'SnapshotId': 'snap-old-' + volumeid, 'VolumeId': volumeid, 'StartTime': NOW - age, 'State': state,
+            'Tags': [{'Key': 'backup-uuid', 'Value': 'run-0'}]}
+
+
+def fixture_ebs(client, dedup=0):
+    ebs = snapshot.EBSSnapshot(region='no-region-1', executor='thread', workers=2, identifier='run-1', dedup=dedup)
+    ebs.session(FakeSession())
+    ebs.connection(client)
+    return ebs
+
+
+#
+# Tests
+#
+def test_latest_snapshots():
+    client = FakeClient(snapshots=[
+        fixture_snap('vol-1', timedelta(days=3), state='pending'),
+        fixture_snap('vol-2', timedelta(minutes=10)),
+        fixture_snap('vol-3', timedelta(days=40)),
+        fixture_snap('vol-4', timedelta(minutes=1), state='error'),
+    ])
+    latest = fixture_ebs(client).latest_snapshots(86400)
+
+    assert sorted(latest) == ['vol-1', 'vol-2']
+    assert len(client.describes) == 2
+    assert [flt['Name'] for flt in client.describes[0]] == ['tag-key', 'start-time']
+    assert client.describes[1][1] == {'Name': 'status', 'Values': ['pending']}
+
+
+def test_create_snapshot_boss_dedup():
+    client = FakeClient(volumes=[fixture_vol('vol-{}'.format(i)) for i in range(5)], snapshots=[
+        fixture_snap('vol-1', timedelta(days=3), state='pending'),
+        fixture_snap('vol-2', timedelta(minutes=10)),
+        fixture_snap('vol-3', timedelta(hours=2)),
+        fixture_snap('vol-4', timedelta(minutes=1), state='error'),
+    ])
+    summary = fixture_ebs(client, dedup=3600).create_snapshot_boss()
+
+    assert sorted(client.created) == ['vol-0', 'vol-3', 'vol-4']
+    assert summary['described'] == 5 and summary['deduplicated'] == 2 and summary['success'] == 3
+
+    # A second run inside the window snapshots nothing
+    client.created = []
+    assert fixture_ebs(client, dedup=3600).create_snapshot_boss()['deduplicated'] == 5
+    assert client.created == []
+
+
+def test_create_snapshot_recover():
+    client = FakeClient(timeouts=['vol-1'], lost=['vol-2'])
+    ebs = fixture_ebs(client)
+
+    # The snapshot was created although the call timed out. It is found by its idempotency token.
+    log = ebs.create_snapshot(fixture_vol('vol-1'))
+    assert log['result'] == 'success' and log['SnapshotId'] == 'snap-vol-1'
+    assert log['SnapshotTags']['backup-token'] == 'run-1:vol-1'
+    assert client.describes[-1] == [{'Name': 'tag:backup-token', 'Values': ['run-1:vol-1']}]
+
+    # The request never reached EC2
+    log = ebs.create_snapshot(fixture_vol('vol-2'))
+    assert log['result'] == 'error' and 'Read timeout' in log['error']
@@ -0,0 +1,226 @@
+from datetime import datetime, timedelta
+from dateutil.tz import tzutc
+from ebssnapshot import inventory, snapshot
+from fakes import FakeSession, fake_boto3
+
+import collections
+import os
+import pytest
+import sqlite3
+
+
+#
+# Fake classes
+#
+class FakeEBS():
+    def __init__(self, account='123456789012', region='no-region-1'):
+        self.account = account
+        self.region = region
+        self.page_size = 2
+        self.volumes = []
+        self.snapshots = []
+        self.calls = []
+
+    def aws_identity(self):
+        return {'Account': self.account, 'UserId': 'AIDAFAKE'}
+
+    def volume_pages(self, filters=None):
+        self.calls.append(('volumes', filters))
+        yield list(self.volumes)
+
+    def snapshot_pages(self, filters=None, owner_ids=None):
+        assert owner_ids == ['self']
+        self.calls.append(('snapshots', filters))
+        yield list(self.snapshots)
+
+
+class FakePaginator():
+    def __init__(self, pages):
+        self.pages = pages
+        self.calls = 0
+
+    def paginate(self, **kwargs):
+        # The snapshots are deleted by the first run, so incremental refreshes describe nothing
+        self.calls += 1
+        return [] if kwargs.get('Filters') else self.pages
+
+
+class FakeClient():
+    def __init__(self, pages):
+        self.paginator = FakePaginator(pages)
+        self.deleted = []
+
+    def get_paginator(self, name):
+        return self.paginator
+
+    def can_paginate(self, name):
+        return False
+
+    def describe_images(self, Owners):
+        return {'Images': []}
+
+    def delete_snapshot(self, SnapshotId):
+        self.deleted.append(SnapshotId)
+
+
+#
+# Fixtures
+#
+NOW = datetime.now(tz=tzutc())
+
+
+def fixture_snap(snapshotid, age=timedelta(0), state='completed', tags=None):
+    return {'SnapshotId': snapshotid, 'VolumeId': 'vol-1', 'StartTime': NOW - age, 'State': state,
+            'Tags': tags or []}
+
+
+def fixture_vol(volumeid, age=timedelta(0)):
+    return {'VolumeId': volumeid, 'CreateTime': NOW - age, 'State': 'in-use', 'AvailabilityZone': 'no-region-1a'}
+
+
+@pytest.fixture
+def cache(tmpdir):
+    return inventory.Inventory(path=os.path.join(str(tmpdir), 'cache', 'inventory.db'))
+
+
+#
+# Tests
+#
+def test_refresh_full_then_incremental(cache):
+    ebs = FakeEBS()
+    ebs.snapshots = [fixture_snap('snap-old', age=timedelta(days=2)), fixture_snap('snap-new')]
+    assert cache.refresh(ebs, 'snapshots') == {'described': 2, 'removed': 0, 'full': True}
+    assert ebs.calls[-1] == ('snapshots', None)
+
+    ebs.snapshots = [fixture_snap('snap-newer')]
+    assert cache.refresh(ebs, 'snapshots') == {'described': 1, 'removed': 0, 'full': False}
+    assert ebs.calls[-1] == ('snapshots', [{'Name': 'start-time', 'Values': ['{:%Y-%m-%d}*'.format(NOW)]}])
+
+    ids = sorted(snap['SnapshotId'] for page in cache.snapshot_pages(ebs) for snap in page)
+    assert ids == ['snap-new', 'snap-newer', 'snap-old']
+
+
+def test_refresh_watermark_pending(cache):
+    # The oldest pending snapshot holds the watermark back so that it is described again
+    ebs = FakeEBS()
+    ebs.snapshots = [fixture_snap('snap-pending', age=timedelta(days=2), state='pending'), fixture_snap('snap-new')]
+    cache.refresh(ebs, 'snapshots')
+    cache.refresh(ebs, 'snapshots')
+    assert ebs.calls[-1][1][0]['Values'] == ['{:%Y-%m-%d}*'.format(NOW - timedelta(days=i)) for i in (2, 1, 0)]
+
+
+def test_refresh_full_removes_missing(cache):
+    ebs = FakeEBS()
+    ebs.volumes = [fixture_vol('vol-1'), fixture_vol('vol-2')]
+    cache.refresh(ebs, 'volumes')
+    ebs.volumes = [fixture_vol('vol-2')]
+    assert cache.refresh(ebs, 'volumes', full=True) == {'described': 1, 'removed': 1, 'full': True}
+    assert [vol['VolumeId'] for page in cache.volume_pages(ebs) for vol in page] == ['vol-2']
+
+
+def test_refresh_ttl(cache):
+    ebs = FakeEBS()
+    cache.ttl = 0
+    cache.refresh(ebs, 'volumes')
+    assert cache.refresh(ebs, 'volumes')['full']
+
+
+def test_pages_filtered_and_scoped(cache):
+    ebs = FakeEBS()
+    protected = [{'Key': 'backup-delete-protection', 'Value': 'true'}]
+    ebs.snapshots = [fixture_snap('snap-{}'.format(i)) for i in range(5)] + [fixture_snap('snap-9', tags=protected)]
+    other = FakeEBS(region='no-region-2')
+    other.snapshots = [fixture_snap('snap-other')]
+    cache.refresh(other, 'snapshots')
+
+    assert 'snap-other' not in [snap['SnapshotId'] for page in cache.snapshot_pages(ebs) for snap in page]
+    pages = list(cache.snapshot_pages(ebs, filters=[{'Name': 'tag:backup-delete-protection', 'Values': ['t*']}]))
+    assert [snap['SnapshotId'] for page in pages for snap in page] == ['snap-9']
+    pages = list(cache.snapshot_pages(ebs, filters=[{'Name': 'snapshot-id', 'Values': ['snap-?']}]))
+    assert max(len(page) for page in pages) <= ebs.page_size
+    assert sorted(snap['SnapshotId'] for page in pages for snap in page) == \
+        ['snap-0', 'snap-1', 'snap-2', 'snap-3', 'snap-4', 'snap-9']
+    assert pages[0][0]['StartTime'].tzinfo is not None
+
+
+def test_match():
+    snap = fixture_snap('snap-1', tags=[{'Key': 'backup-delete-protection', 'Value': 'false'}])
+    assert inventory.match(snap, [{'Name': 'tag:backup-delete-protection', 'Values': ['false']}])
+    assert not inventory.match(snap, [{'Name': 'tag:backup-delete-protection', 'Values': ['true']}])
+    assert not inventory.match(snap, [{'Name': 'tag:missing', 'Values': ['*']}])
+    assert inventory.match(snap, [{'Name': 'tag-key', 'Values': ['backup-*']}, {'Name': 'status', 'Values': ['completed']}])
+    with pytest.raises(ValueError):
+        inventory.match(snap, [{'Name': 'description', 'Values': ['*']}])
+
+
+def test_write_through(cache):
+    ebs = FakeEBS()
+    cache.refresh(ebs, 'snapshots')
+    cache.add_snapshot(ebs.account, ebs.region, dict(fixture_snap('snap-1'), ResponseMetadata={}))
+    cache.add_snapshot(ebs.account, ebs.region, fixture_snap('snap-2'))
+    cache.remove_snapshot(ebs.account, ebs.region, 'snap-2')
+    assert [snap for page in cache.snapshot_pages(ebs) for snap in page] == [fixture_snap('snap-1')]
+
+
+def test_summary_and_prune(cache):
+    for region in ('no-region-1', 'no-region-2'):
+        ebs = FakeEBS(region=region)
+        ebs.volumes = [fixture_vol('vol-1')]
+        cache.refresh(ebs, 'volumes')
+
+    summary = cache.summary()
+    assert [(row['region'], row['kind'], row['count']) for row in summary] == \
+        [('no-region-1', 'volumes', 1), ('no-region-2', 'volumes', 1)]
+
+    assert cache.prune(older=1) == {'snapshots': 0, 'volumes': 0}
+    assert cache.prune(region='no-region-1') == {'snapshots': 0, 'volumes': 1}
+    assert [row['region'] for row in cache.summary()] == ['no-region-2']
+
+
+def test_expire_snapshot_boss_inventory(cache):
+    old = timedelta(days=30)
+    unprotected = [{'Key': 'backup-delete-protection', 'Value': 'false'}]
+    client = FakeClient([{'Snapshots': [fixture_snap('snap-{}'.format(i), age=old, tags=unprotected)
+                                        for i in range(3)]}])
+    ebs = snapshot.EBSSnapshot(region='no-region-1', executor='thread', workers=1, inventory=cache)
+    ebs.session(FakeSession())
+    ebs.connection(client)
+
+    filters = [{'Name': 'tag:backup-delete-protection', 'Values': ['false']}]
+    summary = ebs.expire_snapshot_boss(filters, gt=-7)
+    assert summary['queued'] == 3
+    assert sorted(client.deleted) == ['snap-0', 'snap-1', 'snap-2']
+
+    # Deleted snapshots are removed from the cache and the second run only refreshes incrementally
+    assert ebs.expire_snapshot_boss(filters, gt=-7)['described'] == 0
+    assert client.paginator.calls == 2
+    assert collections.Counter(row['kind'] for row in cache.summary()) == {'snapshots': 1}
+
+
+def test_refresh_without_session(cache, monkeypatch):
+    snap = fixture_snap('snap-1', tags=[{'Key': 'Name', 'Value': 'x'}])
+    fake_boto3(monkeypatch, FakeClient([{'Snapshots': [snap]}]))
+    ebs = snapshot.EBSSnapshot(region='no-region-1')
+    assert cache.refresh(ebs, 'snapshots') == {'described': 1, 'removed': 0, 'full': True}
+
+    # Items are cached as JSON and read back with their times
+    assert list(cache.snapshot_pages(ebs)) == [[snap]]
+    data = cache.connection().execute('SELECT data FROM snapshots').fetchone()[0]
+    assert '"StartTime": "{}"'.format(NOW.isoformat()) in data
+
+
+def test_legacy_cache_dropped(tmpdir):
+    path = os.path.join(str(tmpdir), 'inventory.db')
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE snapshots (account TEXT, region TEXT, id TEXT, start REAL, state TEXT, seen REAL, '
+                 'data BLOB, PRIMARY KEY (account, region, id))')
+    # Unpickling the row would run a shell command
+    conn.execute("INSERT INTO snapshots VALUES ('123456789012', 'no-region-1', 'snap-1', 0, 'completed', 0, ?)",
+                 (sqlite3.Binary("cos\nsystem\n(S'exit 1'\ntR."),))
+    conn.commit()
+    conn.close()
+
+    # Caches of an older version are never read, the next refresh is a full one
+    cache = inventory.Inventory(path=path)
+    assert list(cache.snapshot_pages(FakeEBS())) == []
+    assert cache.connection().execute('PRAGMA user_version').fetchone()[0] == inventory.VERSION
@@ -0,0 +1,142 @@
+from botocore.exceptions import ClientError
+from datetime import datetime
+from dateutil.tz import tzutc
+from ebssnapshot import journal, snapshot
+from fakes import FakeSession
+
+import collections
+import os
+import pytest
+
+
+#
+# Fake classes
+#
+class FakePaginator():
+    def __init__(self, client, group):
+        self.client = client
+        self.group = group
+
+    def paginate(self, **kwargs):
+        self.client.describes.append((self.group, kwargs.get('Filters')))
+        return [{self.group: getattr(self.client, self.group.lower())}]
+
+
+class FakeClient():
+    def __init__(self, volumes=None, snapshots=None, failing=None, deferring=None):
+        self.volumes = volumes or []
+        self.snapshots = snapshots or []
+        self.failing = failing or []
+        self.deferring = deferring or []
+        self.created = []
+        self.describes = []
+
+    def get_paginator(self, name):
+        return FakePaginator(self, 'Volumes' if name == 'describe_volumes' else 'Snapshots')
+
+    def create_snapshot(self, Description, VolumeId, TagSpecifications=None):
+        if VolumeId in self.failing:
+            raise Exception('Simulated failure')
+        if VolumeId in self.deferring:
+            raise ClientError({'Error': {'Code': 'SnapshotCreationPerVolumeRateExceeded', 'Message': VolumeId}},
+                              'CreateSnapshot')
+        self.created.append(VolumeId)
+        return {'SnapshotId': 'snap-' + VolumeId, 'StartTime': datetime.now(tzutc())}
+
+
+#
+# Fixtures
+#
+def fixture_vol(volumeid):
+    return {'VolumeId': volumeid, 'AvailabilityZone': 'no-region-1a'}
+
+
+@pytest.fixture
+def run(tmpdir):
+    return journal.Journal('run-1', directory=str(tmpdir))
+
+
+def fixture_ebs(client, run):
+    ebs = snapshot.EBSSnapshot(region='no-region-1', executor='thread', workers=2, identifier=run.uuid, journal=run)
+    ebs.session(FakeSession())
+    ebs.connection(client)
+    return ebs
+
+
+#
+# Tests
+#
+def test_journal_track(run):
+    run.complete('123456789012', 'no-region-1', 'vol-1', 'snap-1')
+    counter = collections.Counter()
+    batches = list(run.track([[fixture_vol('vol-1'), fixture_vol('vol-2')], [fixture_vol('vol-3')]],
+                             '123456789012', 'no-region-1', 'create_snapshot', counter))
+
+    assert [[volume['VolumeId'] for volume in batch] for batch in batches] == [['vol-2'], ['vol-3']]
+    assert counter == {'resumed': 1}
+    assert run.ids('123456789012', 'no-region-1', journal.DISPATCHED) == set(['vol-2', 'vol-3'])
+    assert run.ids('123456789012', 'no-region-2', journal.COMPLETED) == set()
+
+
+def test_journal_action_mismatch(run):
+    run.start('123456789012', 'no-region-1', 'create_snapshot')
+    run.start('123456789012', 'no-region-1', 'create_snapshot')
+    with pytest.raises(ValueError):
+        run.start('123456789012', 'no-region-1', 'expire_snapshot')
+
+
+def test_journal_remove(run):
+    run.fail('123456789012', 'no-region-1', 'vol-1')
+    assert run.summary() == {journal.FAILED: 1}
+    assert os.path.exists(run.path)
+    run.remove()
+    assert not os.path.exists(run.path)
+
+
+def test_journal_buffer(run):
+    run.buffer()
+    run.complete('123456789012', 'no-region-1', 'vol-1', 'snap-1')
+    run.fail('123456789012', 'no-region-1', 'vol-2')
+    assert run.summary() == {}
+
+    run.flush()
+    assert run.summary() == {journal.COMPLETED: 1, journal.FAILED: 1}
+    # Written at once after a flush
+    run.complete('123456789012', 'no-region-1', 'vol-2')
+    assert run.summary() == {journal.COMPLETED: 2}
+
+
+def test_create_snapshot_boss_resume(run):
+    volumes = [fixture_vol('vol-{}'.format(i)) for i in range(6)]
+    client = FakeClient(volumes=volumes, failing=['vol-1'])
+    summary = fixture_ebs(client, run).create_snapshot_boss()
+    assert summary['success'] == 5 and summary['error'] == 1
+    assert summary['resumed'] == 0 and summary['reconciled'] == 0
+
+    # vol-2 was in flight when the run was interrupted and its snapshot was created. vol-3 was in flight and its
+    # snapshot was not created.
+    account, region = '123456789012', 'no-region-1'
+    run._set(account, region, 'vol-2', journal.DISPATCHED, None)
+    run._set(account, region, 'vol-3', journal.DISPATCHED, None)
+    client = FakeClient(volumes=volumes, snapshots=[{'SnapshotId': 'snap-vol-2', 'VolumeId': 'vol-2'}])
+    summary = fixture_ebs(client, run).create_snapshot_boss()
+
+    assert ('Snapshots', [{'Name': 'tag:backup-uuid', 'Values': ['run-1']}]) in client.describes
+    assert sorted(client.created) == ['vol-1', 'vol-3']
+    assert summary['resumed'] == 4 and summary['reconciled'] == 1 and summary['success'] == 2
+    assert run.summary() == {journal.COMPLETED: 6}
+
+
+def test_create_snapshot_boss_resume_deferred(run):
+    volumes = [fixture_vol('vol-{}'.format(i)) for i in range(3)]
+    client = FakeClient(volumes=volumes, deferring=['vol-1'])
+    summary = fixture_ebs(client, run).create_snapshot_boss()
+    assert summary['success'] == 2 and summary['deferred'] == 1 and not summary.get('error')
+    # The journal is kept for the deferred volume
+    assert not journal.settled(summary)
+
+    client = FakeClient(volumes=volumes)
+    summary = fixture_ebs(client, run).create_snapshot_boss()
+    assert client.created == ['vol-1']
+    assert summary['resumed'] == 2 and summary['success'] == 1
+    assert journal.settled(summary)
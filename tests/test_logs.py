@@ -0,0 +1,98 @@
+from ebssnapshot import logs, snapshot
+
+import collections
+import json
+import logging
+import multiprocessing
+import os
+
+
+#
+# Helper Classes
+#
+class ListHandler(logging.Handler):
+    def __init__(self, level=logging.NOTSET):
+        logging.Handler.__init__(self, level)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append((record.process, self.format(record)))
+
+
+#
+# Fixtures
+#
+def fixture_log(i, result='success'):
+    log = collections.OrderedDict()
+    log['action'] = 'create_snapshot'
+    log['uuid'] = 'run-1'
+    log['VolumeId'] = 'vol-{}'.format(i)
+    log['result'] = result
+    return log
+
+
+def fixture_logger(name, *handlers):
+    logger = snapshot.getLogger(name)
+    logger.handlers = list(handlers)
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    return logger
+
+
+def emit_records(logger, count):
+    for i in range(count):
+        logger.info(fixture_log(i))
+    logger.error(fixture_log(count, result='error'))
+
+
+#
+# Tests
+#
+def test_message_lazy():
+    handler = ListHandler(level=logging.WARN)
+    logger = fixture_logger('ebssnapshot.test_lazy', handler)
+    snapshot.getLogger('ebssnapshot.test_lazy')
+    assert logger.filters == [snapshot.FILTER]
+
+    record = logger.makeRecord(logger.name, logging.INFO, __file__, 0, fixture_log(1), None, None)
+    logger.handle(record)
+    assert isinstance(record.msg, logs.Message) and record.msg._text is None
+    assert handler.messages == []
+
+    logger.warning(fixture_log(1))
+    assert handler.messages[0][1] == "uuid=run-1 action=create_snapshot result=success json='{}'".format(
+        json.dumps(fixture_log(1)))
+
+
+def test_batch_handler():
+    target = ListHandler()
+    batch = logs.BatchHandler([target], size=100)
+    logger = fixture_logger('ebssnapshot.test_batch', batch)
+
+    proc = multiprocessing.Process(target=emit_records, args=[logger, 250])
+    proc.start()
+    proc.join()
+    logger.info(fixture_log('boss'))
+    batch.close()
+
+    shipped = [message for pid, message in target.messages if pid == proc.pid]
+    assert len(shipped) == 251
+    assert 'VolumeId": "vol-0"' in shipped[0] and 'result=error' in shipped[-1]
+    assert [pid for pid, _ in target.messages].count(os.getpid()) == 1
+
+
+def test_ndjson_handler(tmpdir):
+    ndjson = logs.NDJSONHandler(str(tmpdir))
+    logger = fixture_logger('ebssnapshot.test_ndjson', ndjson)
+
+    logger.info(fixture_log('boss'))
+    proc = multiprocessing.Process(target=emit_records, args=[logger, 10])
+    proc.start()
+    proc.join()
+    ndjson.close()
+
+    boss = [json.loads(line) for line in open(ndjson.path())]
+    worker = [json.loads(line) for line in open(ndjson.path(proc.pid))]
+    assert [line['VolumeId'] for line in boss] == ['vol-boss']
+    assert len(worker) == 11
+    assert worker[0]['level'] == 'INFO' and worker[0]['pid'] == proc.pid and worker[-1]['result'] == 'error'
@@ -0,0 +1,147 @@
+from botocore.awsrequest import AWSResponse
+from datetime import datetime
+from dateutil.tz import tzutc
+from ebssnapshot import executor, metrics, snapshot, supervisor
+from fakes import FakeSession
+
+import boto3
+import collections
+import cPickle
+import json
+import os
+
+
+#
+# Fake classes
+#
+class Raw:
+    def __init__(self, body):
+        self.body = body
+
+    def stream(self, **kwargs):
+        yield self.body
+
+
+class ThrottleOnceEC2:
+    """
+    Answers CreateSnapshot from the before-send event. The first call is throttled.
+    """
+    def __init__(self):
+        self.calls = 0
+
+    def send(self, request, **kwargs):
+        self.calls += 1
+        if self.calls == 1:
+            body = ('<Response><Errors><Error><Code>RequestLimitExceeded</Code><Message>Request limit exceeded.'
+                    '</Message></Error></Errors></Response>')
+            return AWSResponse(request.url, 503, {}, Raw(body))
+
+        body = ('<CreateSnapshotResponse><snapshotId>snap-1</snapshotId><volumeId>vol-1</volumeId>'
+                '<status>pending</status></CreateSnapshotResponse>')
+        return AWSResponse(request.url, 200, {}, Raw(body))
+
+
+class FakePaginator():
+    def __init__(self, items):
+        self.items = items
+
+    def paginate(self, **kwargs):
+        return [{'Volumes': self.items}]
+
+
+class FakeClient():
+    def __init__(self, volumes):
+        self.volumes = volumes
+
+    def get_paginator(self, name):
+        return FakePaginator(self.volumes)
+
+    def create_snapshot(self, Description, VolumeId, TagSpecifications=None):
+        return {'SnapshotId': 'snap-' + VolumeId, 'StartTime': datetime.now(tzutc())}
+
+
+#
+# Tests
+#
+def test_metrics_export(tmpdir):
+    registry = metrics.Metrics()
+    registry.inc('api_calls_total', action='CreateSnapshot')
+    registry.inc('api_calls_total', 2, action='CreateSnapshot')
+    registry.set('run_duration_seconds', 1.5, action='create_snapshot_boss', region='no-region-1')
+    registry.observe('api_latency_seconds', 0.02, action='CreateSnapshot')
+    registry.observe('api_latency_seconds', 7.0, action='CreateSnapshot')
+
+    text = registry.prometheus()
+    assert '# TYPE ebssnapshot_api_calls_total counter\n' in text
+    assert 'ebssnapshot_api_calls_total{action="CreateSnapshot"} 3\n' in text
+    assert 'ebssnapshot_run_duration_seconds{action="create_snapshot_boss",region="no-region-1"} 1.5\n' in text
+    assert 'ebssnapshot_api_latency_seconds_bucket{action="CreateSnapshot",le="0.025"} 1\n' in text
+    assert 'ebssnapshot_api_latency_seconds_bucket{action="CreateSnapshot",le="+Inf"} 2\n' in text
+    assert 'ebssnapshot_api_latency_seconds_count{action="CreateSnapshot"} 2\n' in text
+
+    path = os.path.join(str(tmpdir), 'metrics.json')
+    registry.write(path, 'json')
+    summary = json.load(open(path))
+    assert summary['api_calls_total{action="CreateSnapshot"}'] == 3
+    assert summary['api_latency_seconds{action="CreateSnapshot"}']['mean'] == 3.51
+    assert os.listdir(str(tmpdir)) == ['metrics.json']
+
+
+def test_metrics_merge():
+    boss_metrics = metrics.Metrics()
+    boss_metrics.inc('worker_busy_seconds_total', 1.0, region='no-region-1')
+    boss_metrics.observe('boss_queue_depth', 3, region='no-region-1')
+
+    # Process workers return their metrics through the result queue
+    worker_metrics = cPickle.loads(cPickle.dumps(boss_metrics, cPickle.HIGHEST_PROTOCOL))
+    ebs = snapshot.EBSSnapshot(region='no-region-1', executor='thread', workers=1, metrics=boss_metrics)
+    backend = executor.ThreadExecutor()
+    supervision = supervisor.Supervisor(backend, None, backend.queue(1), backend.result_queue(), ebs)
+    supervision._report(1, collections.Counter(success=2), worker_metrics)
+
+    assert supervision.results == {'success': 2}
+    assert boss_metrics.value('worker_busy_seconds_total', region='no-region-1') == 2.0
+    assert boss_metrics.summary()['boss_queue_depth{region="no-region-1"}']['count'] == 2
+
+
+def test_metrics_quantile():
+    registry = metrics.Metrics()
+    assert registry.quantile('api_latency_seconds', 0.5, action='CreateSnapshot') is None
+
+    for latency in [0.02] * 98 + [0.3, 120.0]:
+        registry.observe('api_latency_seconds', latency, action='CreateSnapshot')
+
+    # Interpolated within the 0.01 to 0.025 bucket
+    assert round(registry.quantile('api_latency_seconds', 0.5, action='CreateSnapshot'), 6) == 0.017653
+    assert round(registry.quantile('api_latency_seconds', 0.99, action='CreateSnapshot'), 6) == 0.5
+    assert registry.quantile('api_latency_seconds', 1.0, action='CreateSnapshot') == 60.0
+
+
+def test_metrics_botocore():
+    stub = ThrottleOnceEC2()
+    sess = boto3.session.Session(aws_access_key_id='stub', aws_secret_access_key='stub', region_name='no-region-1')
+    sess.events.register('before-send.ec2.CreateSnapshot', stub.send)
+    client = sess.client('ec2', config=boto3.session.Config(retries={'max_attempts': 2}))
+    registry = metrics.Metrics()
+    registry.attach(client)
+
+    client.create_snapshot(VolumeId='vol-1')
+    assert registry.value('api_calls_total', action='CreateSnapshot') == 1
+    assert registry.value('api_throttles_total', action='CreateSnapshot') == 1
+    assert registry.value('api_retries_total', action='CreateSnapshot') == 1
+    assert registry.summary()['api_latency_seconds{action="CreateSnapshot"}']['count'] == 1
+
+
+def test_create_snapshot_boss_metrics():
+    registry = metrics.Metrics()
+    ebs = snapshot.EBSSnapshot(region='no-region-1', executor='thread', workers=2, batch=2, metrics=registry)
+    ebs.session(FakeSession())
+    ebs.connection(FakeClient([{'VolumeId': 'vol-{}'.format(i), 'AvailabilityZone': 'no-region-1a'}
+                               for i in range(7)]))
+    ebs.create_snapshot_boss()
+
+    summary = registry.summary()
+    assert summary['items_total{action="create_snapshot_boss",result="success"}'] == 7
+    assert summary['boss_queue_depth{region="no-region-1"}']['count'] == 4
+    assert summary['items_per_second{action="create_snapshot_boss",region="no-region-1"}'] > 0
+    assert 0 < summary['worker_utilisation{action="create_snapshot_boss",region="no-region-1"}'] <= 1
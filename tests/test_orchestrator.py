@@ -0,0 +1,82 @@
+from ebssnapshot import orchestrator, snapshot
+from fakes import FakeSession
+
+import collections
+import threading
+import time
+
+
+#
+# Fake classes
+#
+def fake_sessions(monkeypatch):
+    """
+    Replace assume role sessions with fakes
+
+    :return: Roles a session was created for
+    :rtype: list
+    """
+    created = []
+
+    def session(self, sess=None):
+        if sess:
+            self._sess = sess
+        if not self._sess:
+            created.append(self.role)
+            self._sess = FakeSession()
+        return self._sess
+
+    monkeypatch.setattr(snapshot.EC2Connection, 'session', session)
+    return created
+
+
+#
+# Tests
+#
+def test_orchestrator_caps(monkeypatch):
+    created = fake_sessions(monkeypatch)
+    roles = ['arn:aws:iam::{}:role/EBSSnapshot'.format(account) for account in range(3)]
+    regions = ['no-region-1', 'no-region-2']
+    targets = [(role, region) for role in roles for region in regions]
+
+    lock = threading.Lock()
+    running = collections.Counter()
+    peaks = collections.Counter()
+
+    def func(ebs):
+        with lock:
+            running['all'] += 1
+            running[ebs.region] += 1
+            peaks['all'] = max(peaks['all'], running['all'])
+            peaks[ebs.region] = max(peaks[ebs.region], running[ebs.region])
+        time.sleep(0.05)
+        with lock:
+            running['all'] -= 1
+            running[ebs.region] -= 1
+        return {'dispatched': 2, 'success': 2}
+
+    orch = orchestrator.Orchestrator(targets, concurrency=3, region_concurrency=2)
+    summary = orch.run(func, 'test')
+
+    assert summary['result'] == 'success'
+    assert summary['totals'] == {'dispatched': 12, 'success': 12}
+    assert len(summary['targets']) == 6
+    assert peaks['all'] <= 3
+    assert all(peaks[region] <= 2 for region in regions)
+    assert sorted(created) == sorted(roles)
+
+
+def test_orchestrator_target_error(monkeypatch):
+    fake_sessions(monkeypatch)
+
+    def func(ebs):
+        if ebs.region == 'no-region-2':
+            raise Exception('boom')
+        return {'dispatched': 1}
+
+    orch = orchestrator.Orchestrator([(None, 'no-region-1'), (None, 'no-region-2')])
+    summary = orch.run(func, 'test')
+
+    assert summary['result'] == 'error'
+    assert summary['totals'] == {'dispatched': 1}
+    assert [t['result'] for t in summary['targets']] == ['success', 'error']
@@ -0,0 +1,52 @@
+from ebssnapshot import pipeline
+
+import pytest
+import threading
+
+
+#
+# Tests
+#
+def test_pipeline_stages():
+    stream = pipeline.Pipeline([range(0, 5), range(5, 10), range(10, 12)])
+    stream.count('described').filter(lambda i: i % 3, 'skipped').map(lambda i: i * 10).count('queued').batch(4)
+
+    assert list(stream) == [[10, 20, 40, 50], [70, 80, 100, 110]]
+    assert stream.counter == {'described': 12, 'skipped': 4, 'queued': 8}
+
+
+def test_pipeline_counters_start_at_zero():
+    stream = pipeline.Pipeline([]).count('described').filter(bool, 'skipped')
+    assert list(stream.items()) == []
+    assert stream.counter == {'described': 0, 'skipped': 0}
+
+
+def test_prefetch_is_bounded():
+    produced = [0]
+    consumed = [0]
+    ahead = [0]
+    lock = threading.Lock()
+
+    def pages():
+        for i in range(500):
+            with lock:
+                produced[0] += 1
+                ahead[0] = max(ahead[0], produced[0] - consumed[0])
+            yield [i]
+
+    for _ in pipeline.Pipeline(pipeline.prefetch(pages(), depth=2)).batch(1):
+        with lock:
+            consumed[0] += 1
+
+    assert consumed[0] == 500
+    # The page being consumed, the pages buffered and the page the reader is blocked on
+    assert ahead[0] <= 4
+
+
+def test_prefetch_reraises():
+    def pages():
+        yield [1]
+        raise ValueError('describe failed')
+
+    with pytest.raises(ValueError):
+        list(pipeline.prefetch(pages()))
@@ -0,0 +1,156 @@
+from datetime import datetime, timedelta
+from dateutil.tz import tzutc
+from ebssnapshot import plan, snapshot
+from fakes import FakeSession, fake_boto3
+
+import json
+import os
+import pytest
+
+
+#
+# Fake classes
+#
+class FakePaginator():
+    def __init__(self, group, items):
+        self.group = group
+        self.items = items
+
+    def paginate(self, **kwargs):
+        return [{self.group: self.items}]
+
+
+class FakeClient():
+    def __init__(self, volumes=None, snapshots=None, images=None):
+        self.images = images or []
+        self.paginators = {
+            'describe_volumes': FakePaginator('Volumes', volumes or []),
+            'describe_snapshots': FakePaginator('Snapshots', snapshots or []),
+        }
+        self.calls = []
+
+    def get_paginator(self, name):
+        return self.paginators[name]
+
+    def can_paginate(self, name):
+        return name in self.paginators
+
+    def describe_images(self, Owners):
+        return {'Images': self.images}
+
+    def create_snapshot(self, Description, VolumeId, TagSpecifications=None):
+        self.calls.append(('create_snapshot', VolumeId))
+        return {'SnapshotId': 'snap-' + VolumeId, 'StartTime': datetime.now(tzutc())}
+
+    def delete_snapshot(self, SnapshotId):
+        self.calls.append(('delete_snapshot', SnapshotId))
+
+
+#
+# Fixtures
+#
+NOW = datetime.now(tz=tzutc())
+
+
+def fixture_snap(snapshotid, age):
+    return {'SnapshotId': snapshotid, 'VolumeId': 'vol-1', 'StartTime': NOW - age, 'State': 'completed',
+            'Progress': '100%', 'Tags': [{'Key': 'Name', 'Value': snapshotid}]}
+
+
+def fixture_vol(volumeid):
+    return {'VolumeId': volumeid, 'AvailabilityZone': 'no-region-1a', 'Size': 8, 'State': 'in-use',
+            'CreateTime': NOW, 'Tags': [{'Key': 'Name', 'Value': volumeid}]}
+
+
+def fixture_ebs(client, identifier=None):
+    ebs = snapshot.EBSSnapshot(region='no-region-1', executor='thread', workers=2, identifier=identifier)
+    ebs.session(FakeSession())
+    ebs.connection(client)
+    return ebs
+
+
+#
+# Tests
+#
+def test_plan_save_load(tmpdir):
+    path = os.path.join(str(tmpdir), 'plan.json')
+    expire = plan.Plan('expire_snapshot', description='test')
+    expire.add('123456789012', 'no-region-2', None, [fixture_snap('snap-2', timedelta(days=9))])
+    expire.add('123456789012', 'no-region-1', None, [fixture_snap('snap-b', timedelta(days=8)),
+                                                      fixture_snap('snap-a', timedelta(days=9))])
+    expire.save(path)
+
+    document = json.load(open(path))
+    assert [target['region'] for target in document['targets']] == ['no-region-1', 'no-region-2']
+    assert [item['SnapshotId'] for item in document['targets'][0]['items']] == ['snap-a', 'snap-b']
+    assert 'Progress' not in document['targets'][0]['items'][0]
+
+    loaded = plan.Plan.load(path)
+    assert (loaded.action, loaded.uuid, loaded.description) == ('expire_snapshot', expire.uuid, 'test')
+    assert loaded.items('123456789012', 'no-region-2')[0]['StartTime'] == NOW - timedelta(days=9)
+
+    # Saving again produces the same file
+    loaded.save(path + '.2')
+    assert open(path).read() == open(path + '.2').read()
+
+
+def test_plan_errors(tmpdir):
+    with pytest.raises(ValueError):
+        plan.Plan('resize_volume')
+
+    create = plan.Plan('create_snapshot')
+    with pytest.raises(ValueError):
+        create.items('123456789012', 'no-region-1')
+
+    path = os.path.join(str(tmpdir), 'plan.json')
+    json.dump({'version': 0, 'action': 'create_snapshot', 'uuid': 'x', 'targets': []}, open(path, 'w'))
+    with pytest.raises(ValueError):
+        plan.Plan.load(path)
+
+
+def test_expire_plan_apply(tmpdir):
+    client = FakeClient(snapshots=[fixture_snap('snap-new', timedelta(days=1)),
+                                   fixture_snap('snap-old', timedelta(days=30)),
+                                   fixture_snap('snap-ami', timedelta(days=30))],
+                        images=[{'ImageId': 'ami-1', 'BlockDeviceMappings': [
+                            {'DeviceName': '/dev/xvda', 'Ebs': {'SnapshotId': 'snap-ami'}},
+                            {'DeviceName': '/dev/sdb', 'VirtualName': 'ephemeral0'}]}])
+    expire = plan.Plan('expire_snapshot')
+    summary = fixture_ebs(client).expire_snapshot_boss(gt=-7, plan=expire)
+    # The snapshot backing an image is dropped instead of failing to delete
+    assert summary == {'described': 3, 'inlife': 1, 'in_use': 1, 'queued': 1, 'planned': 1}
+    assert client.calls == []
+
+    path = os.path.join(str(tmpdir), 'plan.json')
+    expire.save(path)
+    client = FakeClient()
+    summary = fixture_ebs(client).apply_plan(plan.Plan.load(path))
+    assert summary['queued'] == 1 and summary['success'] == 1
+    assert client.calls == [('delete_snapshot', 'snap-old')]
+
+
+def test_create_plan_apply():
+    client = FakeClient(volumes=[fixture_vol('vol-{}'.format(i)) for i in range(5)])
+    create = plan.Plan('create_snapshot')
+    assert fixture_ebs(client).create_snapshot_boss(plan=create)['planned'] == 5
+    assert client.calls == []
+
+    with pytest.raises(ValueError):
+        fixture_ebs(client).expire_snapshot_boss(plan=create)
+
+    summary = fixture_ebs(client, identifier=create.uuid).apply_plan(create)
+    assert summary['success'] == 5
+    assert sorted(client.calls) == [('create_snapshot', 'vol-{}'.format(i)) for i in range(5)]
+
+
+def test_plan_without_session(monkeypatch):
+    # The session is created when the run first needs it, not by the caller
+    client = FakeClient(volumes=[fixture_vol('vol-{}'.format(i)) for i in range(3)])
+    fake_boto3(monkeypatch, client)
+    create = plan.Plan('create_snapshot')
+    ebs = snapshot.EBSSnapshot(region='no-region-1', executor='thread', workers=2, identifier=create.uuid)
+    assert ebs.create_snapshot_boss(plan=create)['planned'] == 3
+
+    summary = snapshot.EBSSnapshot(region='no-region-1', executor='thread', workers=2,
+                                   identifier=create.uuid).apply_plan(create)
+    assert summary['success'] == 3 and len(client.calls) == 3
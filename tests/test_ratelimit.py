@@ -0,0 +1,124 @@
+from botocore.awsrequest import AWSResponse
+from ebssnapshot import ratelimit
+
+import boto3
+import threading
+import time
+
+
+#
+# Helper Classes
+#
+class Raw:
+    def __init__(self, body):
+        self.body = body
+
+    def stream(self, **kwargs):
+        yield self.body
+
+
+class ThrottlingEC2:
+    """
+    Answers CreateSnapshot from the before-send event. Calls over `capacity` per second are throttled.
+    """
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.lock = threading.Lock()
+        self.tokens = capacity
+        self.updated = time.time()
+        self.accepted = 0
+        self.throttled = 0
+
+    def send(self, request, **kwargs):
+        with self.lock:
+            now = time.time()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.capacity)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                self.accepted += 1
+                body = ('<CreateSnapshotResponse><snapshotId>snap-1</snapshotId><volumeId>vol-1</volumeId>'
+                        '<status>pending</status></CreateSnapshotResponse>')
+                return AWSResponse(request.url, 200, {}, Raw(body))
+
+            self.throttled += 1
+            body = ('<Response><Errors><Error><Code>RequestLimitExceeded</Code><Message>Request limit exceeded.'
+                    '</Message></Error></Errors></Response>')
+            return AWSResponse(request.url, 503, {}, Raw(body))
+
+
+def client(stub):
+    sess = boto3.session.Session(aws_access_key_id='stub', aws_secret_access_key='stub', region_name='no-region-1')
+    sess.events.register('before-send.ec2.CreateSnapshot', stub.send)
+    return sess.client('ec2', config=boto3.session.Config(retries={'max_attempts': 0}))
+
+
+#
+# Tests
+#
+def test_token_bucket_rate():
+    bucket = ratelimit.TokenBucket(rate=50.0)
+    start = time.time()
+    for _ in range(26):
+        bucket.acquire()
+    elapsed = time.time() - start
+
+    assert 0.4 <= elapsed < 1.0
+    assert bucket.stats()['calls'] == 26
+
+
+def test_token_bucket_aimd():
+    bucket = ratelimit.TokenBucket(rate=10.0, min_rate=1.0, max_rate=20.0, cooldown=60)
+    bucket.throttled()
+    bucket.throttled()
+    stats = bucket.stats()
+    assert stats['rate'] == 5.0
+    assert stats['throttles'] == 2
+
+    for _ in range(1000):
+        bucket.succeeded()
+    assert bucket.stats()['rate'] == 20.0
+
+
+def simulate(limiter, capacity=40, seconds=2, workers=8):
+    """
+    Workers call CreateSnapshot as fast as they can against a throttling stub
+
+    :rtype: ThrottlingEC2
+    """
+    stub = ThrottlingEC2(capacity)
+    ec2 = client(stub)
+    if limiter:
+        limiter.attach(ec2)
+
+    deadline = time.time() + seconds
+
+    def worker():
+        while time.time() < deadline:
+            try:
+                ec2.create_snapshot(VolumeId='vol-1')
+            except Exception:
+                pass
+
+    threads = [threading.Thread(target=worker) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return stub
+
+
+def test_rate_limiter_simulation():
+    limiter = ratelimit.RateLimiter(region='no-region-1', rate=100.0, cooldown=0.5)
+    limited = simulate(limiter)
+    unlimited = simulate(None)
+
+    stats = limiter.stats()['CreateSnapshot']
+    calls = limited.accepted + limited.throttled
+    assert stats['calls'] == calls
+    assert stats['throttles'] == limited.throttled
+    assert stats['rate'] < 100.0
+    assert limited.accepted >= 40 * 2 * 0.5
+    assert limited.throttled < 0.3 * calls
+    assert unlimited.throttled > 0.5 * (unlimited.accepted + unlimited.throttled)
@@ -0,0 +1,122 @@
+from datetime import datetime, timedelta
+from dateutil.tz import tzutc
+from ebssnapshot import retention
+
+import collections
+import pytest
+import time
+
+
+#
+# Fixtures
+#
+NOW = datetime(2020, 6, 15, 12, 0, tzinfo=tzutc())
+
+
+def fixture_snap(snapshotid, volumeid='vol-1', age=timedelta(0), state='completed', policy=None):
+    snap = {'SnapshotId': snapshotid, 'VolumeId': volumeid, 'StartTime': NOW - age, 'State': state}
+    if policy is not None:
+        snap['Tags'] = [{'Key': retention.POLICY_TAG, 'Value': policy}]
+    return snap
+
+
+def expired(snapshots, policy, counter=None):
+    batches = retention.Retention(policy).expire([snapshots], counter)
+    return sorted(snap['SnapshotId'] for batch in batches for snap in batch)
+
+
+#
+# Tests
+#
+def test_policy_parse():
+    policy = retention.Policy.parse('last=2, daily=7,weekly=4,monthly=12')
+    assert (policy.last, policy.hourly, policy.daily, policy.weekly, policy.monthly, policy.yearly) == (2, 0, 7, 4, 12, 0)
+
+
+@pytest.mark.parametrize('spec', ['daily=7,fortnightly=2', 'daily=x', 'daily=-1', '', ' , ', 'last=0',
+                                  'monthly=0', 'last=0,daily=0'])
+def test_policy_parse_invalid(spec):
+    with pytest.raises(ValueError):
+        retention.Policy.parse(spec)
+
+
+def test_retention_daily():
+    # Two snapshots a day for 10 days. Only the newest of the last 3 days are kept.
+    snapshots = [fixture_snap('snap-{:02d}'.format(i), age=timedelta(hours=12 * i)) for i in range(20)]
+    counter = collections.Counter()
+    assert expired(snapshots, retention.Policy(last=1, daily=3), counter) == \
+        sorted('snap-{:02d}'.format(i) for i in range(20) if i not in (0, 2, 4))
+    assert counter['retained'] == 3
+
+
+def test_retention_weekly_monthly():
+    # One snapshot a day for 90 days. NOW is a Monday.
+    snapshots = [fixture_snap('snap-{:02d}'.format(i), age=timedelta(days=i)) for i in range(90)]
+    kept = set(snap['SnapshotId'] for snap in snapshots) - set(expired(snapshots, retention.Policy(
+        last=0, weekly=2, monthly=3)))
+    # Monday 15th, Sunday 14th, then the last day of May and of April
+    assert kept == set(['snap-00', 'snap-01', 'snap-15', 'snap-46'])
+
+
+def test_retention_last():
+    snapshots = [fixture_snap('snap-{}'.format(i), age=timedelta(minutes=i)) for i in range(5)]
+    assert expired(snapshots, retention.Policy(last=2)) == ['snap-2', 'snap-3', 'snap-4']
+
+
+def test_retention_per_volume():
+    snapshots = [fixture_snap('snap-a{}'.format(i), volumeid='vol-a', age=timedelta(days=i)) for i in range(3)]
+    snapshots += [fixture_snap('snap-b{}'.format(i), volumeid='vol-b', age=timedelta(days=i)) for i in range(3)]
+    assert expired(snapshots, retention.Policy(last=1)) == ['snap-a1', 'snap-a2', 'snap-b1', 'snap-b2']
+
+
+def test_retention_pending_kept():
+    snapshots = [fixture_snap('snap-0'), fixture_snap('snap-1', age=timedelta(days=1), state='pending')]
+    assert expired(snapshots, retention.Policy(last=1)) == []
+
+
+def test_retention_policy_tag():
+    snapshots = [fixture_snap('snap-{}'.format(i), age=timedelta(days=i), policy='last=3') for i in range(5)]
+    assert expired(snapshots, retention.Policy(last=1)) == ['snap-3', 'snap-4']
+
+
+def test_retention_invalid_policy_tag_retained():
+    snapshots = [fixture_snap('snap-{}'.format(i), age=timedelta(days=i), policy='daily=lots') for i in range(5)]
+    counter = collections.Counter()
+    assert expired(snapshots, retention.Policy(last=1), counter) == []
+    assert counter['retained'] == 5
+
+
+@pytest.mark.parametrize('spec', ['', 'last=0', 'monthly=0'])
+def test_retention_empty_policy_tag_retained(spec):
+    snapshots = [fixture_snap('snap-{}'.format(i), age=timedelta(days=i), policy=spec) for i in range(5)]
+    counter = collections.Counter()
+    assert expired(snapshots, retention.Policy(last=1), counter) == []
+    assert counter['retained'] == 5
+
+
+def test_retention_copies_retained():
+    # Copies of unrelated volumes share the unknown VolumeId
+    snapshots = [fixture_snap('snap-copy-{}'.format(i), volumeid=retention.UNKNOWN_VOLUME, age=timedelta(days=i))
+                 for i in range(3)]
+    snapshots += [fixture_snap('snap-{}'.format(i), age=timedelta(days=i)) for i in range(3)]
+    counter = collections.Counter()
+    assert expired(snapshots, retention.Policy(last=1), counter) == ['snap-1', 'snap-2']
+    assert counter['retained'] == 4
+
+
+def test_retention_large_inventory():
+    # 1,000,000 snapshots over 10,000 volumes, 100 daily snapshots each. Kept: days 0 to 6 plus the Sundays 8 and 15
+    # days ago.
+    def pages():
+        for volume in range(10000):
+            volumeid = 'vol-{}'.format(volume)
+            yield [{'SnapshotId': '{}-{}'.format(volumeid, day), 'VolumeId': volumeid, 'State': 'completed',
+                    'StartTime': NOW - timedelta(days=day)} for day in range(100)]
+
+    counter = collections.Counter()
+    started = time.time()
+    count = sum(len(batch) for batch in retention.Retention(retention.Policy(last=1, daily=7, weekly=4)).expire(
+        pages(), counter))
+    assert count == 10000 * (100 - 9)
+    assert counter['retained'] == 10000 * 9
+    assert time.time() - started < 60
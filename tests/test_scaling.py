@@ -0,0 +1,127 @@
+from ebssnapshot import scaling, snapshot, supervisor
+from fakes import FakeEBS
+
+import collections
+import pytest
+import threading
+import time
+
+
+#
+# Fake classes
+#
+class FakeRateLimiter():
+    def __init__(self):
+        self.totals_ = collections.Counter()
+
+    def totals(self):
+        return collections.Counter(self.totals_)
+
+    def stats(self):
+        return {}
+
+
+class FakeAutoscaler():
+    """
+    Decides the workers in turn, then keeps the last
+    """
+    def __init__(self, bounds, ebs, targets):
+        self.bounds = bounds
+        self.targets = list(targets)
+        self.counter = collections.Counter()
+        self.decided = []
+
+    def sample(self, backlog):
+        pass
+
+    def decide(self, workers):
+        self.decided.append(workers)
+        return self.targets.pop(0) if len(self.targets) > 1 else self.targets[0]
+
+
+#
+# Fixtures
+#
+def fixture_window(limiter, autoscaler, **totals):
+    """
+    Add to the rate limiter totals and end the window of the autoscaler
+    """
+    limiter.totals_.update(totals)
+    autoscaler._started -= autoscaler.window
+
+
+#
+# Tests
+#
+def test_bounds_parse():
+    bounds = scaling.Bounds.parse('2:32')
+    assert (bounds.minimum, bounds.maximum) == (2, 32)
+    assert bounds.clamp(1) == 2 and bounds.clamp(40) == 32
+
+    for spec in ('8', '0:4', '8:4'):
+        with pytest.raises(ValueError):
+            scaling.Bounds.parse(spec)
+
+
+def test_autoscaler_decide():
+    limiter = FakeRateLimiter()
+    autoscaler = scaling.Autoscaler(scaling.Bounds(2, 12), FakeEBS(limiter=limiter), window=10)
+    assert autoscaler.decide(4) is None
+
+    # Jobs back up while calls are fast and rarely throttled
+    autoscaler.sample(3)
+    fixture_window(limiter, autoscaler, calls=100, responses=100, latency=2.0)
+    assert autoscaler.decide(4) == 6
+    assert autoscaler.baseline == 0.02
+
+    # Latency rises to three times the fastest window
+    autoscaler.sample(3)
+    fixture_window(limiter, autoscaler, calls=100, responses=100, latency=6.0)
+    assert autoscaler.decide(6) == 5
+
+    # Throttled calls halve the workers
+    autoscaler.sample(3)
+    fixture_window(limiter, autoscaler, calls=100, throttles=10, responses=100, latency=2.0)
+    assert autoscaler.decide(5) == 2
+
+    # Workers waiting on the rate limiter are kept even with jobs backed up
+    autoscaler.sample(3)
+    fixture_window(limiter, autoscaler, calls=100, responses=100, latency=2.0, waited=60.0)
+    assert autoscaler.decide(4) == 4
+
+    # No backlog, down to the minimum
+    fixture_window(limiter, autoscaler, calls=100, responses=100, latency=2.0)
+    assert autoscaler.decide(2) == 2
+    assert autoscaler.counter == {'scaled_up': 1, 'scaled_down': 2, 'peak_workers': 6}
+
+
+def test_boss_autoscale(monkeypatch):
+    Supervisor = supervisor.Supervisor
+    monkeypatch.setattr(supervisor, 'Supervisor', lambda *args, **kwargs: Supervisor(*args, interval=0.01, **kwargs))
+    autoscalers = []
+
+    def autoscaler(bounds, ebs):
+        autoscalers.append(FakeAutoscaler(bounds, ebs, [4, 4, 1, 1, 3]))
+        return autoscalers[0]
+
+    monkeypatch.setattr(scaling, 'Autoscaler', autoscaler)
+    lock = threading.Lock()
+    processed = []
+
+    def worker(workerid, jobqueue, ebs):
+        for job in snapshot.jobs(jobqueue, ebs, workerid):
+            for item in job:
+                time.sleep(0.005)
+                with lock:
+                    processed.append((workerid, item))
+
+    ebs = FakeEBS(workers=1, executor='thread', autoscale=scaling.Bounds(1, 4))
+    summary = snapshot.boss(ebs, worker, [[i] for i in range(60)])
+
+    assert sorted(item for _, item in processed) == range(60)
+    assert set(workerid for workerid, _ in processed) == set([1, 2, 3, 4])
+    # Scaled up, retired down to one worker and scaled up again
+    decided = autoscalers[0].decided
+    assert decided[0] == 1 and 4 in decided and decided[decided.index(4):].count(1) > 0
+    # Retired workers are not respawned
+    assert summary == {'dispatched': 60}
@@ -0,0 +1,106 @@
+from datetime import datetime, timedelta
+from dateutil.tz import tzutc
+from ebssnapshot import scheduler, snapshot
+from fakes import FakeSession
+
+
+#
+# Fake classes
+#
+class FakePaginator():
+    def __init__(self, client, name):
+        self.client = client
+        self.name = name
+
+    def paginate(self, **kwargs):
+        if self.name == 'describe_volumes':
+            return [{'Volumes': self.client.volumes[i:i + 2]} for i in range(0, len(self.client.volumes), 2)]
+
+        self.client.describes += 1
+        return [{'Snapshots': self.client.snapshots}]
+
+
+class FakeClient():
+    def __init__(self, volumes, snapshots):
+        self.volumes = volumes
+        self.snapshots = snapshots
+        self.created = []
+        self.describes = 0
+
+    def get_paginator(self, name):
+        return FakePaginator(self, name)
+
+    def create_snapshot(self, Description, VolumeId, TagSpecifications=None):
+        self.created.append(VolumeId)
+        return {'SnapshotId': 'snap-' + VolumeId, 'StartTime': datetime.now(tzutc())}
+
+
+#
+# Fixtures
+#
+NOW = datetime.now(tzutc())
+
+
+def fixture_vol(volumeid, size=8, priority=None):
+    volume = {'VolumeId': volumeid, 'AvailabilityZone': 'no-region-1a', 'Size': size}
+    if priority is not None:
+        volume['Tags'] = [{'Key': scheduler.PRIORITY_TAG, 'Value': priority}]
+    return volume
+
+
+def fixture_snap(volumeid, days):
+    return {'SnapshotId': 'snap-old-' + volumeid, 'VolumeId': volumeid, 'StartTime': NOW - timedelta(days=days),
+            'State': 'completed', 'Tags': [{'Key': 'backup-uuid', 'Value': 'run-0'}]}
+
+
+def fixture_volumes():
+    return [
+        fixture_vol('vol-small'),
+        fixture_vol('vol-large', size=500),
+        fixture_vol('vol-recent', size=500),
+        fixture_vol('vol-critical', priority='10'),
+        fixture_vol('vol-low', size=1000, priority='-1'),
+        fixture_vol('vol-invalid', priority='high'),
+    ]
+
+
+def fixture_snaps():
+    return [fixture_snap('vol-small', 2), fixture_snap('vol-large', 2), fixture_snap('vol-recent', 1),
+            fixture_snap('vol-critical', 1), fixture_snap('vol-low', 6)]
+
+
+#
+# Tests
+#
+def test_scheduler_rank():
+    latest = dict((snap['VolumeId'], snap) for snap in fixture_snaps())
+    stream = scheduler.Scheduler(100, latest).stage([fixture_volumes()[:3], fixture_volumes()[3:]])
+
+    assert [volume['VolumeId'] for batch in stream for volume in batch] == [
+        'vol-critical', 'vol-invalid', 'vol-large', 'vol-small', 'vol-recent', 'vol-low']
+
+
+def test_scheduler_bounded():
+    volumes = [fixture_vol('vol-{:02d}'.format(i), priority=str(i % 7)) for i in range(50)]
+    schedule = scheduler.Scheduler(5)
+    released = [volume['VolumeId'] for batch in schedule.stage([volumes[i:i + 10] for i in range(0, 50, 10)])
+                for volume in batch]
+
+    assert schedule.peak == 5
+    assert sorted(released) == sorted(volume['VolumeId'] for volume in volumes)
+    # vol-06 is held until the window fills and released ahead of the lower priority volumes before it
+    assert released.index('vol-06') < released.index('vol-00')
+
+
+def test_create_snapshot_boss_schedule():
+    client = FakeClient(fixture_volumes(), fixture_snaps())
+    ebs = snapshot.EBSSnapshot(region='no-region-1', executor='thread', workers=1, batch=1, identifier='run-1',
+                               dedup=3600, schedule=100)
+    ebs.session(FakeSession())
+    ebs.connection(client)
+    summary = ebs.create_snapshot_boss()
+
+    assert summary['success'] == 6
+    assert client.created == ['vol-critical', 'vol-invalid', 'vol-large', 'vol-small', 'vol-recent', 'vol-low']
+    # One index of the latest snapshots is described for both deduplication and scheduling
+    assert client.describes == 2
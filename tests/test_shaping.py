@@ -0,0 +1,147 @@
+from botocore.exceptions import ClientError
+from datetime import datetime
+from dateutil.tz import tzutc
+from ebssnapshot import completion, shaping, snapshot
+from fakes import FakeSession
+from Queue import Empty
+
+import collections
+import pytest
+import threading
+
+
+#
+# Fake classes
+#
+class FakePaginator():
+    def __init__(self, items):
+        self.items = items
+
+    def paginate(self, **kwargs):
+        return [{'Volumes': self.items}]
+
+
+class FakeClient():
+    def __init__(self, volumes, defer=None):
+        """
+        :param defer: Number of times CreateSnapshot is deferred by VolumeId
+        """
+        self.volumes = volumes
+        self.defer = collections.Counter(defer or {})
+        self.zones = dict((volume['VolumeId'], volume['AvailabilityZone']) for volume in volumes)
+        self.pending = {}
+        self.polls = collections.Counter()
+        self.peak = collections.Counter()
+        self.created = collections.Counter()
+        self._lock = threading.Lock()
+
+    def get_paginator(self, name):
+        return FakePaginator(self.volumes)
+
+    def create_snapshot(self, Description, VolumeId, TagSpecifications=None):
+        with self._lock:
+            if self.defer[VolumeId]:
+                self.defer[VolumeId] -= 1
+                raise ClientError({'Error': {'Code': 'SnapshotCreationPerVolumeRateExceeded', 'Message': VolumeId}},
+                                  'CreateSnapshot')
+
+            self.created[VolumeId] += 1
+            snapshot_id = 'snap-{}-{}'.format(VolumeId, self.created[VolumeId])
+            self.pending[snapshot_id] = VolumeId
+            zones = collections.Counter(self.zones[volume_id] for volume_id in self.pending.values())
+            self.peak['account'] = max(self.peak['account'], len(self.pending))
+            self.peak['zone'] = max(self.peak['zone'], max(zones.values()))
+            return {'SnapshotId': snapshot_id, 'VolumeId': VolumeId, 'StartTime': datetime.now(tzutc())}
+
+    def describe_snapshots(self, SnapshotIds):
+        # Snapshots complete on their second poll
+        with self._lock:
+            snapshots = []
+            for snapshot_id in SnapshotIds:
+                self.polls[snapshot_id] += 1
+                state = 'completed' if self.polls[snapshot_id] > 1 else 'pending'
+                if state == 'completed':
+                    self.pending.pop(snapshot_id, None)
+                snapshots.append({'SnapshotId': snapshot_id, 'State': state})
+            return {'Snapshots': snapshots}
+
+
+class FakeQueue():
+    def __init__(self, items):
+        self.items = items
+
+    def get(self, block=True, timeout=None):
+        return self.get_nowait()
+
+    def get_nowait(self):
+        if not self.items:
+            raise Empty()
+        return self.items.popleft()
+
+
+#
+# Fixtures
+#
+def fixture_volumes(count=8):
+    return [{'VolumeId': 'vol-{}'.format(i), 'AvailabilityZone': 'no-region-1' + 'ab'[i % 2]} for i in range(count)]
+
+
+def fixture_ebs(monkeypatch, client, pending=None):
+    tracker, shaper = completion.CompletionTracker, shaping.Shaper
+    monkeypatch.setattr(completion, 'CompletionTracker',
+                        lambda ebs, timeout: tracker(ebs, timeout, interval=0.01, max_interval=0.02))
+    monkeypatch.setattr(shaping, 'Shaper', lambda limits, size: shaper(limits, size, delay=0.01, interval=0.05))
+    ebs = snapshot.EBSSnapshot(region='no-region-1', executor='thread', workers=4, batch=2, identifier='run-1',
+                               pending=pending)
+    ebs.session(FakeSession())
+    ebs.connection(client)
+    return ebs
+
+
+#
+# Tests
+#
+def test_limits_parse():
+    limits = shaping.Limits.parse('account=100, zone=25')
+    assert (limits.account, limits.zone, limits.volume) == (100, 25, 1)
+
+    with pytest.raises(ValueError):
+        shaping.Limits.parse('region=1')
+    with pytest.raises(ValueError):
+        shaping.Limits.parse('zone=-1')
+
+
+def test_create_snapshot_boss_pending(monkeypatch):
+    client = FakeClient(fixture_volumes(), defer={'vol-1': 2, 'vol-4': 1})
+    ebs = fixture_ebs(monkeypatch, client, pending=shaping.Limits(account=3, zone=2))
+    summary = ebs.create_snapshot_boss()
+
+    assert summary['success'] == 8 and not summary.get('error')
+    assert summary['deferred'] == 3 and summary['redispatched'] == 3
+    assert summary['admission_waits'] > 0
+    assert client.peak['account'] <= 3 and client.peak['zone'] <= 2
+    assert sum(client.created.values()) == 8
+
+
+def test_create_snapshot_deferred(monkeypatch):
+    # Without shaping a deferred volume is not an error. It is retried when the run is resumed.
+    client = FakeClient(fixture_volumes(2), defer={'vol-1': 1})
+    summary = fixture_ebs(monkeypatch, client).create_snapshot_boss()
+
+    assert summary['success'] == 1 and summary['deferred'] == 1 and not summary.get('error')
+
+
+def test_shaper_deferral_exhausted():
+    queue = collections.deque()
+    shaper = shaping.Shaper(shaping.Limits(), size=10, delay=0, max_deferrals=1, interval=0.01)
+    shaper.start(FakeQueue(queue))
+    volume = fixture_volumes(1)[0]
+
+    batches = shaper.stage([[volume]])
+    assert next(batches) == [volume]
+    queue.append((shaping.DEFERRED, volume))
+    assert next(batches) == [volume]
+    queue.append((shaping.DEFERRED, volume))
+    assert list(batches) == []
+    assert shaper.exhausted() == [volume] and shaper.counter['deferral_exhausted'] == 1
+
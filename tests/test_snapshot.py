@@ -1,9 +1,11 @@
 from botocore.exceptions import ClientError
 from datetime import timedelta
 from dateutil.tz import tzutc
-from ebssnapshot import snapshot
+from ebssnapshot import executor, retention, snapshot
+from fakes import FakeEBS, FakeSession
 
 import boto3
+import collections
 import datetime
 import ebssnapshot
 import placebo
@@ -117,6 +119,41 @@ class FakeConnection():
     def get_paginator(self, paginator):
         return self.paginatorobj
 
+    def can_paginate(self, paginator):
+        return False
+
+    def describe_images(self, Owners):
+        return {'Images': []}
+
+
+class FakeInstanceConnection(FakeConnection):
+    def __init__(self, volumes, instances):
+        FakeConnection.__init__(self, None)
+        self.volumes = volumes
+        self.instances = instances
+        self.calls = []
+
+    def get_paginator(self, paginator):
+        pages = {
+            'describe_volumes': [{'Volumes': self.volumes}],
+            'describe_instances': [{'Reservations': [{'Instances': self.instances}]}],
+        }
+        paginatorobj = FakePagenator(group=None)
+        paginatorobj.paginate = lambda *args, **kwargs: pages[paginator]
+        return paginatorobj
+
+    def create_snapshot(self, Description, VolumeId, TagSpecifications=None):
+        self.calls.append(('create_snapshot', VolumeId))
+        return {'SnapshotId': 'snap-' + VolumeId, 'StartTime': datetime.datetime.now(tz=tzutc())}
+
+    def create_snapshots(self, Description, InstanceSpecification, TagSpecifications=None, CopyTagsFromSource=None):
+        self.calls.append(('create_snapshots', InstanceSpecification['InstanceId'],
+                           InstanceSpecification['ExcludeBootVolume']))
+        volume_ids = [volume['VolumeId'] for volume in self.volumes
+                      if volume['Attachments'] and volume['Attachments'][0]['InstanceId'] == InstanceSpecification['InstanceId']]
+        return {'Snapshots': [{'SnapshotId': 'snap-' + volume_id, 'VolumeId': volume_id,
+                               'StartTime': datetime.datetime.now(tz=tzutc())} for volume_id in volume_ids]}
+
 
 #
 # Fixtures
@@ -184,6 +221,24 @@ def fixture_vol(Attachments=None, AvailabilityZone=None, CreateTime=None, Encryp
     return vol
 
 
+def fixture_instance_volumes():
+    """
+    i-all has every volume selected, i-data all but the boot volume, i-part only one of two data volumes and
+    i-one a single volume. vol-free is not attached.
+    """
+    layout = {'i-all': ['vol-a0', 'vol-a1', 'vol-a2'], 'i-data': ['vol-d0', 'vol-d1', 'vol-d2'],
+              'i-part': ['vol-p0', 'vol-p1', 'vol-p2'], 'i-one': ['vol-o0']}
+    selected = ['vol-a0', 'vol-a1', 'vol-a2', 'vol-d1', 'vol-d2', 'vol-p1', 'vol-o0']
+    instances = [{'InstanceId': instance_id, 'RootDeviceName': '/dev/sda1', 'BlockDeviceMappings': [
+        {'DeviceName': '/dev/sda1' if i == 0 else '/dev/sd' + 'bcd'[i], 'Ebs': {'VolumeId': volume_id}}
+        for i, volume_id in enumerate(volume_ids)]} for instance_id, volume_ids in sorted(layout.items())]
+    volumes = [fixture_vol(VolumeId=volume_id, Attachments=[fixture_attachment(InstanceId=instance_id, VolumeId=volume_id)])
+               for instance_id, volume_ids in sorted(layout.items()) for volume_id in volume_ids if volume_id in selected]
+    volumes.append(fixture_vol(VolumeId='vol-free'))
+    volumes[-1]['Attachments'] = []
+    return volumes, instances
+
+
 def fixture_regions():
     regions = [
         'ap-northeast-1', 'ap-northeast-2', 'ap-south-1', 'ap-southeast-1', 'ap-southeast-2', 'cn-north-1',
@@ -291,7 +346,8 @@ def test_create_snapshot_boss():
 
     ebs = ebssnapshot.EBSSnapshot(region='no-region-1', identifier=shortuuid.uuid())
     ebs.session(sess)
-    ebs.create_snapshot_boss()
+    summary = ebs.create_snapshot_boss()
+    assert summary == {'described': 10, 'queued': 10, 'dispatched': 1, 'success': 10}
     multiprocess_reaper()
 
 
@@ -302,10 +358,38 @@ def test_expire_snapshot_boss():
 
     ebs = ebssnapshot.EBSSnapshot(region='no-region-1', identifier=shortuuid.uuid())
     ebs.session(sess)
-    ebs.expire_snapshot_boss()
+    summary = ebs.expire_snapshot_boss()
+    # One of the snapshots backs an image
+    assert summary['described'] == 15 and summary['in_use'] == 1 and summary['queued'] == 14
     multiprocess_reaper()
 
 
+def test_create_snapshot_boss_thread():
+    playback = Playback(region_name='no-region-1', data_path=PLACEBO_PATH + '/create_snapshots')
+    sess = playback.session
+    playback.start()
+
+    ebs = ebssnapshot.EBSSnapshot(region='no-region-1', identifier=shortuuid.uuid(), workers=32, executor='thread')
+    ebs.session(sess)
+    # Created before the workers, as when --dedup or --schedule list the latest snapshots
+    ebs.connection()
+    ebs.create_snapshot_boss()
+    assert ebs.connection().meta.config.max_pool_connections == 32
+
+
+def test_expire_snapshot_boss_thread():
+    playback = Playback(region_name='no-region-1', data_path=PLACEBO_PATH + '/expire_snapshots')
+    sess = playback.session
+    playback.start()
+
+    ebs = ebssnapshot.EBSSnapshot(region='no-region-1', identifier=shortuuid.uuid(), workers=32, executor='thread')
+    ebs.session(sess)
+    # The client listing image snapshots is replaced by one sized for the workers
+    summary = ebs.expire_snapshot_boss()
+    assert summary['in_use'] == 1 and summary['success'] == 14
+    assert ebs.connection().meta.config.max_pool_connections == 32
+
+
 def test_expire_snapshot_boss_lt():
     playback = Playback(region_name='no-region-1', data_path=PLACEBO_PATH + '/expire_snapshots')
     sess = playback.session
@@ -341,6 +425,45 @@ def test_snapshots_list():
         pytest.fail()
 
 
+def test_expire_snapshot_boss_prunes_inlife():
+    class RecordingPagenator(FakePagenator):
+        def paginate(self, *args, **kwargs):
+            self.kwargs = kwargs
+            return [{'Snapshots': [fixture_snap() for _ in range(5)]}]
+
+    fakepaginator = RecordingPagenator(group='Snapshots')
+    ebs = snapshot.EBSSnapshot(region='no-region-1', executor='thread')
+    ebs.session(FakeSession())
+    ebs.connection(FakeConnection(paginatorobj=fakepaginator))
+
+    summary = ebs.expire_snapshot_boss(gt=-7)
+    assert fakepaginator.kwargs['OwnerIds'] == ['self']
+    assert summary == {'described': 5, 'inlife': 5, 'in_use': 0, 'queued': 0, 'dispatched': 0}
+
+
+def test_expire_snapshot_boss_retention():
+    now = datetime.datetime.now(tz=tzutc())
+    snapshots = [fixture_snap(SnapshotId='snap-{}'.format(i), VolumeId='vol-1', StartTime=now - timedelta(days=i))
+                 for i in range(5)]
+
+    class DeletingConnection(FakeConnection):
+        deleted = []
+
+        def delete_snapshot(self, SnapshotId):
+            self.deleted.append(SnapshotId)
+
+    fakepaginator = FakePagenator(group='Snapshots')
+    fakepaginator.paginate = lambda *args, **kwargs: [{'Snapshots': snapshots}]
+    conn = DeletingConnection(paginatorobj=fakepaginator)
+    ebs = snapshot.EBSSnapshot(region='no-region-1', executor='thread', workers=1)
+    ebs.session(FakeSession())
+    ebs.connection(conn)
+
+    summary = ebs.expire_snapshot_boss(retention=retention.Retention(retention.Policy(last=2)))
+    assert sorted(conn.deleted) == ['snap-2', 'snap-3', 'snap-4']
+    assert summary == {'described': 5, 'retained': 2, 'in_use': 0, 'queued': 3, 'dispatched': 1, 'success': 3}
+
+
 def test_filter_inlife_snapshot_gt():
     date = datetime.datetime.now(tz=tzutc())
     date = date + timedelta(days=-2)
@@ -412,6 +535,44 @@ def test_volumes_list_filters():
         pytest.fail()
 
 
+def test_clone():
+    ebs = snapshot.EBSSnapshot(region='no-region-1', desc='test', readtimeout=10, executor='thread')
+    ebs.session(FakeSession())
+    clone = ebs.clone()
+    assert clone is not ebs
+    assert clone.readtimeout == 10
+    assert clone.description == 'test'
+    assert clone.uuid == ebs.uuid
+    assert clone.session() is ebs.session()
+
+
+def test_run_context_tag_specifications():
+    context = snapshot.RunContext('test', 'uuid-1', {'Account': '123456789012', 'UserId': 'AIDAFAKE'})
+    volume = fixture_vol(Tags=fixture_tags())
+    specs = context.tag_specifications(volume)
+    tags = specs[0]['Tags']
+
+    assert specs[0]['ResourceType'] == 'snapshot'
+    assert {'Key': 'backup-uuid', 'Value': 'uuid-1'} in tags
+    assert tags[len(context.tags)] == {'Key': 'backup-token', 'Value': 'uuid-1:' + volume['VolumeId']}
+    assert tags[len(context.tags) + 1:] == volume['Tags']
+    assert len(context.tag_specifications(volume)[0]['Tags']) == len(tags)
+
+
+def test_clone_shares_context():
+    ebs = snapshot.EBSSnapshot(region='no-region-1')
+    ebs.session(FakeSession())
+    context = ebs.context()
+    clone = ebs.clone()
+    assert clone.context() is context
+    assert context.identity['Account'] == '123456789012'
+
+
+def test_executor_unknown():
+    with pytest.raises(ValueError):
+        executor.executor('fork-bomb')
+
+
 def test_giveup_limit_exceeded():
     code = 'RequestLimitExceeded'
     operation_name = 'DeleteSnapshot'
@@ -439,3 +600,89 @@ def test_taginfo():
 
     if not hashost:
         pytest.fail('Missing host information from tag')
+
+
+def test_boss_workers_exit():
+    counter = multiprocessing.Value('i', 0)
+
+    def worker(workerid, jobqueue, ebs):
+        for job in snapshot.jobs(jobqueue, ebs, workerid):
+            for item in job:
+                with counter.get_lock():
+                    counter.value += item
+
+    snapshot.boss(FakeEBS(workers=2), worker, [[1]] * 25)
+    assert counter.value == 25
+    assert not multiprocessing.active_children()
+
+
+def test_boss_no_children(monkeypatch):
+    def worker(workerid, jobqueue, ebs):
+        return
+
+    monkeypatch.setattr(snapshot, 'LIVENESS_INTERVAL', 0.1)
+    with pytest.raises(SystemExit):
+        snapshot.boss(FakeEBS(workers=1), worker, range(1, 10))
+    multiprocess_reaper()
+
+
+def test_boss_summary():
+    def worker(workerid, jobqueue, ebs):
+        results = collections.Counter()
+        for job in snapshot.jobs(jobqueue, ebs, workerid):
+            for item in job:
+                results['success' if item % 2 else 'error'] += 1
+        return results
+
+    summary = snapshot.boss(FakeEBS(workers=2, executor='thread'), worker, [[i] for i in range(10)])
+    assert summary == {'dispatched': 10, 'success': 5, 'error': 5}
+
+
+def test_group_instances():
+    volumes, instances = fixture_instance_volumes()
+    ebs = snapshot.EBSSnapshot(region='no-region-1', instances=True)
+    ebs.connection(FakeInstanceConnection(volumes, instances))
+
+    counter = collections.Counter()
+    items = [item for batch in ebs.group_instances([volumes[:4], volumes[4:]], counter) for item in batch]
+    groups = dict((item.InstanceId, item) for item in items if isinstance(item, snapshot.InstanceGroup))
+    singles = sorted(item['VolumeId'] for item in items if not isinstance(item, snapshot.InstanceGroup))
+
+    assert sorted(groups) == ['i-all', 'i-data']
+    assert not groups['i-all'].ExcludeBootVolume
+    assert groups['i-data'].ExcludeBootVolume
+    assert singles == ['vol-free', 'vol-o0', 'vol-p1']
+    assert counter == {'instances': 2, 'grouped': 5}
+
+
+def test_create_snapshot_boss_instances():
+    volumes, instances = fixture_instance_volumes()
+    conn = FakeInstanceConnection(volumes, instances)
+    ebs = snapshot.EBSSnapshot(region='no-region-1', executor='thread', workers=2, instances=True)
+    ebs.session(FakeSession())
+    ebs.connection(conn)
+
+    summary = ebs.create_snapshot_boss()
+    assert summary['success'] == 8
+    assert summary['instances'] == 2
+    assert sorted(conn.calls) == [('create_snapshot', 'vol-free'), ('create_snapshot', 'vol-o0'),
+                                  ('create_snapshot', 'vol-p1'), ('create_snapshots', 'i-all', False),
+                                  ('create_snapshots', 'i-data', True)]
+
+
+def test_create_instance_snapshots_attached_later():
+    volumes, instances = fixture_instance_volumes()
+    conn = FakeInstanceConnection(volumes, instances)
+    ebs = snapshot.EBSSnapshot(region='no-region-1', instances=True)
+    ebs.session(FakeSession())
+    ebs.connection(conn)
+    group = [item for batch in ebs.group_instances([volumes]) for item in batch
+             if isinstance(item, snapshot.InstanceGroup) and item.InstanceId == 'i-all'][0]
+
+    # Attached once the instance was described, snapshotted by CreateSnapshots all the same
+    conn.volumes.append(fixture_vol(VolumeId='vol-a3', Attachments=[fixture_attachment(InstanceId='i-all',
+                                                                                      VolumeId='vol-a3')]))
+    logs = ebs.create_instance_snapshots(group)
+    assert [(log['VolumeId'], log['result']) for log in logs] == [
+        ('vol-a0', 'success'), ('vol-a1', 'success'), ('vol-a2', 'success'), ('vol-a3', 'success')]
+    assert logs[-1]['SnapshotId'] == 'snap-vol-a3' and logs[-1]['InstanceId'] == 'i-all'
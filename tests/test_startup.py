@@ -0,0 +1,65 @@
+from ebssnapshot import snapshot
+
+import json
+import os
+import pytest
+import subprocess
+import sys
+
+
+#
+# Variables
+#
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules that must not be loaded until a run needs them. Each costs 100ms or more to import.
+DEFERRED = ('boto3', 'botocore.client', 'botocore.session', 'placebo')
+
+
+#
+# Fixtures
+#
+def fixture_loaded(code):
+    """
+    Run code in a fresh interpreter
+
+    :return: Deferred modules loaded by the code and its output
+    :rtype: tuple
+    """
+    script = ('import json, sys\n'
+              '{code}\n'
+              'sys.stderr.write(json.dumps([m for m in {deferred!r} if sys.modules.get(m)]))\n').format(
+        code=code, deferred=DEFERRED)
+    proc = subprocess.Popen([sys.executable, '-c', script], cwd=ROOT, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    out, err = proc.communicate()
+    return json.loads(err.splitlines()[-1]), out
+
+
+#
+# Tests
+#
+def test_import_deferred():
+    loaded, _ = fixture_loaded('import ebssnapshot, ebssnapshot.orchestrator, ebssnapshot.plan\n'
+                               'ebssnapshot.EBSSnapshot(region="no-region-1")')
+    # An EBSSnapshot builds its botocore config when it is created, its session only when it connects
+    assert loaded == ['botocore.client']
+
+
+def test_cli_version_deferred():
+    loaded, out = fixture_loaded('import runpy\n'
+                                 'sys.argv = ["ebssnap", "--version"]\n'
+                                 'try:\n'
+                                 '    runpy.run_path("scripts/ebssnap", run_name="__main__")\n'
+                                 'except SystemExit:\n'
+                                 '    pass')
+    assert loaded == []
+    assert out.strip()
+
+
+def test_record_without_placebo(monkeypatch, tmpdir):
+    # A None entry in sys.modules makes the import fail as if placebo was not installed
+    monkeypatch.setitem(sys.modules, 'placebo', None)
+    ebs = snapshot.EBSSnapshot(region='no-region-1')
+
+    with pytest.raises(ImportError):
+        ebs.record(str(tmpdir))
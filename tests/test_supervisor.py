@@ -0,0 +1,168 @@
+from datetime import datetime
+from dateutil.tz import tzutc
+from ebssnapshot import journal, snapshot, supervisor
+from fakes import FakeEBS, FakeSession
+
+import multiprocessing
+import os
+import pytest
+
+
+#
+# Fake classes
+#
+class FakePaginator():
+    def __init__(self, items):
+        self.items = items
+
+    def paginate(self, **kwargs):
+        return [{'Volumes': self.items}]
+
+
+class FakeClient():
+    def __init__(self, volumes):
+        self.volumes = volumes
+
+    def get_paginator(self, name):
+        return FakePaginator(self.volumes)
+
+    def create_snapshot(self, Description, VolumeId, TagSpecifications=None):
+        return {'SnapshotId': 'snap-' + VolumeId, 'StartTime': datetime.now(tzutc())}
+
+
+#
+# Fixtures
+#
+def fixture_vol(volumeid):
+    return {'VolumeId': volumeid, 'AvailabilityZone': 'no-region-1a'}
+
+
+def fixture_fast(monkeypatch):
+    """
+    Check workers every 50ms
+    """
+    Supervisor = supervisor.Supervisor
+    monkeypatch.setattr(supervisor, 'Supervisor', lambda *args, **kwargs: Supervisor(*args, interval=0.05, **kwargs))
+    monkeypatch.setattr(snapshot, 'LIVENESS_INTERVAL', 0.1)
+
+
+def fixture_first(marker):
+    """
+    Whether the caller is the first of any worker to claim the marker file
+    """
+    try:
+        os.close(os.open(marker, os.O_CREAT | os.O_EXCL))
+    except OSError:
+        return False
+    return True
+
+
+@pytest.fixture
+def run(tmpdir):
+    return journal.Journal('run-1', directory=str(tmpdir))
+
+
+#
+# Tests
+#
+def test_create_snapshot_boss_dead_letter(monkeypatch, run):
+    fixture_fast(monkeypatch)
+    deaths = []
+    create_snapshot = snapshot.EBSSnapshot.create_snapshot
+
+    def dying(ebs, volume):
+        # vol-poison kills its worker every time, vol-flaky only the first time
+        if volume['VolumeId'] == 'vol-poison' or (volume['VolumeId'] == 'vol-flaky' and 'vol-flaky' not in deaths):
+            deaths.append(volume['VolumeId'])
+            raise RuntimeError('Worker bug')
+        return create_snapshot(ebs, volume)
+
+    monkeypatch.setattr(snapshot.EBSSnapshot, 'create_snapshot', dying)
+    volumes = [fixture_vol(volumeid) for volumeid in ('vol-1', 'vol-poison', 'vol-2', 'vol-flaky', 'vol-3')]
+    ebs = snapshot.EBSSnapshot(region='no-region-1', executor='thread', workers=2, batch=2, identifier=run.uuid,
+                               journal=run)
+    ebs.session(FakeSession())
+    ebs.connection(FakeClient(volumes))
+    summary = ebs.create_snapshot_boss()
+
+    assert deaths.count('vol-poison') == supervisor.MAX_ATTEMPTS
+    assert summary['success'] == 4 and summary['error'] == 1
+    assert summary['respawned'] == supervisor.MAX_ATTEMPTS + 1 and summary['dead_lettered'] == 1
+    # Retried when the run is resumed
+    assert run.ids('123456789012', 'no-region-1', journal.FAILED) == set(['vol-poison'])
+    assert ebs._supervision is None
+
+
+def test_boss_respawn_killed(monkeypatch, tmpdir):
+    fixture_fast(monkeypatch)
+    marker = os.path.join(str(tmpdir), 'killed')
+    counter = multiprocessing.Value('i', 0)
+
+    def worker(workerid, jobqueue, ebs):
+        for job in snapshot.jobs(jobqueue, ebs, workerid):
+            for item in job:
+                if item == 3 and not os.path.exists(marker):
+                    open(marker, 'w').close()
+                    os._exit(1)
+                with counter.get_lock():
+                    counter.value += item
+
+    ebs = FakeEBS(workers=2)
+    summary = snapshot.boss(ebs, worker, [[1, 2, 3, 4], [5, 6], [7]])
+
+    # Items finished before the kill are not processed again
+    assert counter.value == 28
+    assert summary == {'dispatched': 3, 'respawned': 1, 'requeued': 1}
+    assert not ebs.dead_letters
+    assert not multiprocessing.active_children()
+
+
+def test_boss_requeue_taken(monkeypatch, tmpdir):
+    fixture_fast(monkeypatch)
+    marker = os.path.join(str(tmpdir), 'killed')
+    counter = multiprocessing.Value('i', 0)
+
+    def worker(workerid, jobqueue, ebs):
+        if fixture_first(marker):
+            # Killed after taking a job, before recording that it holds it
+            ebs._supervision.wait(workerid)
+            jobqueue.get()
+            os._exit(1)
+        for job in snapshot.jobs(jobqueue, ebs, workerid):
+            for item in job:
+                with counter.get_lock():
+                    counter.value += item
+
+    summary = snapshot.boss(FakeEBS(workers=2), worker, [[1, 2], [3], [4]])
+
+    assert counter.value == 10
+    assert summary == {'dispatched': 3, 'respawned': 1, 'requeued': 1}
+
+
+def test_boss_killed_after_release(monkeypatch, tmpdir):
+    fixture_fast(monkeypatch)
+    marker = os.path.join(str(tmpdir), 'killed')
+    counter = multiprocessing.Value('i', 0)
+    release = supervisor.Channel.release
+
+    def dying(channel, workerid, jobid):
+        if not fixture_first(marker):
+            return release(channel, workerid, jobid)
+        # Killed before its acknowledgement is flushed to the boss
+        channel.acks = multiprocessing.Queue()
+        release(channel, workerid, jobid)
+        os._exit(1)
+
+    monkeypatch.setattr(supervisor.Channel, 'release', dying)
+
+    def worker(workerid, jobqueue, ebs):
+        for job in snapshot.jobs(jobqueue, ebs, workerid):
+            for item in job:
+                with counter.get_lock():
+                    counter.value += item
+
+    summary = snapshot.boss(FakeEBS(workers=2), worker, [[1, 2], [3], [4]])
+
+    # The job finished is not dispatched again
+    assert counter.value == 10
+    assert summary == {'dispatched': 3, 'respawned': 1}